@@ -1,3 +1,6 @@
+import math
+import os
+import sys
 from collections import Counter
 from typing import Any
 
@@ -5,6 +8,12 @@ import numpy as np
 from rlgym_compat.common_values import BLUE_TEAM, ORANGE_TEAM
 from rlgym_compat.game_state import GameState, PlayerData
 
+try:
+    from zenitobot_timers import step_timers, update_timers
+except ImportError:  # RLBot only puts the bot folder on sys.path, the timers are shared with training from the root
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    from zenitobot_timers import step_timers, update_timers
+
 BOOST_LOCATIONS = (
     (0.0, -4240.0, 70.0),
     (-1792.0, -4184.0, 70.0),
@@ -82,7 +91,48 @@ def rotation_to_quaternion(m: np.ndarray) -> np.ndarray:
     return -q
 
 
-def encode_gamestate(state: GameState):
+# Quaternion component sources for each rotation_to_quaternion branch (trace > 0, then largest diagonal x, y, z)
+# as indices into (0.5 * s, (m21 - m12), (m02 - m20), (m10 - m01), (m10 + m01), (m20 + m02), (m12 + m21)) / (2 * s)
+_QUAT_BRANCH_COMPONENTS = np.array([[0, 1, 2, 3],
+                                    [1, 0, 4, 5],
+                                    [2, 4, 0, 6],
+                                    [3, 5, 6, 0]])
+
+
+def rotations_to_quaternions(m: np.ndarray) -> np.ndarray:
+    """Same as rotation_to_quaternion for a whole array of rotation matrices (..., 3, 3) at once"""
+    m = np.asarray(m)
+    shape = m.shape[:-2]
+    m = m.reshape(-1, 3, 3)
+    m00, m11, m22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+
+    branch = np.where(m00 + m11 + m22 > 0, 0,
+                      np.where((m00 >= m11) & (m00 >= m22), 1,
+                               np.where(m11 > m22, 2, 3)))
+    squares = np.stack([m00 + m11 + m22 + 1,
+                        1 + m00 - m11 - m22,
+                        1 + m11 - m00 - m22,
+                        1 + m22 - m00 - m11], axis=-1)
+    s = np.sqrt(np.take_along_axis(squares, branch[:, None], axis=-1)[:, 0])
+    inv_s = 0.5 / s
+
+    components = np.stack([s * 0.5,
+                           (m[:, 2, 1] - m[:, 1, 2]) * inv_s,
+                           (m[:, 0, 2] - m[:, 2, 0]) * inv_s,
+                           (m[:, 1, 0] - m[:, 0, 1]) * inv_s,
+                           (m[:, 1, 0] + m[:, 0, 1]) * inv_s,
+                           (m[:, 2, 0] + m[:, 0, 2]) * inv_s,
+                           (m[:, 1, 2] + m[:, 2, 1]) * inv_s], axis=-1)
+    q = np.take_along_axis(components, _QUAT_BRANCH_COMPONENTS[branch], axis=-1)
+
+    return -q.reshape(shape + (4,))
+
+
+def encode_gamestate(state: GameState, quaternions=True):
+    """
+    Flattens the state the way rocket_learn does. The quaternions of all cars are converted in a single batch,
+    quaternions=False leaves them at zero for builders that read the car orientations from the state instead.
+    """
     state_vals = [0, state.blue_score, state.orange_score]
     state_vals += state.boost_pads.tolist()
 
@@ -91,11 +141,17 @@ def encode_gamestate(state: GameState):
         state_vals += bd.linear_velocity.tolist()
         state_vals += bd.angular_velocity.tolist()
 
-    for p in state.players:
+    if quaternions and state.players:
+        quats = rotations_to_quaternions([cd.rotation_mtx() for p in state.players
+                                          for cd in (p.car_data, p.inverted_car_data)]).tolist()
+    else:
+        quats = [[0, 0, 0, 0]] * (2 * len(state.players))
+
+    for i, p in enumerate(state.players):
         state_vals += [p.car_id, p.team_num]
-        for cd in (p.car_data, p.inverted_car_data):
+        for j, cd in enumerate((p.car_data, p.inverted_car_data)):
             state_vals += cd.position.tolist()
-            state_vals += rotation_to_quaternion(cd.rotation_mtx()).tolist()
+            state_vals += quats[2 * i + j]
             state_vals += cd.linear_velocity.tolist()
             state_vals += cd.angular_velocity.tolist()
         state_vals += [
@@ -118,6 +174,7 @@ class BatchedObsBuilder:
         super().__init__()
         self.current_state = None
         self.current_obs = None
+        self.use_quaternions = True
 
     def batched_build_obs(self, encoded_states: np.ndarray) -> Any:
         raise NotImplementedError
@@ -138,7 +195,7 @@ class BatchedObsBuilder:
     def build_obs(self, player: PlayerData, state: GameState, previous_action: np.ndarray) -> Any:
         # if state != self.current_state:
         self.current_obs = self.batched_build_obs(
-            np.expand_dims(encode_gamestate(state), axis=0)
+            np.expand_dims(encode_gamestate(state, self.use_quaternions), axis=0)
         )
         self.current_state = state
 
@@ -167,8 +224,18 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
     _invert = np.array([1] * 5 + [-1, -1, 1] * 5 + [1] * 4)
     _norm = np.array([1.] * 5 + [2300] * 6 + [1] * 6 + [5.5] * 3 + [1] * 4)
 
-    def __init__(self, field_info=None, n_players=None, tick_skip=8):
+    def __init__(self, field_info=None, n_players=None, tick_skip=8, use_quaternions=True, use_timers=False):
         super().__init__()
+        # True feeds boost pad and demo timers (see zenitobot_timers.py) like training/obs.py, instead of the raw pad
+        # states and demolished flags the released model was trained on. The timers are in seconds, scaled by 1/10
+        # like training. Set by timers in bot.cfg
+        self.use_timers = use_timers
+        if use_timers:
+            self._norm = self._norm.copy()
+            self._norm[DEMO] = 10
+        # False skips the rotation -> quaternion -> rotation round trip, FW/UP come straight from the rotation matrices
+        self.use_quaternions = use_quaternions
+        self._rotations = None
         self.n_players = n_players
         self.demo_timers = None
         self.boost_timers = None
@@ -180,6 +247,15 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
             self._boost_locations = np.array([[bp.location.x, bp.location.y, bp.location.z]
                                               for bp in field_info.boost_pads[:field_info.num_boosts]])
             self._boost_types = np.array([bp.is_full_boost for bp in field_info.boost_pads[:field_info.num_boosts]])
+        self._live_obs = None
+        self._live_n_players = None
+        self._on_ground_ticks = np.zeros(64)
+        # Timers of the live builds, advanced by the game time between builds and indexed by pad / car index
+        self._live_time = None
+        self._live_boost_states = np.zeros(len(self._boost_locations))
+        self._live_boost_timers = np.zeros(len(self._boost_locations))
+        self._live_demo_states = np.zeros(64)
+        self._live_demo_timers = np.zeros(64)
 
     def _reset(self, initial_state: GameState):
         self.demo_timers = np.zeros(len(initial_state.players))
@@ -223,6 +299,13 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
 
         return theta
 
+    def build_obs(self, player: PlayerData, state: GameState, previous_action: np.ndarray) -> Any:
+        if not self.use_quaternions:
+            self._rotations = np.stack([p.car_data.rotation_mtx() for p in state.players])[None]
+        obs = super().build_obs(player, state, previous_action)
+        self._rotations = None
+        return obs
+
     @staticmethod
     def convert_to_relative(q, kv):
         # kv[..., POS.start:LIN_VEL.stop] -= q[..., POS.start:LIN_VEL.stop]
@@ -267,12 +350,27 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         kv[:, :, sel_boosts, IS_BOOST] = 1
         kv[:, :, sel_boosts, POS] = self._boost_locations
         kv[:, :, sel_boosts, BOOST] = 0.12 + 0.88 * (self._boost_locations[:, 2] > 72)
-        kv[:, :, sel_boosts, DEMO] = encoded_states[:, 3:3 + 34]  # FIXME boost timer
+        boost_states = encoded_states[:, 3:3 + 34]
+        demo_states = encoded_states[:, players_start_index + 33::player_length]
+        if self.use_timers:
+            boost_timers, demo_timers = self._batched_timers(boost_states, demo_states)
+        else:
+            boost_timers, demo_timers = boost_states, demo_states
+        kv[:, :, sel_boosts, DEMO] = boost_timers
 
         # PLAYERS
         teams = encoded_states[0, players_start_index + 1::player_length]
         kv[:, :, :n_players, IS_MATE] = 1 - teams  # Default team is blue
         kv[:, :, :n_players, IS_OPP] = teams
+
+        # Orientations of all cars in one batch, (n_states, n_players, 3, 3)
+        if self._rotations is not None:
+            rot_mtx = self._rotations
+        else:
+            encoded_players = encoded_states[:, players_start_index:players_start_index + n_players * player_length]
+            quats = encoded_players.reshape(encoded_states.shape[0], n_players, player_length)[..., 5: 9]
+            rot_mtx = self._quats_to_rot_mtx(quats.reshape(-1, 4)).reshape(quats.shape[:2] + (3, 3))
+
         for i in range(n_players):
             encoded_player = encoded_states[:,
                              players_start_index + i * player_length: players_start_index + (i + 1) * player_length]
@@ -280,13 +378,11 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
             kv[i, :, i, IS_SELF] = 1
             kv[:, :, i, POS] = encoded_player[:, 2: 5]  # TODO constants for these indices
             kv[:, :, i, LIN_VEL] = encoded_player[:, 9: 12]
-            quats = encoded_player[:, 5: 9]
-            rot_mtx = self._quats_to_rot_mtx(quats)
-            kv[:, :, i, FW] = rot_mtx[:, :, 0]
-            kv[:, :, i, UP] = rot_mtx[:, :, 2]
+            kv[:, :, i, FW] = rot_mtx[:, i, :, 0]
+            kv[:, :, i, UP] = rot_mtx[:, i, :, 2]
             kv[:, :, i, ANG_VEL] = encoded_player[:, 12: 15]
             kv[:, :, i, BOOST] = encoded_player[:, 37]
-            kv[:, :, i, DEMO] = encoded_player[:, 33]  # FIXME demo timer
+            kv[:, :, i, DEMO] = demo_timers[:, i]
             kv[:, :, i, ON_GROUND] = encoded_player[:, 34]
             kv[:, :, i, HAS_FLIP] = encoded_player[:, 36]
 
@@ -307,6 +403,30 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
 
         return [(q[i], kv[i], m[i]) for i in range(n_players)]
 
+    def _batched_timers(self, boost_states: np.ndarray, demo_states: np.ndarray):
+        """Same timers as training/obs.py, continuing from the previous call"""
+        if self.boost_timers is None or len(self.demo_timers) != demo_states.shape[1]:
+            self.boost_timers = np.zeros(boost_states.shape[1])
+            self.demo_timers = np.zeros(demo_states.shape[1])
+        boost_timers = np.zeros((boost_states.shape[0] + 1, boost_states.shape[1]))
+        boost_timers[0] = self.boost_timers
+        demo_timers = np.zeros((demo_states.shape[0] + 1, demo_states.shape[1]))
+        demo_timers[0] = self.demo_timers
+        update_timers(boost_timers, self._boost_types, demo_timers, self.tick_skip / 120, boost_states, demo_states)
+        self.boost_timers = boost_timers[-1]
+        self.demo_timers = demo_timers[-1]
+        return boost_timers[1:], demo_timers[1:]
+
+    def _step_live_timers(self, game_time=None):
+        """Advances the live timers by the game time since the previous build, one tick_skip step if unknown"""
+        if game_time is None or self._live_time is None:
+            elapsed = self.tick_skip / 120
+        else:
+            elapsed = max(game_time - self._live_time, 0.)  # Time goes back on a new match
+        self._live_time = game_time
+        step_timers(self._live_boost_timers, self._live_boost_states, self._boost_types,
+                    self._live_demo_timers, self._live_demo_states, elapsed)
+
     def add_actions(self, obs: Any, previous_actions: np.ndarray, player_index=None):
         if player_index is None:
             for (q, kv, m), act in zip(obs, previous_actions):
@@ -314,3 +434,358 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         else:
             q, kv, m = obs[player_index]
             q[:, 0, ACTIONS] = previous_actions
+
+    def _allocate_live_buffers(self, n_players: int):
+        lim_players = n_players if self.n_players is None else self.n_players
+        sel_ball = lim_players
+        sel_boosts = slice(sel_ball + 1, None)
+        n_entities = lim_players + 1 + len(self._boost_locations)
+
+        q = np.zeros((1, 1, 32), dtype=np.float32)
+        kv = np.zeros((1, n_entities, 24), dtype=np.float32)
+        m = np.zeros((1, n_entities), dtype=np.float32)
+        m[0, n_players:lim_players] = 1
+        self._live_obs = (q, kv, m)
+        self._live_n_players = n_players
+
+        # Everything that does not depend on the state, copied into kv before each build
+        self._live_template = np.zeros((n_entities, 24), dtype=np.float32)
+        self._live_template[sel_ball, IS_BALL] = 1
+        self._live_template[sel_boosts, IS_BOOST] = 1
+        self._live_template[sel_boosts, POS] = self._boost_locations
+        self._live_template[sel_boosts, BOOST] = 0.12 + 0.88 * (self._boost_locations[:, 2] > 72)
+
+        # Blue, orange
+        self._live_scales = ((1 / self._norm).astype(np.float32), (self._invert / self._norm).astype(np.float32))
+        self._live_scratch = tuple(np.zeros((n_entities, 5), dtype=np.float32) for _ in range(3))
+
+    def build_live_obs(self, player: PlayerData, state: GameState, previous_action: np.ndarray, game_time=None):
+        """
+        Inference-only equivalent of build_obs, for the controlled player only.
+
+        Writes the state straight into persistent float32 buffers instead of encoding it, so nothing is allocated
+        per tick once the buffers are sized to the match. The returned arrays are overwritten by the next call.
+        game_time (packet.game_info.seconds_elapsed) steps the timers by the time that actually passed, skipped or
+        repeated ticks included.
+        """
+        self_index = next((i for i, p in enumerate(state.players) if p == player), None)
+        if self_index is None:
+            raise ValueError(f"Player with car_id {player.car_id} is not in the state")
+
+        if self._live_obs is None or self._live_n_players != len(state.players):
+            self._allocate_live_buffers(len(state.players))
+        rows = self._live_obs[1][0]
+        np.copyto(rows, self._live_template)
+
+        if self.use_timers:
+            self._live_boost_states[:] = state.boost_pads
+            for p in state.players:
+                self._live_demo_states[p.car_id] = p.is_demoed
+            self._step_live_timers(game_time)
+
+        # PLAYERS, with teammates/opponents already relative to the controlled player's team
+        for i, p in enumerate(state.players):
+            row = rows[i]
+            car_data = p.car_data
+            row[IS_SELF] = i == self_index
+            row[IS_MATE] = p.team_num == player.team_num
+            row[IS_OPP] = p.team_num != player.team_num
+            row[POS] = car_data.position
+            row[LIN_VEL] = car_data.linear_velocity
+            row[FW] = car_data.forward()
+            row[UP] = car_data.up()
+            row[ANG_VEL] = car_data.angular_velocity
+            row[BOOST] = p.boost_amount
+            row[DEMO] = self._live_demo_timers[p.car_id] if self.use_timers else p.is_demoed
+            row[ON_GROUND] = p.on_ground
+            row[HAS_FLIP] = p.has_flip
+
+        # BALL
+        sel_ball = len(rows) - len(self._boost_locations) - 1
+        ball = rows[sel_ball]
+        ball[POS] = state.ball.position
+        ball[LIN_VEL] = state.ball.linear_velocity
+        ball[ANG_VEL] = state.ball.angular_velocity
+
+        # BOOSTS
+        rows[sel_ball + 1:, DEMO] = self._live_boost_timers if self.use_timers else state.boost_pads
+
+        return self._finish_live_obs(self_index, player.team_num, previous_action)
+
+    def update_on_ground(self, packet, ticks_elapsed=1):
+        """Same on-ground tracking as rlgym_compat's GameState.decode, must be called on every tick"""
+        for i in range(packet.num_cars):
+            if packet.game_cars[i].has_wheel_contact:
+                self._on_ground_ticks[i] = 0
+            else:
+                self._on_ground_ticks[i] += ticks_elapsed
+
+    def build_packet_obs(self, packet, index: int, previous_action: np.ndarray):
+        """
+        Same observation as build_live_obs, decoded straight from the GameTickPacket.
+
+        Skips rlgym_compat's GameState (and its inverted car data) entirely. Cars are written in the order
+        get_output uses: the controlled car, then its teammates, then the opponents. update_on_ground must be called
+        on every tick for the on-ground flags to match rlgym_compat.
+        """
+        n_players = packet.num_cars
+        if self._live_obs is None or self._live_n_players != n_players:
+            self._allocate_live_buffers(n_players)
+        rows = self._live_obs[1][0]
+        np.copyto(rows, self._live_template)
+
+        if self.use_timers:
+            for b in range(packet.num_boost):
+                self._live_boost_states[b] = packet.game_boosts[b].is_active
+            for i in range(n_players):
+                self._live_demo_states[i] = packet.game_cars[i].is_demolished
+            self._step_live_timers(packet.game_info.seconds_elapsed)
+
+        # PLAYERS
+        team = packet.game_cars[index].team
+        self._write_packet_car(rows[0], packet.game_cars[index], index, True, True)
+        i = 1
+        for same_team in (True, False):
+            for j in range(n_players):
+                car = packet.game_cars[j]
+                if j != index and (car.team == team) == same_team:
+                    self._write_packet_car(rows[i], car, j, False, same_team)
+                    i += 1
+
+        # BALL
+        sel_ball = len(rows) - len(self._boost_locations) - 1
+        ball = rows[sel_ball]
+        physics = packet.game_ball.physics
+        ball[POS.start], ball[POS.start + 1], ball[POS.start + 2] = \
+            physics.location.x, physics.location.y, physics.location.z
+        ball[LIN_VEL.start], ball[LIN_VEL.start + 1], ball[LIN_VEL.start + 2] = \
+            physics.velocity.x, physics.velocity.y, physics.velocity.z
+        ball[ANG_VEL.start], ball[ANG_VEL.start + 1], ball[ANG_VEL.start + 2] = \
+            physics.angular_velocity.x, physics.angular_velocity.y, physics.angular_velocity.z
+
+        # BOOSTS
+        if self.use_timers:
+            rows[sel_ball + 1:, DEMO] = self._live_boost_timers
+        else:
+            for b in range(packet.num_boost):
+                rows[sel_ball + 1 + b, DEMO] = packet.game_boosts[b].is_active
+
+        return self._finish_live_obs(0, team, previous_action)
+
+    def _write_packet_car(self, row: np.ndarray, car, index: int, is_self: bool, is_mate: bool):
+        physics = car.physics
+        location = physics.location
+        velocity = physics.velocity
+        angular_velocity = physics.angular_velocity
+        rotation = physics.rotation
+
+        # rlgym_compat's PhysicsObject._euler_to_rotation, forward and up columns
+        cp = math.cos(rotation.pitch)
+        sp = math.sin(rotation.pitch)
+        cy = math.cos(rotation.yaw)
+        sy = math.sin(rotation.yaw)
+        cr = math.cos(rotation.roll)
+        sr = math.sin(rotation.roll)
+
+        row[IS_SELF] = is_self
+        row[IS_MATE] = is_mate
+        row[IS_OPP] = not is_mate
+        row[POS.start], row[POS.start + 1], row[POS.start + 2] = location.x, location.y, location.z
+        row[LIN_VEL.start], row[LIN_VEL.start + 1], row[LIN_VEL.start + 2] = velocity.x, velocity.y, velocity.z
+        row[FW.start], row[FW.start + 1], row[FW.start + 2] = cp * cy, cp * sy, sp
+        row[UP.start] = -cr * cy * sp - sr * sy
+        row[UP.start + 1] = -cr * sy * sp + sr * cy
+        row[UP.start + 2] = cp * cr
+        row[ANG_VEL.start] = angular_velocity.x
+        row[ANG_VEL.start + 1] = angular_velocity.y
+        row[ANG_VEL.start + 2] = angular_velocity.z
+        row[BOOST] = car.boost / 100
+        row[DEMO] = self._live_demo_timers[index] if self.use_timers else car.is_demolished
+        row[ON_GROUND] = car.has_wheel_contact or self._on_ground_ticks[index] <= 6
+        row[HAS_FLIP] = not car.double_jumped
+
+    def _finish_live_obs(self, self_index: int, team: int, previous_action: np.ndarray):
+        q, kv, m = self._live_obs
+        q_row = q[0, 0]
+        rows = kv[0]
+
+        rows *= self._live_scales[team == 1]
+
+        q_row[:ACTIONS.start] = rows[self_index]
+        q_row[ACTIONS.start:] = previous_action
+
+        # Same as convert_to_relative, in place
+        rows[:, POS] -= q_row[POS]
+        theta = math.atan2(q_row[FW.start], q_row[FW.start + 1])
+        ct = math.cos(theta)
+        st = math.sin(theta)
+        xs = rows[:, POS.start:ANG_VEL.stop:3]
+        ys = rows[:, POS.start + 1:ANG_VEL.stop:3]
+        nx, ny, tmp = self._live_scratch
+        np.multiply(xs, ct, out=nx)
+        np.multiply(ys, st, out=tmp)
+        np.subtract(nx, tmp, out=nx)
+        np.multiply(xs, st, out=ny)
+        np.multiply(ys, ct, out=tmp)
+        np.add(ny, tmp, out=ys)
+        xs[...] = nx
+
+        return self._live_obs
+
+
+if __name__ == '__main__':
+    from types import SimpleNamespace
+
+    rng = np.random.default_rng(0)
+
+    def vector(v):
+        return SimpleNamespace(x=v[0], y=v[1], z=v[2])
+
+    def random_state(n_players):
+        # Filled through the rlgym_compat decode methods, with plain objects standing in for the packet structs
+        state = GameState(SimpleNamespace(num_boosts=len(BOOST_LOCATIONS)))
+        state.boost_pads[:] = rng.random(len(BOOST_LOCATIONS)) < 0.5
+        state.ball.decode_ball_data(SimpleNamespace(location=vector(rng.uniform(-4000, 4000, 3)),
+                                                    velocity=vector(rng.normal(0, 1500, 3)),
+                                                    angular_velocity=vector(rng.normal(0, 3, 3))))
+        state.inverted_ball.invert(state.ball)
+        for i in range(n_players):
+            player = PlayerData()
+            pitch, yaw, roll = rng.uniform([-np.pi / 2, -np.pi, -np.pi], [np.pi / 2, np.pi, np.pi])
+            player.car_data.decode_car_data(SimpleNamespace(
+                location=vector(rng.uniform(-4000, 4000, 3)), rotation=SimpleNamespace(pitch=pitch, yaw=yaw, roll=roll),
+                velocity=vector(rng.normal(0, 1200, 3)), angular_velocity=vector(rng.normal(0, 3, 3))))
+            player.inverted_car_data.invert(player.car_data)
+            player.car_id = i
+            player.team_num = i % 2
+            player.is_demoed = rng.random() < 0.1
+            player.on_ground = rng.random() < 0.5
+            player.has_flip = rng.random() < 0.5
+            player.boost_amount = rng.random()
+            state.players.append(player)
+        return state
+
+    # Batched quaternions, every branch of rotation_to_quaternion included
+    states = [random_state(6) for _ in range(200)]
+    rotations = np.array([cd.rotation_mtx() for s in states for p in s.players
+                          for cd in (p.car_data, p.inverted_car_data)]
+                         + [np.diag(d) for d in ((1, 1, 1), (1, -1, -1), (-1, 1, -1), (-1, -1, 1))])
+    expected = np.array([rotation_to_quaternion(r) for r in rotations])
+    np.testing.assert_allclose(rotations_to_quaternions(rotations), expected, rtol=0, atol=1e-15)
+    print(f"rotations_to_quaternions matches rotation_to_quaternion on {len(rotations)} matrices")
+
+    # Quaternion-free mode against today's quaternion round trip
+    with_quats = ZenitobotObsBuilder()
+    without_quats = ZenitobotObsBuilder(use_quaternions=False)
+    max_error = 0
+    for state in states:
+        for player in state.players:
+            action = rng.uniform(-1, 1, 8)
+            for arr0, arr1 in zip(with_quats.build_obs(player, state, action),
+                                  without_quats.build_obs(player, state, action)):
+                np.testing.assert_allclose(arr0, arr1, rtol=0, atol=1e-12)
+                max_error = max(max_error, np.abs(arr0 - arr1).max())
+    print(f"use_quaternions=False matches the quaternion round trip (max abs error {max_error:.2e})")
+
+    # Live timers against the batched ones over a match-like sequence (pads stay taken, demos last a few steps)
+    batched = ZenitobotObsBuilder(use_timers=True)
+    live = ZenitobotObsBuilder(use_timers=True)
+    taken = rng.random(len(BOOST_LOCATIONS)) < 0.5
+    demoed = np.zeros(6, dtype=bool)
+    max_error = 0
+    for step, state in enumerate(states):
+        taken = np.where(rng.random(len(taken)) < 0.1, ~taken, taken)
+        demoed = np.where(rng.random(len(demoed)) < 0.05, ~demoed, demoed)
+        state.boost_pads[:] = ~taken
+        for player, is_demoed in zip(state.players, demoed):
+            player.is_demoed = is_demoed
+        player = state.players[0]
+        action = rng.uniform(-1, 1, 8)
+        game_time = 100 + step * live.tick_skip / 120
+        for arr0, arr1 in zip(batched.build_obs(player, state, action),
+                              live.build_live_obs(player, state, action, game_time)):
+            np.testing.assert_allclose(arr0[None] if arr0.ndim < arr1.ndim else arr0, arr1, rtol=1e-5, atol=1e-5)
+            max_error = max(max_error, np.abs(arr0 - arr1).max())
+    assert (batched.boost_timers > 0).any()
+    print(f"Live boost/demo timers match the batched ones (max abs error {max_error:.2e})")
+
+    # Timers are scaled like training/obs.py (DEMO / 10) and follow the game time, skipped ticks included
+    live = ZenitobotObsBuilder(use_timers=True)
+    state = states[0]
+    state.boost_pads[:] = 1
+    state.boost_pads[4] = 0  # Big pad
+    for player in state.players:
+        player.is_demoed = False
+    state.players[1].is_demoed = True
+    player = state.players[0]
+    for game_time, boost_timer, demo_timer in ((10., 10, 3), (10.5, 9.5, 2.5), (11.5, 8.5, 1.5)):
+        q, kv, m = live.build_live_obs(player, state, action, game_time)
+        sel_boosts = kv.shape[1] - len(BOOST_LOCATIONS)
+        np.testing.assert_allclose(kv[0, sel_boosts + 4, DEMO], boost_timer / 10, rtol=1e-6)
+        np.testing.assert_allclose(kv[0, 1, DEMO], demo_timer / 10, rtol=1e-6)
+    print("Live timers are stepped by the game time and scaled like training")
+
+    # A player missing from the state is reported, not an UnboundLocalError
+    try:
+        live.build_live_obs(PlayerData(), states[0], action)
+    except ValueError as e:
+        print(f"Missing player: {e}")
+    else:
+        raise AssertionError("build_live_obs accepted a player that is not in the state")
+
+    # Packet decoding against the GameState path of bot.py (decode, reorder, build_live_obs), over a match-like
+    # packet sequence with varying ticks_elapsed so the on-ground timer is exercised, with and without timers
+    def random_packets(n_packets, n_cars):
+        game_time = 100.
+        wheel_contact = rng.random(n_cars) < 0.5
+        demolished = np.zeros(n_cars, dtype=bool)
+        active = rng.random(len(BOOST_LOCATIONS)) < 0.7
+        for _ in range(n_packets):
+            ticks_elapsed = int(rng.integers(1, 17))
+            game_time += ticks_elapsed / 120
+            wheel_contact = np.where(rng.random(n_cars) < 0.2, ~wheel_contact, wheel_contact)
+            demolished = np.where(rng.random(n_cars) < 0.03, ~demolished, demolished)
+            active = np.where(rng.random(len(active)) < 0.05, ~active, active)
+            cars = [SimpleNamespace(
+                team=i % 2, boost=rng.uniform(0, 100), is_demolished=demolished[i],
+                has_wheel_contact=wheel_contact[i], double_jumped=rng.random() < 0.3,
+                physics=SimpleNamespace(location=vector(rng.uniform([-4000, -5000, 17], [4000, 5000, 2000])),
+                                        rotation=SimpleNamespace(pitch=rng.uniform(-1.5, 1.5), yaw=rng.uniform(-3, 3),
+                                                                 roll=rng.uniform(-3, 3)),
+                                        velocity=vector(rng.normal(0, 1000, 3)),
+                                        angular_velocity=vector(rng.normal(0, 2, 3)))) for i in range(n_cars)]
+            ball = SimpleNamespace(physics=SimpleNamespace(
+                location=vector(rng.uniform([-4000, -5000, 93], [4000, 5000, 1800])),
+                velocity=vector(rng.normal(0, 1500, 3)), angular_velocity=vector(rng.normal(0, 3, 3))))
+            boosts = [SimpleNamespace(is_active=a) for a in active]
+            yield ticks_elapsed, SimpleNamespace(
+                num_cars=n_cars, game_cars=cars, game_ball=ball, num_boost=len(boosts), game_boosts=boosts,
+                teams=[SimpleNamespace(score=0), SimpleNamespace(score=0)],
+                game_info=SimpleNamespace(seconds_elapsed=game_time))
+
+    n_checked = 0
+    max_error = 0
+    for use_timers in (False, True):
+        for n_cars in (2, 4, 6):
+            index = int(rng.integers(n_cars))
+            game_state = GameState(SimpleNamespace(num_boosts=len(BOOST_LOCATIONS)))
+            live = ZenitobotObsBuilder(use_timers=use_timers)
+            from_packet = ZenitobotObsBuilder(use_timers=use_timers)
+            for ticks_elapsed, packet in random_packets(300, n_cars):
+                game_state.decode(packet, ticks_elapsed)
+                from_packet.update_on_ground(packet, ticks_elapsed)
+
+                player = game_state.players[index]
+                teammates = [p for p in game_state.players if p.team_num == player.team_num and p != player]
+                opponents = [p for p in game_state.players if p.team_num != player.team_num]
+                game_state.players = [player] + teammates + opponents
+
+                action = rng.uniform(-1, 1, 8)
+                expected = tuple(o.copy() for o in live.build_live_obs(player, game_state, action,
+                                                                       packet.game_info.seconds_elapsed))
+                for arr0, arr1 in zip(expected, from_packet.build_packet_obs(packet, index, action)):
+                    np.testing.assert_allclose(arr1, arr0, rtol=1e-5, atol=1e-5)
+                    max_error = max(max_error, np.abs(arr0 - arr1).max())
+                n_checked += 1
+    print(f"build_packet_obs matches GameState.decode + build_live_obs on {n_checked} packets "
+          f"(max abs error {max_error:.2e})")
@@ -0,0 +1,78 @@
+import math
+
+import numpy as np
+
+
+def make_lookup_table():
+    actions = []
+    # Ground
+    for throttle in (-1, 0, 1):
+        for steer in (-1, 0, 1):
+            for boost in (0, 1):
+                for handbrake in (0, 1):
+                    if boost == 1 and throttle != 1:
+                        continue
+                    actions.append([throttle or boost, steer, 0, steer, 0, 0, boost, handbrake])
+    # Aerial
+    for pitch in (-1, 0, 1):
+        for yaw in (-1, 0, 1):
+            for roll in (-1, 0, 1):
+                for jump in (0, 1):
+                    for boost in (0, 1):
+                        if jump == 1 and yaw != 0:  # Only need roll for sideflip
+                            continue
+                        if pitch == roll == jump == 0:  # Duplicate with ground
+                            continue
+                        # Enable handbrake for potential wavedashes
+                        handbrake = jump == 1 and (pitch != 0 or yaw != 0 or roll != 0)
+                        actions.append([boost, yaw, pitch, yaw, roll, jump, boost, handbrake])
+    actions = np.array(actions)
+    return actions
+
+
+class ActionSelector:
+    """
+    The beta action selection of the agents, on numpy logits.
+
+    1 takes the best action, -1 the worst, 0 a uniformly random one, and anything inbetween samples from the
+    logits scaled by log3((beta + 1) / (1 - beta)). Sampling uses the Gumbel-max trick (argmax of the scaled logits
+    plus Gumbel noise, same distribution as a categorical sample) on reused buffers, and the scale is cached per beta.
+    """
+
+    def __init__(self, n_actions, rng=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self._noise = np.empty(n_actions)
+        self._scores = np.empty(n_actions)
+        self._finite = np.empty(n_actions, dtype=bool)
+        self._temperatures = {}
+
+    def temperature(self, beta):
+        temperature = self._temperatures.get(beta)
+        if temperature is None:
+            temperature = self._temperatures[beta] = math.log((beta + 1) / (1 - beta), 3)
+        return temperature
+
+    def __call__(self, logits, beta):
+        if beta == 1:
+            return int(np.argmax(logits))
+        elif beta == -1:
+            return int(np.argmin(logits))
+
+        # Gumbel noise, -log(-log(u))
+        noise = self._noise
+        self.rng.random(out=noise)
+        np.log(noise, out=noise)
+        np.negative(noise, out=noise)
+        np.log(noise, out=noise)
+        np.negative(noise, out=noise)
+
+        scores = self._scores
+        if beta == 0:
+            # Uniform over the actions with finite logits
+            np.isfinite(logits, out=self._finite)
+            scores.fill(-np.inf)
+            np.copyto(scores, noise, where=self._finite)
+        else:
+            np.multiply(logits, self.temperature(beta), out=scores)
+            scores += noise
+        return int(np.argmax(scores))
@@ -1,47 +1,125 @@
-import math
+import inspect
 import os
+import time
+from typing import Tuple
 
 import numpy as np
 import torch
-import torch.nn.functional as F
-from torch.distributions import Categorical
+from torch import nn, Tensor
+
+from actions import make_lookup_table, ActionSelector
+
+CUR_DIR = os.path.dirname(os.path.realpath(__file__))
+PRECISIONS = ("fp32", "bf16", "int8")
+ONNX_PATH = os.path.join(CUR_DIR, "Zenitobot-model.onnx")
+
+
+def model_path(precision="fp32"):
+    name = "Zenitobot-model.pt" if precision == "fp32" else f"Zenitobot-model-{precision}.pt"
+    return os.path.join(CUR_DIR, name)
+
+
+class BFloat16Actor(nn.Module):
+    """
+    Runs the EARLPerceiver of the traced fp32 actor in bfloat16.
+
+    The traced output head casts its action table back to float32, so it is split up here: the action embeddings only
+    depend on the lookup table and are computed once in float32, only the player embedding runs per decision.
+    """
+
+    def __init__(self, actor, actions: Tensor):
+        super().__init__()
+        net = actor.net
+        with torch.no_grad():
+            self.register_buffer("act_emb", net.output.net(actions).to(torch.bfloat16))
+        self.earl = net.earl.to(torch.bfloat16)
+        self.emb_convertor = net.output.emb_convertor.to(torch.bfloat16)
+
+    def forward(self, obs: Tuple[Tensor, Tensor, Tensor]) -> Tuple[Tensor, Tuple[Tensor, Tensor]]:
+        q, kv, m = obs
+        res, weights1, weights2 = self.earl(q.to(torch.bfloat16), kv.to(torch.bfloat16), m.to(torch.bfloat16))
+        player_emb = self.emb_convertor(torch.relu(res))
+        logits = torch.einsum("ad,bpd->bpa", self.act_emb, player_emb)[:, 0, :]
+        return logits.float(), (weights1.float(), weights2.float())
+
+
+def convert_actor(actor, precision: str):
+    """Converts the fp32 TorchScript actor to one of PRECISIONS"""
+    if precision == "fp32":
+        return actor
+    if precision == "int8":
+        try:
+            from torch.ao.quantization import quantize_dynamic_jit, per_channel_dynamic_qconfig
+        except ImportError:  # torch < 1.10
+            from torch.quantization import quantize_dynamic_jit, per_channel_dynamic_qconfig
+        # Dynamic int8 quantization of the perceiver blocks' feed-forward layers only, quantizing the input
+        # preprocessing, attention projections or output head as well drops the action agreement below 90%
+        qconfig = {name: per_channel_dynamic_qconfig for name, _ in actor.named_modules()
+                   if name.startswith("net.earl.blocks.") and name.endswith(("linear1", "linear2"))}
+        return quantize_dynamic_jit(actor, qconfig)
+    if precision == "bf16":
+        actions = torch.from_numpy(Agent.make_lookup_table()).float()
+        return torch.jit.script(BFloat16Actor(actor, actions))
+    raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+
+
+def load_actor(precision="fp32"):
+    """Loads an exported variant if there is one, otherwise converts the fp32 actor on the fly"""
+    path = model_path(precision)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return torch.jit.load(f).eval()
+    with open(model_path(), 'rb') as f:
+        return convert_actor(torch.jit.load(f).eval(), precision)
+
+
+def export_onnx(path=ONNX_PATH):
+    """
+    Exports the fp32 actor for OnnxAgent, with the number of entities (players) left dynamic.
+
+    Needs torch >= 1.13 (opset 17). Newer torch defaults to the dynamo exporter, which is turned off when the
+    installed version knows about it.
+    """
+    actor = load_actor("fp32")
+    n_entities = 1 + 1 + 34
+    example = (torch.zeros((1, 1, 32)), torch.zeros((1, n_entities, 24)), torch.zeros((1, n_entities)))
+    kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    torch.onnx.export(actor, (example,), path, input_names=["q", "kv", "m"],
+                      output_names=["logits", "weights1", "weights2"],
+                      dynamic_axes={"q": {0: "batch"},
+                                    "kv": {0: "batch", 1: "entities"},
+                                    "m": {0: "batch", 1: "entities"}},
+                      opset_version=17, **kwargs)
+    print(f"Saved {path} ({os.path.getsize(path) / 1e6:.2f} MB)")
+
+
+def export_actors(precisions=("bf16", "int8")):
+    for precision in precisions:
+        with open(model_path(), 'rb') as f:
+            actor = convert_actor(torch.jit.load(f).eval(), precision)
+        torch.jit.save(actor, model_path(precision))
+        print(f"Saved {model_path(precision)} ({os.path.getsize(model_path(precision)) / 1e6:.2f} MB)")
 
 
 class Agent:
-    def __init__(self):
-        cur_dir = os.path.dirname(os.path.realpath(__file__))
-        with open(os.path.join(cur_dir, "Zenitobot-model.pt"), 'rb') as f:
-            self.actor = torch.jit.load(f)
+    def __init__(self, precision="fp32"):
+        self.precision = precision
+        self.actor = load_actor(precision)
         torch.set_num_threads(1)
         self._lookup_table = self.make_lookup_table()
+        self._select_action = ActionSelector(len(self._lookup_table))
         self.state = None
+        self.warmup()
 
-    @staticmethod
-    def make_lookup_table():
-        actions = []
-        # Ground
-        for throttle in (-1, 0, 1):
-            for steer in (-1, 0, 1):
-                for boost in (0, 1):
-                    for handbrake in (0, 1):
-                        if boost == 1 and throttle != 1:
-                            continue
-                        actions.append([throttle or boost, steer, 0, steer, 0, 0, boost, handbrake])
-        # Aerial
-        for pitch in (-1, 0, 1):
-            for yaw in (-1, 0, 1):
-                for roll in (-1, 0, 1):
-                    for jump in (0, 1):
-                        for boost in (0, 1):
-                            if jump == 1 and yaw != 0:  # Only need roll for sideflip
-                                continue
-                            if pitch == roll == jump == 0:  # Duplicate with ground
-                                continue
-                            # Enable handbrake for potential wavedashes
-                            handbrake = jump == 1 and (pitch != 0 or yaw != 0 or roll != 0)
-                            actions.append([boost, yaw, pitch, yaw, roll, jump, boost, handbrake])
-        actions = np.array(actions)
-        return actions
+    def warmup(self, n_entities=1 + 1 + 34):
+        # The first two calls of a TorchScript model profile and optimize it (~100 ms), not something to do in game
+        obs = (np.zeros((1, 1, 32), dtype=np.float32), np.zeros((1, n_entities, 24), dtype=np.float32),
+               np.zeros((1, n_entities), dtype=np.float32))
+        with torch.no_grad():
+            for _ in range(2):
+                self.actor(tuple(torch.from_numpy(o) for o in obs))
+
+    make_lookup_table = staticmethod(make_lookup_table)
 
     def act(self, state, beta):
         state = tuple(torch.from_numpy(s).float() for s in state)
@@ -50,32 +128,82 @@ class Agent:
             out, weights = self.actor(state)
         self.state = state
 
-        out = (out,)
-        max_shape = max(o.shape[-1] for o in out)
-        logits = torch.stack(
-            [
-                l
-                if l.shape[-1] == max_shape
-                else F.pad(l, pad=(0, max_shape - l.shape[-1]), value=float("-inf"))
-                for l in out
-            ],
-            dim=1
-        )
-
-        # beta = 0.5
-        if beta == 1:
-            actions = np.argmax(logits, axis=-1)
-        elif beta == -1:
-            actions = np.argmin(logits, axis=-1)
-        else:
-            if beta == 0:
-                logits[torch.isfinite(logits)] = 0
-            else:
-                logits *= math.log((beta + 1) / (1 - beta), 3)
-            dist = Categorical(logits=logits)
-            actions = dist.sample()
-
-        # print(Categorical(logits=logits).sample())
-        parsed = self._lookup_table[actions.numpy().item()]
+        action = self._select_action(out[0].numpy(), beta)
+        parsed = self._lookup_table[action]
 
         return parsed, weights
+
+    def agreement_report(self, observations, reference=None):
+        """
+        Compares the greedy actions of this agent's actor with the fp32 actor on a list of (q, kv, m) observations.
+        Returns the action agreement rate, the max logit error and the mean decision latency of both actors.
+        """
+        if reference is None:
+            reference = load_actor("fp32")
+
+        agree = 0
+        max_error = 0.
+        latencies = {"reference": 0., self.precision: 0.}
+        with torch.no_grad():
+            for obs in observations:
+                obs = tuple(torch.from_numpy(o).float() for o in obs)
+                start = time.perf_counter()
+                ref_logits = reference(obs)[0]
+                latencies["reference"] += time.perf_counter() - start
+                start = time.perf_counter()
+                logits = self.actor(obs)[0]
+                latencies[self.precision] += time.perf_counter() - start
+                agree += int(torch.argmax(logits) == torch.argmax(ref_logits))
+                max_error = max(max_error, (logits - ref_logits).abs().max().item())
+
+        return {
+            "agreement": agree / len(observations),
+            "max_logit_error": max_error,
+            "latency_us": {k: 1e6 * v / len(observations) for k, v in latencies.items()},
+        }
+
+
+if __name__ == '__main__':
+    import sys
+    from types import SimpleNamespace
+
+    from Zenitobot_obs import ZenitobotObsBuilder
+
+    if len(sys.argv) > 1 and sys.argv[1] == "export":
+        export_actors()
+        export_onnx()
+
+    # Observations from random packets, decoded by the live obs builder
+    rng = np.random.default_rng(0)
+
+    def vector(v):
+        return SimpleNamespace(x=v[0], y=v[1], z=v[2])
+
+    def random_packet(n_cars):
+        cars = [SimpleNamespace(
+            team=i % 2, boost=rng.uniform(0, 100), is_demolished=False, has_wheel_contact=rng.random() < 0.6,
+            double_jumped=rng.random() < 0.3,
+            physics=SimpleNamespace(location=vector(rng.uniform([-4000, -5000, 17], [4000, 5000, 2000])),
+                                    rotation=SimpleNamespace(pitch=rng.uniform(-1.5, 1.5), yaw=rng.uniform(-3, 3),
+                                                             roll=rng.uniform(-3, 3)),
+                                    velocity=vector(rng.normal(0, 1000, 3)),
+                                    angular_velocity=vector(rng.normal(0, 2, 3)))) for i in range(n_cars)]
+        ball = SimpleNamespace(physics=SimpleNamespace(location=vector(rng.uniform([-4000, -5000, 93], [4000, 5000, 1800])),
+                                                       velocity=vector(rng.normal(0, 1500, 3)),
+                                                       angular_velocity=vector(rng.normal(0, 3, 3))))
+        boosts = [SimpleNamespace(is_active=rng.random() < 0.7) for _ in range(34)]
+        return SimpleNamespace(num_cars=n_cars, game_cars=cars, game_ball=ball, num_boost=34, game_boosts=boosts)
+
+    obs_builder = ZenitobotObsBuilder()
+    observations = []
+    for _ in range(1000):
+        packet = random_packet(int(rng.choice([2, 4, 6])))
+        obs = obs_builder.build_packet_obs(packet, int(rng.integers(packet.num_cars)), rng.uniform(-1, 1, 8))
+        observations.append(tuple(o.copy() for o in obs))
+
+    reference = load_actor("fp32")
+    for precision in PRECISIONS[1:]:
+        report = Agent(precision).agreement_report(observations, reference)
+        latency = ", ".join(f"{k}: {v:.0f} us" for k, v in report["latency_us"].items())
+        print(f"{precision}: {100 * report['agreement']:.1f}% action agreement with fp32, "
+              f"max logit error {report['max_logit_error']:.3f}, latency {latency}")
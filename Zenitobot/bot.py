@@ -1,47 +1,59 @@
-import math
-import random
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-import torch
-from rlbot.agents.base_agent import BaseAgent, SimpleControllerState
+from rlbot.agents.base_agent import BaseAgent, SimpleControllerState, BOT_CONFIG_AGENT_HEADER
+from rlbot.parsing.custom_config import ConfigObject
 from rlbot.utils.structures.game_data_struct import GameTickPacket
-from rlbot.utils.structures.quick_chats import QuickChats
 from rlgym_compat import GameState
 
-from agent import Agent
 from Zenitobot_obs import ZenitobotObsBuilder, BOOST_LOCATIONS
-
-KICKOFF_CONTROLS = (
-        11 * 4 * [SimpleControllerState(throttle=1, boost=True)]
-        + 4 * 4 * [SimpleControllerState(throttle=1, boost=True, steer=-1)]
-        + 2 * 4 * [SimpleControllerState(throttle=1, jump=True, boost=True)]
-        + 1 * 4 * [SimpleControllerState(throttle=1, boost=True)]
-        + 1 * 4 * [SimpleControllerState(throttle=1, yaw=0.8, pitch=-0.7, jump=True, boost=True)]
-        + 13 * 4 * [SimpleControllerState(throttle=1, pitch=1, boost=True)]
-        + 10 * 4 * [SimpleControllerState(throttle=1, roll=1, pitch=0.5)]
-)
-
-KICKOFF_NUMPY = np.array([
-    [scs.throttle, scs.steer, scs.pitch, scs.yaw, scs.roll, scs.jump, scs.boost, scs.handbrake]
-    for scs in KICKOFF_CONTROLS
-])
+from kickoffs import select_kickoff
+from tick_profiler import TickProfiler, NullProfiler
+from toxicity import Toxicity
 
 
 class Zenitobot(BaseAgent):
     def __init__(self, name, team, index,
-                 beta=1, render=False, hardcoded_kickoffs=True, stochastic_kickoffs=True):
+                 beta=1, render=False, hardcoded_kickoffs=True, stochastic_kickoffs=True, compat_game_state=False,
+                 backend="torch", precision="fp32", profile=False, pipeline=False, render_rate=10, timers=False):
         super().__init__(name, team, index)
 
         self.obs_builder = None
-        self.agent = Agent()
+        # Created in initialize_agent, once bot.cfg has been read
+        self.agent = None
+        self.backend = backend  # torch, onnx or server (torch model shared by all local bots)
+        self.precision = precision  # fp32, bf16 or int8 for the torch backend, see agent.py
         self.tick_skip = 8
+        # Boost pad and demo timers in the obs instead of raw states, only for models trained with them
+        self.timers = timers
 
         # Beta controls randomness:
         # 1=best action, 0.5=sampling from probability, 0=random, -1=worst action, or anywhere inbetween
         self.beta = beta
         self.render = render
+        # Attention weight redraws per second, the drawing stays on screen inbetween
+        self.render_rate = render_rate
+        self.last_render = 0
+        self._render_positions = None
+        self._render_palette = None
+        self._render_invert = np.array([-1, -1, 1]) if team == 1 else np.ones(3)
         self.hardcoded_kickoffs = hardcoded_kickoffs
         self.stochastic_kickoffs = stochastic_kickoffs
+        # Decode the rlgym_compat GameState every tick even when the obs can be built straight from the packet
+        self.compat_game_state = compat_game_state
+        self.decode_game_state = True
+        # Per-stage tick timings, written to profile_<index>.json next to this file, see tick_profiler.py
+        self.profile = profile
+        self.profiler = NullProfiler()
+        self.match_ended = False
+        # Run the forward pass in a worker thread, the action is picked up on a later tick of the tick_skip window
+        self.pipeline = pipeline
+        self.executor = None
+        self.pending = None
+        self.pending_positions = None
+        self.pending_late = False
 
         self.game_state: GameState = None
         self.controls = None
@@ -50,31 +62,65 @@ class Zenitobot(BaseAgent):
         self.ticks = 0
         self.prev_time = 0
         self.kickoff_index = -1
+        self.kickoff_routine = None
         self.field_info = None
         self.gamemode = None
 
         # toxic handling
         self.isToxic = False
-        self.orangeGoals = 0
-        self.blueGoals = 0
-        self.demoedCount = 0
-        self.lastFrameBall = None
-        self.lastFrameDemod = False
-        self.demoCount = 0
-        self.pesterCount = 0
-        self.demoedTickCount = 0
-        self.demoCalloutCount = 0
-        self.lastPacket = None
+        self.toxic_chat = None  # See toxicity.py
 
         print('Zenitobot Ready - Index:', index)
         print("Remember to run Zenitobot at 120fps with vsync off! "
               "Stable 240/360 is second best if that's better for your eyes")
         print("Also check out the RLGym Twitch stream to watch live bot training and occasional showmatches!")
 
+    @staticmethod
+    def create_agent_configurations(config: ConfigObject):
+        params = config.get_header(BOT_CONFIG_AGENT_HEADER)
+        params.add_value('backend', str, default='torch',
+                         description='Inference backend: torch, onnx to run the model with onnxruntime, '
+                                     'or server to share batched inference between all local bots')
+        params.add_value('precision', str, default='fp32',
+                         description='Precision of the torch and server backends: fp32, bf16 or int8')
+        params.add_value('profile', bool, default=False,
+                         description='Record per-stage tick timings and write them to profile_<index>.json')
+        params.add_value('pipeline', bool, default=False,
+                         description='Run inference in a worker thread instead of on the decision tick')
+        params.add_value('timers', bool, default=False,
+                         description='Boost pad and demo timers in the obs, only for models trained with them')
+
+    def load_config(self, config_header):
+        self.backend = config_header.get('backend')
+        self.precision = config_header.get('precision')
+        self.profile = config_header.getboolean('profile')
+        self.pipeline = config_header.getboolean('pipeline')
+        self.timers = config_header.getboolean('timers')
+
+    def make_agent(self):
+        # Imported here so the onnx backend never loads torch
+        if self.backend == "onnx":
+            from onnx_agent import OnnxAgent
+            return OnnxAgent()
+        if self.backend == "server":
+            from inference_server import RemoteAgent
+            return RemoteAgent(precision=self.precision)
+        from agent import Agent
+        return Agent(self.precision)
+
     def initialize_agent(self):
+        if self.agent is None:
+            self.agent = self.make_agent()
+        if self.profile:
+            self.profiler = TickProfiler(os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                                      f"profile_{self.index}.json"))
+        if self.pipeline and self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Zenitobot-inference")
+        self.pending = None
+
         # Initialize the rlgym GameState object now that the game is active and the info is available
         self.field_info = self.get_field_info()
-        self.obs_builder = ZenitobotObsBuilder(field_info=self.field_info)
+        self.obs_builder = ZenitobotObsBuilder(field_info=self.field_info, use_timers=self.timers)
         self.game_state = GameState(self.field_info)
         self.ticks = self.tick_skip  # So we take an action the first tick
         self.prev_time = 0
@@ -97,28 +143,51 @@ class Zenitobot(BaseAgent):
         )
         self.gamemode = game_modes[match_settings.GameMode()]
 
+        # Rendering and heatseeker need the GameState, otherwise the obs is decoded straight from the packet
+        self.decode_game_state = self.compat_game_state or self.render or self.gamemode == "heatseeker"
+
+    def render_due(self):
+        now = time.perf_counter()
+        if now - self.last_render < 1 / self.render_rate:
+            return False
+        self.last_render = now
+        return True
+
+    def render_positions(self):
+        # Players, ball, then the boost pads, which never move
+        players = self.game_state.players
+        positions = self._render_positions
+        if positions is None or len(positions) != len(players) + 1 + len(BOOST_LOCATIONS):
+            positions = self._render_positions = np.empty((len(players) + 1 + len(BOOST_LOCATIONS), 3))
+            positions[len(players) + 1:] = BOOST_LOCATIONS
+        for i, p in enumerate(players):
+            positions[i] = p.car_data.position
+        positions[len(players)] = self.game_state.ball.position
+        return positions
+
     def render_attention_weights(self, weights, positions, n=3):
         if weights is None:
             return
-        mean_weights = torch.mean(torch.stack(weights), dim=0).numpy()[0][0]
+        mean_weights = sum(np.asarray(w)[0, 0] for w in weights) / len(weights)
 
-        top = sorted(range(len(mean_weights)), key=lambda i: mean_weights[i], reverse=True)
-        top.remove(0)  # Self
+        others = mean_weights[1:]  # Without self
+        n = min(n, len(others))
+        top = np.argpartition(others, len(others) - n)[len(others) - n:]
+        top = top[np.argsort(others[top])[::-1]] + 1
+
+        if self._render_palette is None:
+            self._render_palette = [self.renderer.create_color(255, g, 255, g) for g in range(256)]
 
         self.renderer.begin_rendering('attention_weights')
 
-        invert = np.array([-1, -1, 1]) if self.team == 1 else np.ones(3)
+        invert = self._render_invert
         loc = positions[0] * invert
-        mx = mean_weights[~(np.arange(len(mean_weights)) == 1)].max()
-        c = 1
-        for i in top[:n]:
+        mx = max(mean_weights[0], mean_weights[2:].max())
+        for c, i in enumerate(top, start=1):
             weight = mean_weights[i] / mx
-            # print(i, weight)
             dest = positions[i] * invert
-            color = self.renderer.create_color(255, round(255 * (1 - weight)), round(255),
-                                               round(255 * (1 - weight)))
+            color = self._render_palette[min(max(round(255 * (1 - weight)), 0), 255)]
             self.renderer.draw_string_3d(dest, 2, 2, str(c), color)
-            c += 1
             self.renderer.draw_line_3d(loc, dest, color)
         self.renderer.end_rendering()
 
@@ -127,26 +196,51 @@ class Zenitobot(BaseAgent):
         delta = cur_time - self.prev_time
         self.prev_time = cur_time
 
+        profiler = self.profiler
+        profiler.start_tick()
+
         ticks_elapsed = round(delta * 120)
         self.ticks += ticks_elapsed
-        self.game_state.decode(packet, ticks_elapsed)
+        if self.decode_game_state:
+            self.game_state.decode(packet, ticks_elapsed)
+        else:
+            self.obs_builder.update_on_ground(packet, ticks_elapsed)
+        profiler.lap("decode")
 
         if self.isToxic:
             self.toxicity(packet)
+            profiler.lap("toxicity")
+
+        if self.pending is not None and self.pending.done():
+            # Never blocks: an action that is not ready yet is applied on the first tick after it is
+            self.action, weights = self.pending.result()
+            self.pending = None
+            if self.pending_late:
+                # Missed its control tick
+                self.pending_late = False
+                self.update_controls(self.action)
+            if self.pending_positions is not None:
+                self.render_attention_weights(weights, self.pending_positions)
+                profiler.lap("render")
 
-        if self.update_action and len(self.game_state.players) > self.index:
+        # In pipeline mode the next decision waits until the previous one has been picked up
+        if self.update_action and self.pending is None and packet.num_cars > self.index:
             self.update_action = False
 
-            player = self.game_state.players[self.index]
-            teammates = [p for p in self.game_state.players if p.team_num == self.team and p != player]
-            opponents = [p for p in self.game_state.players if p.team_num != self.team]
+            if self.decode_game_state:
+                player = self.game_state.players[self.index]
+                teammates = [p for p in self.game_state.players if p.team_num == self.team and p != player]
+                opponents = [p for p in self.game_state.players if p.team_num != self.team]
 
-            self.game_state.players = [player] + teammates + opponents
+                self.game_state.players = [player] + teammates + opponents
 
-            if self.gamemode == "heatseeker":
-                self._modify_ball_info_for_heatseeker(packet, self.game_state)
+                if self.gamemode == "heatseeker":
+                    self._modify_ball_info_for_heatseeker(packet, self.game_state)
 
-            obs = self.obs_builder.build_obs(player, self.game_state, self.action)
+                obs = self.obs_builder.build_live_obs(player, self.game_state, self.action, cur_time)
+            else:
+                obs = self.obs_builder.build_packet_obs(packet, self.index, self.action)
+            profiler.lap("obs")
 
             beta = self.beta
             if packet.game_info.is_match_ended:
@@ -154,55 +248,57 @@ class Zenitobot(BaseAgent):
                 beta = 0  # Celebrate with random actions
             if self.stochastic_kickoffs and packet.game_info.is_kickoff_pause:
                 beta = 0.5
-            self.action, weights = self.agent.act(obs, beta)
+            if self.pipeline:
+                # The obs buffers are reused by the next build, the worker gets its own copy
+                self.pending = self.executor.submit(self.agent.act, tuple(o.copy() for o in obs), beta)
+                self.pending_positions = None
+                if self.render and self.render_due():
+                    self.pending_positions = self.render_positions().copy()
+                profiler.lap("act")
+            else:
+                self.action, weights = self.agent.act(obs, beta)
+                profiler.lap("act")
 
-            if self.render:
-                positions = np.asarray([p.car_data.position for p in self.game_state.players] +
-                                       [self.game_state.ball.position] +
-                                       list(BOOST_LOCATIONS))
-                self.render_attention_weights(weights, positions)
+                if self.render and self.render_due():
+                    self.render_attention_weights(weights, self.render_positions())
+                    profiler.lap("render")
 
         if self.ticks >= self.tick_skip - 1:
             self.update_controls(self.action)
+            self.pending_late = self.pending is not None
 
         if self.ticks >= self.tick_skip:
             self.ticks = 0
             self.update_action = True
 
         if self.hardcoded_kickoffs:
+            profiler.skip()
             self.maybe_do_kickoff(packet, ticks_elapsed)
+            profiler.lap("kickoff")
+
+        profiler.end_tick(cur_time)
+        if packet.game_info.is_match_ended and not self.match_ended:
+            profiler.export()
+        self.match_ended = packet.game_info.is_match_ended
 
         return self.controls
 
+    def retire(self):
+        self.profiler.export()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
     def maybe_do_kickoff(self, packet, ticks_elapsed):
         if packet.game_info.is_kickoff_pause:
             if self.kickoff_index >= 0:
                 self.kickoff_index += round(ticks_elapsed)
             elif self.kickoff_index == -1:
-                is_kickoff_taker = False
-                ball_pos = np.array([packet.game_ball.physics.location.x, packet.game_ball.physics.location.y])
-                positions = np.array([[car.physics.location.x, car.physics.location.y]
-                                      for car in packet.game_cars[:packet.num_cars]])
-                distances = np.linalg.norm(positions - ball_pos, axis=1)
-                if abs(distances.min() - distances[self.index]) <= 10:
-                    is_kickoff_taker = True
-                    indices = np.argsort(distances)
-                    for index in indices:
-                        if abs(distances[index] - distances[self.index]) <= 10 \
-                                and packet.game_cars[index].team == self.team \
-                                and index != self.index:
-                            if self.team == 0:
-                                is_left = positions[index, 0] < positions[self.index, 0]
-                            else:
-                                is_left = positions[index, 0] > positions[self.index, 0]
-                            if not is_left:
-                                is_kickoff_taker = False  # Left goes
-
-                self.kickoff_index = 0 if is_kickoff_taker else -2
-
-            if 0 <= self.kickoff_index < len(KICKOFF_NUMPY) \
+                self.kickoff_routine = select_kickoff(packet, self.index, self.team)
+                self.kickoff_index = -2 if self.kickoff_routine is None else 0
+
+            if 0 <= self.kickoff_index < len(self.kickoff_routine) \
                     and packet.game_ball.physics.location.y == 0:
-                action = KICKOFF_NUMPY[self.kickoff_index]
+                action = self.kickoff_routine[self.kickoff_index]
                 self.action = action
                 self.update_controls(self.action)
         else:
@@ -239,151 +335,7 @@ class Zenitobot(BaseAgent):
                     goal_dir + (current_dir if packet.game_ball.latest_touch.team != self.team else goal_dir)) / 2
         self.game_state.inverted_ball.linear_velocity = self.game_state.ball.linear_velocity * np.array([-1, -1, 1])
 
-
     def toxicity(self, packet):
-        """
-        THE SALT MUST FLOW
-        """
-
-        # prep the toxic
-        scored = False
-        scoredOn = False
-        demoed = False
-        demo = False
-        allyChance = False
-
-        player = packet.game_cars[self.index]
-
-        humanMates = [p for p in packet.game_cars[:packet.num_cars] if p.team == self.team and p.is_bot is False]
-        humanOpps = [p for p in packet.game_cars[:packet.num_cars] if p.team != self.team and p.is_bot is False]
-        goodGoal = [0, -5120] if self.team == 1 else [0, 5120]
-        badGoal = [0, 5120] if self.team == 0 else [0, -5120]
-
-        if player.is_demolished and self.demoedTickCount == 0:  # and not self.lastFrameDemod:
-            demoed = True
-            self.demoedTickCount = 120 * 4
-
-        for p in packet.game_cars:
-            if p.is_demolished and p.team != self.team and self.demoCalloutCount == 0:  # player is closest
-                demo = True
-                self.demoCalloutCount = 120 * 4
-
-        if self.blueGoals != packet.teams[0].score:
-            # blue goal!
-            self.blueGoals = packet.teams[0].score
-            if self.team == 0:
-                scored = True
-            else:
-                scoredOn = True
-
-        if self.orangeGoals != packet.teams[1].score:
-            # orange goal
-            self.orangeGoals = packet.teams[1].score
-            if self.team == 1:
-                scored = True
-            else:
-                scoredOn = True
-
-        self.lastPacket = packet
-
-        # ** NaCl **
-
-        if scored:
-            i = random.randint(0, 6)
-            if i == 0:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Custom_Toxic_GitGut)
-                return
-            if i == 1:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Compliments_Thanks)
-                return
-
-            for p in humanOpps:
-
-                d = math.sqrt((p.physics.location.x - badGoal[0]) ** 2 + (p.physics.location.y - badGoal[1]) ** 2)
-                if d < 2000:
-                    self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Compliments_WhatASave)
-                    i = random.randint(0, 3)
-                    if i == 0:
-                        self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Wow)
-                        self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Compliments_WhatASave)
-                    return
-
-            for p in humanOpps:
-                d = math.sqrt((p.physics.location.x - badGoal[0]) ** 2 + (p.physics.location.y - badGoal[1]) ** 2)
-                if d > 9000:
-                    self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_CloseOne)
-                    return
-
-        if scoredOn:
-            for p in humanMates:
-                d = math.sqrt((p.physics.location.x - goodGoal[0]) ** 2 + (p.physics.location.y - goodGoal[1]) ** 2)
-                if d < 2000:
-                    i = random.randint(0, 2)
-                    if i == 0:
-                        self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Compliments_NiceBlock)
-                    else:
-                        self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Compliments_WhatASave)
-                    return
-
-            i = random.randint(0, 3)
-            if i == 0:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Custom_Excuses_Lag)
-                return
-            elif i == 1:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Okay)
-                return
-
-        if demo:
-            i = random.randint(0, 2)
-            if i == 0:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Custom_Useful_Bumping)
-
-            elif i == 1:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Apologies_Sorry)
-
-            return
-
-        if demoed:
-            self.demoCount += 1
-            if self.demoCount >= 5:
-                i = random.randint(0, 2)
-                if i == 0:
-                    self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Wow)
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Custom_Toxic_DeAlloc)
-
-                return
-
-            if self.demoCount >= 3:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Wow)
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Wow)
-
-            self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Reactions_Okay)
-            return
-
-        for p in humanMates:
-            onOpponentHalf = False
-
-            if p.team == 1 and p.physics.location.y < 0:
-                onOpponentHalf = True
-            elif p.team == 0 and p.physics.location.y > 0:
-                onOpponentHalf = True
-
-            d = math.sqrt((p.physics.location.x - packet.game_ball.physics.location.x) ** 2 + (
-                        p.physics.location.y - packet.game_ball.physics.location.y) ** 2)
-            if d < 1000 and self.pesterCount == 0 and onOpponentHalf:
-                self.send_quick_chat(QuickChats.CHAT_EVERYONE, QuickChats.Information_TakeTheShot)
-                self.pesterCount = 120 * 7  # spam but not too much
-                return
-
-        if self.demoCalloutCount > 0:
-            self.demoCalloutCount -= 1
-
-        if self.demoedTickCount > 0:
-            self.demoedTickCount -= 1
-
-        if self.pesterCount > 0:
-            self.pesterCount -= 1
-
-
-
-
+        if self.toxic_chat is None:
+            self.toxic_chat = Toxicity(self)
+        self.toxic_chat.update(packet)
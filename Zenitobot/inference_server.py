@@ -0,0 +1,332 @@
+"""
+Shared inference server for local matches.
+
+Every Zenitobot process normally loads its own model and runs batch size 1 forward passes. With backend = server in
+bot.cfg, the bots instead send their (q, kv, m) observations to one InferenceServer over a local
+multiprocessing.connection socket. The server waits until every connected bot has submitted an observation (or
+max_wait has passed), runs a single batched forward pass, and returns each bot its logits and attention weights.
+Action selection (beta) stays in the bot, see RemoteAgent.
+
+Observations and replies travel as raw float32 buffers (pack_arrays), never pickled, so nothing a local process sends
+on the socket gets executed. If the server fails, dies or stops answering, the bots fall back to running the model
+themselves.
+
+The first bot that cannot connect starts the server in a new process; the server exits when its last bot disconnects.
+"""
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+from actions import make_lookup_table, ActionSelector
+
+DEFAULT_ADDRESS = ("localhost", 47651)
+AUTHKEY = b"zenitobot-inference"  # Not a secret, only keeps other programs off the port: messages are never unpickled
+MAX_ARRAYS = 8
+MAX_DIMS = 4
+MAX_ELEMENTS = 1 << 20
+
+
+def pack_arrays(arrays) -> bytes:
+    """Raw float32 framing: the number of arrays, then the ndim and shape of each as int32, then their data"""
+    arrays = [np.asarray(a, dtype=np.float32, order="C") for a in arrays]
+    header = [len(arrays)]
+    for a in arrays:
+        header += [a.ndim, *a.shape]
+    return np.array(header, dtype=np.int32).tobytes() + b"".join(a.tobytes() for a in arrays)
+
+
+def unpack_arrays(buffer: bytes):
+    """Inverse of pack_arrays, raises ValueError on a malformed buffer"""
+    ints = np.frombuffer(buffer, dtype=np.int32, count=min(len(buffer) // 4, 1 + MAX_ARRAYS * (1 + MAX_DIMS)))
+    if len(ints) == 0 or not 0 <= ints[0] <= MAX_ARRAYS:
+        raise ValueError("Bad array count")
+    shapes = []
+    pos = 1
+    for _ in range(ints[0]):
+        if pos >= len(ints) or not 0 <= ints[pos] <= MAX_DIMS or pos + 1 + ints[pos] > len(ints):
+            raise ValueError("Bad array header")
+        shape = tuple(int(d) for d in ints[pos + 1:pos + 1 + ints[pos]])
+        if any(d < 0 for d in shape) or np.prod(shape, dtype=np.int64) > MAX_ELEMENTS:
+            raise ValueError(f"Bad array shape {shape}")
+        shapes.append(shape)
+        pos += 1 + len(shape)
+
+    offset = 4 * pos
+    if len(buffer) != offset + 4 * sum(int(np.prod(shape, dtype=np.int64)) for shape in shapes):
+        raise ValueError("Array data does not match the header")
+    arrays = []
+    for shape in shapes:
+        size = int(np.prod(shape, dtype=np.int64))
+        arrays.append(np.frombuffer(buffer, dtype=np.float32, count=size, offset=offset).reshape(shape))
+        offset += 4 * size
+    return arrays
+
+
+class InferenceServer:
+    def __init__(self, address=DEFAULT_ADDRESS, backend="torch", precision="fp32", max_wait=0.002):
+        self.address = address
+        self.max_wait = max_wait
+        self._forward = self._make_forward(backend, precision)
+        self._requests = queue.Queue()
+        self._n_clients = 0
+        self._lock = threading.Lock()
+        self.listener = None
+
+    @staticmethod
+    def _make_forward(backend, precision):
+        """Returns a function mapping batched (q, kv, m) numpy arrays to numpy logits and attention weights"""
+        if backend == "onnx":
+            from onnx_agent import OnnxAgent
+            session = OnnxAgent().session
+            names = [i.name for i in session.get_inputs()]
+
+            def forward(obs):
+                logits, *weights = session.run(None, dict(zip(names, obs)))
+                return logits, weights
+
+            return forward
+
+        import torch
+        from agent import load_actor
+        actor = load_actor(precision)
+
+        def forward(obs):
+            with torch.no_grad():
+                logits, weights = actor(tuple(torch.from_numpy(o) for o in obs))
+            return logits.float().numpy(), [w.float().numpy() for w in weights]
+
+        return forward
+
+    def serve_forever(self):
+        self.listener = Listener(self.address, authkey=AUTHKEY)
+        threading.Thread(target=self._accept, daemon=True).start()
+        print("Zenitobot inference server listening on", self.address)
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            self._run(batch)
+        self.listener.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # Listener closed, or a client failed to authenticate
+            with self._lock:
+                self._n_clients += 1
+            threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+
+    @property
+    def n_clients(self):
+        with self._lock:
+            return self._n_clients
+
+    def _receive(self, conn):
+        try:
+            while True:
+                obs = unpack_arrays(conn.recv_bytes())
+                if len(obs) != 3:
+                    raise ValueError(f"Expected (q, kv, m), got {len(obs)} arrays")
+                self._requests.put((conn, obs))
+        except (EOFError, OSError):
+            pass
+        except ValueError as e:
+            print("Zenitobot inference server dropped a client:", e)
+        conn.close()
+        with self._lock:
+            self._n_clients -= 1
+            if self._n_clients == 0:
+                self._requests.put(None)  # Last bot left
+
+    def _next_batch(self):
+        batch = []
+        while not batch:
+            request = self._requests.get()
+            if request is None:
+                with self._lock:
+                    if self._n_clients == 0:
+                        return None
+                continue  # A new bot connected in the meantime
+            batch.append(request)
+
+        # Each bot has at most one pending request, so the batch is complete once every bot has submitted
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.n_clients:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                continue
+            batch.append(request)
+        return batch
+
+    def _run(self, batch):
+        # Bots in different matches can have a different number of entities, only equal shapes are stacked
+        groups = {}
+        for conn, obs in batch:
+            groups.setdefault(tuple(o.shape for o in obs), []).append((conn, obs))
+        for group in groups.values():
+            try:
+                obs = tuple(np.concatenate([o[i] for _, o in group]) for i in range(3))
+                logits, weights = self._forward(obs)
+                replies = [pack_arrays((logits[j], *(w[j:j + 1] for w in weights))) for j in range(len(group))]
+            except Exception as e:  # Keep serving the other groups, these bots get an empty (error) reply
+                print("Zenitobot inference server forward pass failed:", repr(e))
+                replies = [b""] * len(group)
+            for (conn, _), reply in zip(group, replies):
+                try:
+                    conn.send_bytes(reply)
+                except OSError:
+                    pass  # The bot disconnected, _receive cleans up
+
+
+class RemoteAgent:
+    """
+    Same interface as agent.Agent, with the forward pass done by a shared InferenceServer.
+
+    If the server does not answer within reply_timeout seconds, disconnects or reports an error, the agent switches
+    to a local Agent (OnnxAgent for backend = onnx) for the rest of the match.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, backend="torch", precision="fp32", timeout=60., reply_timeout=1.):
+        self.backend = backend
+        self.precision = precision
+        self.reply_timeout = reply_timeout
+        self.conn = self._connect(address, backend, precision, timeout)
+        self._lookup_table = make_lookup_table()
+        self._select_action = ActionSelector(len(self._lookup_table))
+        self.local_agent = None
+        self.state = None
+
+    @staticmethod
+    def _connect(address, backend, precision, timeout):
+        try:
+            return Client(address, authkey=AUTHKEY)
+        except ConnectionRefusedError:
+            pass
+
+        # No server yet, start one. If several bots race here, the extra servers fail to bind and exit.
+        subprocess.Popen([sys.executable, os.path.realpath(__file__), "--host", address[0], "--port", str(address[1]),
+                          "--backend", backend, "--precision", precision])
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                return Client(address, authkey=AUTHKEY)
+            except ConnectionRefusedError:
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def _fall_back(self, reason):
+        print(f"Zenitobot inference server {reason}, running the model locally")
+        self.conn.close()
+        if self.backend == "onnx":
+            from onnx_agent import OnnxAgent
+            self.local_agent = OnnxAgent()
+        else:
+            from agent import Agent
+            self.local_agent = Agent(self.precision)
+
+    def act(self, state, beta):
+        if self.local_agent is None:
+            state = tuple(np.asarray(s, dtype=np.float32) for s in state)
+            try:
+                self.conn.send_bytes(pack_arrays(state))
+                if self.conn.poll(self.reply_timeout):
+                    reply = self.conn.recv_bytes()
+                    if reply:
+                        logits, *weights = unpack_arrays(reply)
+                        self.state = state
+                        action = self._select_action(logits, beta)
+                        return self._lookup_table[action], tuple(weights)
+                    self._fall_back("failed")
+                else:
+                    self._fall_back("timed out")
+            except (EOFError, OSError):
+                self._fall_back("disconnected")
+            except ValueError as e:
+                self._fall_back(f"sent a malformed reply ({e})")
+
+        parsed, weights = self.local_agent.act(state, beta)
+        self.state = self.local_agent.state
+        return parsed, weights
+
+
+def _benchmark_client(address, obs, n_steps, start):
+    agent = RemoteAgent(address)
+    start.wait()
+    for _ in range(n_steps):
+        agent.act(obs, 1)
+
+
+def benchmark(n_bots=6, n_steps=300, backend="torch", precision="fp32"):
+    """Compares n_bots sequential batch size 1 forward passes with n_bots bot processes sharing one server"""
+    import multiprocessing
+
+    rng = np.random.default_rng(0)
+    n_entities = 1 + 1 + 34 + n_bots
+    observations = [(rng.normal(size=(1, 1, 32)).astype(np.float32),
+                     rng.normal(size=(1, n_entities, 24)).astype(np.float32),
+                     np.zeros((1, n_entities), dtype=np.float32)) for _ in range(n_bots)]
+
+    forward = InferenceServer._make_forward(backend, precision)
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        for obs in observations:
+            forward(obs)
+    separate = (time.perf_counter() - start) / n_steps
+
+    address = ("localhost", DEFAULT_ADDRESS[1] + 1)
+    server = InferenceServer(address, backend, precision)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    while server.listener is None:
+        time.sleep(0.01)
+    # Spawned, like separate bot processes; forking after the model has started its threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    start_event = context.Event()
+    bots = [context.Process(target=_benchmark_client, args=(address, obs, n_steps, start_event))
+            for obs in observations]
+    for bot in bots:
+        bot.start()
+    while server.n_clients < n_bots:
+        time.sleep(0.01)
+    start = time.perf_counter()
+    start_event.set()
+    for bot in bots:
+        bot.join()
+    shared = (time.perf_counter() - start) / n_steps
+
+    print(f"{n_bots} bots, separate: {1e3 * separate:.2f} ms/step, shared server: {1e3 * shared:.2f} ms/step")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--backend", default="torch", choices=("torch", "onnx"))
+    parser.add_argument("--precision", default="fp32")
+    parser.add_argument("--max-wait", type=float, default=0.002, help="Seconds to wait for the other bots")
+    parser.add_argument("--benchmark", type=int, metavar="N_BOTS", help="Benchmark instead of serving")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, backend=args.backend, precision=args.precision)
+    else:
+        try:
+            InferenceServer((args.host, args.port), args.backend, args.precision, args.max_wait).serve_forever()
+        except OSError as e:
+            print("Zenitobot inference server not started:", e)  # Most likely already running
@@ -0,0 +1,117 @@
+"""
+Scripted kickoffs.
+
+Soccar kickoffs always start from the same five spawns per team, so who takes the kickoff only depends on which spawns
+each team occupies. KICKOFF_TAKERS holds the answer for every combination (2^5 x 2^5), and KICKOFF_ROUTINES the
+script played from each spawn. Anything that does not look like a standard kickoff (other maps, moved ball, custom
+spawns) falls back to comparing the actual distances.
+"""
+import numpy as np
+from rlbot.agents.base_agent import SimpleControllerState
+
+KICKOFF_CONTROLS = (
+        11 * 4 * [SimpleControllerState(throttle=1, boost=True)]
+        + 4 * 4 * [SimpleControllerState(throttle=1, boost=True, steer=-1)]
+        + 2 * 4 * [SimpleControllerState(throttle=1, jump=True, boost=True)]
+        + 1 * 4 * [SimpleControllerState(throttle=1, boost=True)]
+        + 1 * 4 * [SimpleControllerState(throttle=1, yaw=0.8, pitch=-0.7, jump=True, boost=True)]
+        + 13 * 4 * [SimpleControllerState(throttle=1, pitch=1, boost=True)]
+        + 10 * 4 * [SimpleControllerState(throttle=1, roll=1, pitch=0.5)]
+)
+
+KICKOFF_NUMPY = np.array([
+    [scs.throttle, scs.steer, scs.pitch, scs.yaw, scs.roll, scs.jump, scs.boost, scs.handbrake]
+    for scs in KICKOFF_CONTROLS
+])
+
+# Blue spawns, orange ones are mirrored. Left is positive x for blue.
+SPAWN_NAMES = ("diagonal_right", "diagonal_left", "offcenter_right", "offcenter_left", "center")
+KICKOFF_SPAWNS = np.array([[-2048, -2560], [2048, -2560], [-256, -3840], [256, -3840], [0, -4608]])
+SPAWN_TOLERANCE = 64
+_SPAWN_CELLS = {(round(x / (2 * SPAWN_TOLERANCE)), round(y / (2 * SPAWN_TOLERANCE))): (i, int(x), int(y))
+                for i, (x, y) in enumerate(KICKOFF_SPAWNS)}
+
+# Script played from each spawn, they all share the default one for now
+KICKOFF_ROUTINES = {name: KICKOFF_NUMPY for name in SPAWN_NAMES}
+
+TIE_DISTANCE = 10
+
+
+def _build_taker_table():
+    """Spawn id of the kickoff taker for every (teammate spawns, opponent spawns) bitmask pair, -1 if none"""
+    distances = np.linalg.norm(KICKOFF_SPAWNS, axis=1)
+    n_spawns = len(KICKOFF_SPAWNS)
+    table = np.full((1 << n_spawns, 1 << n_spawns), -1, dtype=np.int8)
+    for mates in range(1, 1 << n_spawns):
+        mate_spawns = [i for i in range(n_spawns) if mates >> i & 1]
+        for opponents in range(1 << n_spawns):
+            closest = min(distances[i] for i in range(n_spawns) if (mates | opponents) >> i & 1)
+            tied = [i for i in mate_spawns if abs(distances[i] - closest) <= TIE_DISTANCE]
+            if tied:
+                table[mates, opponents] = max(tied, key=lambda i: KICKOFF_SPAWNS[i, 0])  # Left goes
+    return table
+
+
+KICKOFF_TAKERS = _build_taker_table()
+_TAKERS = KICKOFF_TAKERS.tolist()  # Faster than indexing numpy with Python ints
+
+
+def spawn_id(x, y, team):
+    """Index in KICKOFF_SPAWNS of the spawn of a car of team at (x, y), or -1"""
+    if team == 1:
+        x, y = -x, -y
+    cell = _SPAWN_CELLS.get((round(x / (2 * SPAWN_TOLERANCE)), round(y / (2 * SPAWN_TOLERANCE))))
+    if cell is None:
+        return -1
+    i, spawn_x, spawn_y = cell
+    if abs(x - spawn_x) > SPAWN_TOLERANCE or abs(y - spawn_y) > SPAWN_TOLERANCE:
+        return -1
+    return i
+
+
+def is_kickoff_taker(packet, index, team):
+    """Closest car to the ball goes, the leftmost one if teammates are tied"""
+    ball_pos = np.array([packet.game_ball.physics.location.x, packet.game_ball.physics.location.y])
+    positions = np.array([[car.physics.location.x, car.physics.location.y]
+                          for car in packet.game_cars[:packet.num_cars]])
+    distances = np.linalg.norm(positions - ball_pos, axis=1)
+    if abs(distances.min() - distances[index]) > TIE_DISTANCE:
+        return False
+    for other in range(packet.num_cars):
+        if abs(distances[other] - distances[index]) <= TIE_DISTANCE \
+                and packet.game_cars[other].team == team \
+                and other != index:
+            if team == 0:
+                is_left = positions[other, 0] < positions[index, 0]
+            else:
+                is_left = positions[other, 0] > positions[index, 0]
+            if not is_left:
+                return False  # Left goes
+    return True
+
+
+def select_kickoff(packet, index, team):
+    """Returns the kickoff script for the car at index, or None if it should not take the kickoff"""
+    ball = packet.game_ball.physics.location
+    if abs(ball.x) < 1 and abs(ball.y) < 1:
+        mates = opponents = 0
+        own_spawn = -1
+        for i in range(packet.num_cars):
+            car = packet.game_cars[i]
+            spawn = spawn_id(car.physics.location.x, car.physics.location.y, car.team)
+            if spawn < 0:
+                break
+            if car.team == team:
+                mates |= 1 << spawn
+                if i == index:
+                    own_spawn = spawn
+            else:
+                opponents |= 1 << spawn
+        else:
+            if own_spawn >= 0:
+                if _TAKERS[mates][opponents] != own_spawn:
+                    return None
+                return KICKOFF_ROUTINES[SPAWN_NAMES[own_spawn]]
+
+    # Not a standard kickoff
+    return KICKOFF_NUMPY if is_kickoff_taker(packet, index, team) else None
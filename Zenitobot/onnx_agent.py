@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError as e:  # Optional dependency, only needed by this backend
+    raise ImportError("backend = onnx needs onnxruntime (pip install onnxruntime)") from e
+
+from actions import make_lookup_table, ActionSelector
+
+CUR_DIR = os.path.dirname(os.path.realpath(__file__))
+ONNX_PATH = os.path.join(CUR_DIR, "Zenitobot-model.onnx")
+TORCHSCRIPT_PATH = os.path.join(CUR_DIR, "Zenitobot-model.pt")
+
+
+class OnnxAgent:
+    """
+    Same interface as agent.Agent, running the actor with onnxruntime instead of PyTorch.
+
+    Zenitobot-model.onnx is generated, not versioned: it is exported from the TorchScript model (agent.export_onnx)
+    when it is missing or older than Zenitobot-model.pt, which is the only time torch is imported. Run
+    `python agent.py export` after updating the model to do it ahead of time.
+    """
+
+    def __init__(self, path=ONNX_PATH):
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(TORCHSCRIPT_PATH):
+            from agent import export_onnx
+            export_onnx(path)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self.session.get_inputs()]
+        self._lookup_table = make_lookup_table()
+        self._select_action = ActionSelector(len(self._lookup_table))
+        self.state = None
+
+    def act(self, state, beta):
+        state = tuple(np.asarray(s, dtype=np.float32) for s in state)
+        logits, *weights = self.session.run(None, dict(zip(self._input_names, state)))
+        self.state = state
+        action = self._select_action(logits[0], beta)
+        parsed = self._lookup_table[action]
+
+        return parsed, tuple(weights)
@@ -0,0 +1,141 @@
+"""
+Per-tick latency instrumentation for Zenitobot.get_output.
+
+TickProfiler records how long each stage of a tick took into a fixed-size ring buffer (one row per tick, NaN for the
+stages that did not run) and periodically writes a JSON report with the p50/p99/max and a histogram of every stage,
+plus the slowest recent ticks that went over the 1/120 s frame budget.
+"""
+import json
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+STAGES = ("decode", "obs", "act", "render", "toxicity", "kickoff", "total")
+TICK_BUDGET = 1 / 120
+
+# Histogram bin edges in microseconds, the last finite edge being two frames
+HISTOGRAM_EDGES_US = (0, 50, 100, 250, 500, 1000, 2000, 4000, 1e6 * TICK_BUDGET, 2e6 * TICK_BUDGET, np.inf)
+
+
+class TickProfiler:
+    def __init__(self, path, capacity=120 * 60, export_interval=30., max_slow_ticks=100):
+        self.path = path
+        self.export_interval = export_interval
+        self.timings = np.full((capacity, len(STAGES)), np.nan)
+        self.n_ticks = 0
+        self.slow_ticks = deque(maxlen=max_slow_ticks)
+        self.n_slow_ticks = 0
+        self._stage_index = {stage: i for i, stage in enumerate(STAGES)}
+        self._row = self.timings[0]
+        self._tick_start = 0.
+        self._last = 0.
+        self._last_export = time.perf_counter()
+
+    def start_tick(self):
+        self._row = self.timings[self.n_ticks % len(self.timings)]
+        self._row.fill(np.nan)
+        self._tick_start = self._last = time.perf_counter()
+
+    def lap(self, stage):
+        """Records the time since the previous lap (or the start of the tick) as the duration of stage"""
+        now = time.perf_counter()
+        self._row[self._stage_index[stage]] = now - self._last
+        self._last = now
+
+    def skip(self):
+        """Excludes the time since the previous lap from the next stage"""
+        self._last = time.perf_counter()
+
+    def end_tick(self, game_time=None):
+        now = time.perf_counter()
+        total = now - self._tick_start
+        self._row[-1] = total
+        if total > TICK_BUDGET:
+            self.n_slow_ticks += 1
+            self.slow_ticks.append({
+                "tick": self.n_ticks,
+                "game_time": game_time,
+                **{stage: 1e6 * t for stage, t in zip(STAGES, self._row) if not np.isnan(t)},
+            })
+        self.n_ticks += 1
+        if now - self._last_export > self.export_interval:
+            self.export()
+
+    def summary(self):
+        timings = 1e6 * self.timings[:min(self.n_ticks, len(self.timings))]
+        stages = {}
+        for stage, column in zip(STAGES, timings.T):
+            column = column[~np.isnan(column)]
+            if len(column) == 0:
+                continue
+            p50, p99 = np.percentile(column, [50, 99])
+            stages[stage] = {
+                "count": len(column),
+                "p50_us": p50,
+                "p99_us": p99,
+                "max_us": column.max(),
+                "histogram": np.histogram(column, HISTOGRAM_EDGES_US)[0].tolist(),
+            }
+        return {
+            "ticks": self.n_ticks,
+            "window": len(timings),
+            "budget_us": 1e6 * TICK_BUDGET,
+            "over_budget": self.n_slow_ticks,
+            "histogram_edges_us": list(HISTOGRAM_EDGES_US[:-1]),
+            "stages": stages,
+            "slowest_ticks": sorted(self.slow_ticks, key=lambda t: t["total"], reverse=True)[:10],
+        }
+
+    def export(self):
+        self._last_export = time.perf_counter()
+        summary = self.summary()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(summary, f, indent=2, default=float)
+        os.replace(tmp_path, self.path)
+        return summary
+
+
+class NullProfiler:
+    """Stands in for TickProfiler when profiling is off"""
+
+    def start_tick(self):
+        pass
+
+    def lap(self, stage):
+        pass
+
+    def skip(self):
+        pass
+
+    def end_tick(self, game_time=None):
+        pass
+
+    def export(self):
+        pass
+
+
+if __name__ == '__main__':
+    import sys
+
+    # Overhead of the instrumentation for a tick going through every stage
+    profiler = TickProfiler(os.devnull, export_interval=np.inf)
+    n = 100_000
+    start = time.perf_counter()
+    for _ in range(n):
+        profiler.start_tick()
+        for stage in STAGES[:-1]:
+            profiler.lap(stage)
+        profiler.end_tick()
+    print(f"Profiler overhead: {1e6 * (time.perf_counter() - start) / n:.2f} us/tick")
+
+    if len(sys.argv) > 1:
+        # Prints a report written by the bot
+        with open(sys.argv[1]) as f:
+            report = json.load(f)
+        print(f"{report['ticks']} ticks, {report['over_budget']} over the {report['budget_us']:.0f} us budget")
+        for stage, stats in report["stages"].items():
+            print(f"{stage:>9}: p50 {stats['p50_us']:7.1f} us, p99 {stats['p99_us']:7.1f} us, "
+                  f"max {stats['max_us']:8.1f} us ({stats['count']} ticks)")
@@ -0,0 +1,169 @@
+"""
+THE SALT MUST FLOW
+
+Quick chat reactions to goals, demolitions and teammates at the ball. Instead of scanning every car each tick, only
+the fields that signal an event are compared with the previous tick: the team scores, the demolished flags and the
+latest ball touch. The chat logic only runs when one of them changes, and the cooldowns are game time deadlines
+rather than per-tick counters.
+"""
+import math
+import random
+
+from rlbot.utils.structures.quick_chats import QuickChats
+
+DEMO_COOLDOWN = 4  # Seconds
+PESTER_COOLDOWN = 7
+
+
+class Toxicity:
+    def __init__(self, agent):
+        self.agent = agent
+        self.index = agent.index
+        self.team = agent.team
+
+        self.num_cars = -1
+        self.human_mates = ()
+        self.human_opponents = ()
+        self.opponents = ()
+
+        self.scores = None
+        self.demolished = False
+        self.opponents_demolished = ()
+        self.last_touch_time = None
+
+        self.demoed_until = 0.
+        self.demo_callout_until = 0.
+        self.pester_until = 0.
+        self.demo_count = 0
+
+    def _update_cars(self, packet):
+        cars = [(i, packet.game_cars[i]) for i in range(packet.num_cars)]
+        self.num_cars = packet.num_cars
+        self.human_mates = tuple(i for i, car in cars if car.team == self.team and not car.is_bot)
+        self.human_opponents = tuple(i for i, car in cars if car.team != self.team and not car.is_bot)
+        self.opponents = tuple(i for i, car in cars if car.team != self.team)
+        self.opponents_demolished = tuple(packet.game_cars[i].is_demolished for i in self.opponents)
+
+    def update(self, packet):
+        if packet.num_cars != self.num_cars:
+            self._update_cars(packet)
+        now = packet.game_info.seconds_elapsed
+
+        scored = scored_on = False
+        scores = (packet.teams[0].score, packet.teams[1].score)
+        if scores != self.scores:
+            if self.scores is not None:
+                own = 0 if self.team == 0 else 1
+                scored = scores[own] != self.scores[own]
+                scored_on = scores[1 - own] != self.scores[1 - own]
+            self.scores = scores
+
+        demoed = False
+        demolished = packet.game_cars[self.index].is_demolished
+        if demolished != self.demolished:
+            self.demolished = demolished
+            if demolished and now >= self.demoed_until:
+                demoed = True
+                self.demoed_until = now + DEMO_COOLDOWN
+
+        demo = False
+        opponents_demolished = tuple(packet.game_cars[i].is_demolished for i in self.opponents)
+        if opponents_demolished != self.opponents_demolished:
+            if any(d and not prev for d, prev in zip(opponents_demolished, self.opponents_demolished)) \
+                    and now >= self.demo_callout_until:
+                demo = True
+                self.demo_callout_until = now + DEMO_COOLDOWN
+            self.opponents_demolished = opponents_demolished
+
+        pester = False
+        touch = packet.game_ball.latest_touch
+        if touch.time_seconds != self.last_touch_time:
+            self.last_touch_time = touch.time_seconds
+            if touch.player_index in self.human_mates and now >= self.pester_until:
+                # Teammate at the ball in the opponent half
+                y = packet.game_cars[touch.player_index].physics.location.y
+                if (y > 0) if self.team == 0 else (y < 0):
+                    pester = True
+
+        if scored or scored_on or demo or demoed or pester:
+            self.react(packet, scored, scored_on, demo, demoed, pester, now)
+
+    def chat(self, quick_chat):
+        self.agent.send_quick_chat(QuickChats.CHAT_EVERYONE, quick_chat)
+
+    def react(self, packet, scored, scored_on, demo, demoed, pester, now):
+        good_goal = [0, -5120] if self.team == 1 else [0, 5120]
+        bad_goal = [0, 5120] if self.team == 0 else [0, -5120]
+
+        def distance(i, goal):
+            location = packet.game_cars[i].physics.location
+            return math.sqrt((location.x - goal[0]) ** 2 + (location.y - goal[1]) ** 2)
+
+        if scored:
+            i = random.randint(0, 6)
+            if i == 0:
+                self.chat(QuickChats.Custom_Toxic_GitGut)
+                return
+            if i == 1:
+                self.chat(QuickChats.Compliments_Thanks)
+                return
+
+            for p in self.human_opponents:
+                if distance(p, bad_goal) < 2000:
+                    self.chat(QuickChats.Compliments_WhatASave)
+                    i = random.randint(0, 3)
+                    if i == 0:
+                        self.chat(QuickChats.Reactions_Wow)
+                        self.chat(QuickChats.Compliments_WhatASave)
+                    return
+
+            for p in self.human_opponents:
+                if distance(p, bad_goal) > 9000:
+                    self.chat(QuickChats.Reactions_CloseOne)
+                    return
+
+        if scored_on:
+            for p in self.human_mates:
+                if distance(p, good_goal) < 2000:
+                    i = random.randint(0, 2)
+                    if i == 0:
+                        self.chat(QuickChats.Compliments_NiceBlock)
+                    else:
+                        self.chat(QuickChats.Compliments_WhatASave)
+                    return
+
+            i = random.randint(0, 3)
+            if i == 0:
+                self.chat(QuickChats.Custom_Excuses_Lag)
+                return
+            elif i == 1:
+                self.chat(QuickChats.Reactions_Okay)
+                return
+
+        if demo:
+            i = random.randint(0, 2)
+            if i == 0:
+                self.chat(QuickChats.Custom_Useful_Bumping)
+            elif i == 1:
+                self.chat(QuickChats.Apologies_Sorry)
+            return
+
+        if demoed:
+            self.demo_count += 1
+            if self.demo_count >= 5:
+                i = random.randint(0, 2)
+                if i == 0:
+                    self.chat(QuickChats.Reactions_Wow)
+                self.chat(QuickChats.Custom_Toxic_DeAlloc)
+                return
+
+            if self.demo_count >= 3:
+                self.chat(QuickChats.Reactions_Wow)
+                self.chat(QuickChats.Reactions_Wow)
+
+            self.chat(QuickChats.Reactions_Okay)
+            return
+
+        if pester:
+            self.chat(QuickChats.Information_TakeTheShot)
+            self.pester_until = now + PESTER_COOLDOWN  # spam but not too much
@@ -0,0 +1,108 @@
+"""
+Vectorized arena geometry.
+
+Every function takes positions as an array of shape (..., 3) (or (..., 2) where only x/y matter) and returns the
+distances with the leading shape, so a single call covers all cars, all steps, or both at once. The arena is
+symmetric, so the walls are handled in the folded |x|, |y| quadrant.
+"""
+import numpy as np
+
+SIDE_WALL_X = 4096
+BACK_WALL_Y = 5120
+BACK_NET_Y = 6000
+CEILING_Z = 2044
+GOAL_HALF_WIDTH = 892.755
+GOAL_HEIGHT = 642.775
+
+# Diagonal corner wall in the +x/+y quadrant, same segment as ZenitobotRewardFunction.dist_to_closest_wall
+CORNER_START = np.array([SIDE_WALL_X - 1152, BACK_WALL_Y])
+CORNER_END = np.array([SIDE_WALL_X, BACK_WALL_Y - 1152])
+_CORNER_DIR = CORNER_END - CORNER_START
+_CORNER_LEN_SQ = _CORNER_DIR @ _CORNER_DIR
+
+GOAL_Y = np.array([-BACK_WALL_Y, BACK_WALL_Y])  # Blue, orange
+
+
+def dist_to_side_wall(positions: np.ndarray) -> np.ndarray:
+    positions = np.asarray(positions)
+    return np.abs(SIDE_WALL_X - np.abs(positions[..., 0]))
+
+
+def dist_to_back_wall(positions: np.ndarray) -> np.ndarray:
+    positions = np.asarray(positions)
+    return np.abs(BACK_WALL_Y - np.abs(positions[..., 1]))
+
+
+def dist_to_corner(positions: np.ndarray) -> np.ndarray:
+    """Distance to the closest of the four diagonal corner walls"""
+    positions = np.asarray(positions)
+    a = np.abs(positions[..., 0]) - CORNER_START[0]
+    b = np.abs(positions[..., 1]) - CORNER_START[1]
+    param = np.clip((a * _CORNER_DIR[0] + b * _CORNER_DIR[1]) / _CORNER_LEN_SQ, 0, 1)
+    dx = a - param * _CORNER_DIR[0]
+    dy = b - param * _CORNER_DIR[1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def dist_to_closest_wall(positions: np.ndarray) -> np.ndarray:
+    """Distance to the closest side, back or corner wall, ignoring height"""
+    return np.minimum(np.minimum(dist_to_side_wall(positions), dist_to_back_wall(positions)),
+                      dist_to_corner(positions))
+
+
+def dist_to_ceiling(positions: np.ndarray) -> np.ndarray:
+    return CEILING_Z - np.asarray(positions)[..., 2]
+
+
+def dist_to_goals(positions: np.ndarray) -> np.ndarray:
+    """Distance to the blue and orange goal mouths (the rectangle on the goal line), shape (..., 2)"""
+    positions = np.asarray(positions)[..., None, :]
+    dx = np.maximum(np.abs(positions[..., 0]) - GOAL_HALF_WIDTH, 0)
+    dy = positions[..., 1] - GOAL_Y
+    dz = np.maximum(positions[..., 2] - GOAL_HEIGHT, 0)
+    return np.sqrt(dx * dx + dy * dy + dz * dz)
+
+
+def dist_to_closest_goal(positions: np.ndarray) -> np.ndarray:
+    return dist_to_goals(positions).min(axis=-1)
+
+
+class WallDistanceGrid:
+    """
+    Precomputed dist_to_closest_wall on a regular x/y grid over one quadrant, queried by nearest cell.
+
+    A single table lookup instead of the side/back/corner computation; the error is at most
+    resolution / sqrt(2) (~11 uu at the default 16 uu). The grid covers the goal nets, positions
+    further out are clamped to its edge.
+    """
+
+    def __init__(self, resolution: float = 16):
+        self.resolution = resolution
+        xs = np.arange(0, SIDE_WALL_X + resolution, resolution)
+        ys = np.arange(0, BACK_NET_Y + resolution, resolution)
+        grid_x, grid_y = np.meshgrid(xs, ys, indexing="ij")
+        self.shape = grid_x.shape
+        self.table = dist_to_closest_wall(np.stack([grid_x, grid_y], axis=-1)).astype(np.float32).ravel()
+
+    def __call__(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions)
+        scale = 1 / self.resolution
+        ix = np.minimum(np.rint(np.abs(positions[..., 0]) * scale), self.shape[0] - 1).astype(np.intp)
+        iy = np.minimum(np.rint(np.abs(positions[..., 1]) * scale), self.shape[1] - 1).astype(np.intp)
+        return self.table[ix * self.shape[1] + iy]
+
+
+if __name__ == '__main__':
+    import timeit
+
+    rng = np.random.default_rng(0)
+    positions = rng.uniform([-SIDE_WALL_X, -BACK_WALL_Y, 0], [SIDE_WALL_X, BACK_WALL_Y, CEILING_Z], (100_000, 3))
+    grid = WallDistanceGrid()
+
+    exact = dist_to_closest_wall(positions)
+    print(f"Grid max error: {np.abs(grid(positions) - exact).max():.2f} uu")
+
+    n = 20
+    t_exact = timeit.timeit(lambda: dist_to_closest_wall(positions), number=n) / n
+    t_grid = timeit.timeit(lambda: grid(positions), number=n) / n
+    print(f"Exact: {1e9 * t_exact / len(positions):.1f} ns/position, grid: {1e9 * t_grid / len(positions):.1f} ns/position")
@@ -0,0 +1,710 @@
+"""
+ZENITOBOT - MOTEUR DE REWARDS VECTORISÉ
+========================================
+Évalue tout le stack de rewards de pro_training.py en une seule passe numpy.
+
+La physique de toutes les voitures est empaquetée une fois par step dans un
+tableau (n_agents, N_CAR_FEATURES) par le cache de reward_features.py (partagé
+avec les rewards par classe via shared_info), puis chaque détecteur de mécanique est
+évalué comme une expression sur ce tableau au lieu d'une boucle Python par
+agent. Le résultat est identique au CombinedReward des classes individuelles
+(voir le __main__ pour le test de parité et le benchmark).
+
+Pas de gain fiable à si peu de voitures : le coût fixe de chaque opération numpy
+domine, et selon les passes du benchmark le moteur va de nettement plus lent à un
+peu plus rapide (2, 4 et 6 agents). Il reste donc optionnel :
+build_rlgym_v2_env(batched_rewards=False) par défaut.
+"""
+
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from rlgym.api import RewardFunction, AgentID
+from rlgym.rocket_league.api import GameState
+from rlgym.rocket_league import common_values
+
+from reward_features import (
+    POS, LIN_VEL, ANG_VEL, UP_Z, PITCH, YAW, IS_BOOSTING, HANDBRAKE, BOOST,
+    GOAL_Z, _norm, _dot, get_step_features
+)
+
+
+# ============================================================================
+# TERMES DE REWARD ET POIDS PAR DÉFAUT (même ordre que build_combined_reward)
+# ============================================================================
+
+REWARD_TERMS = (
+    ('velocity_player_to_ball', 0.2),
+    ('face_ball', 0.3),
+    ('velocity_ball_to_goal', 6.0),
+    ('passing', 10.0),
+    ('rotation', 3.0),
+    ('smart_positioning', 2.5),
+    ('boost_management', 1.5),
+    ('small_pad_collection', 2.0),
+    ('patience', 2.0),
+    ('challenge_timing', 4.0),
+    ('grounded_play', 1.5),
+    ('powershot', 12.0),
+    ('backboard', 10.0),
+    ('advanced_dribbling', 15.0),
+    ('bounce_dribble', 6.0),
+    ('air_dribble', 14.0),
+    ('fast_aerial', 5.0),
+    ('flip_reset', 20.0),
+    ('musty_aerial', 18.0),
+    ('heli_reset', 25.0),
+    ('ceiling_shot', 15.0),
+    ('double_tap', 18.0),
+    ('wavedash', 5.0),
+    ('chain_dash', 8.0),
+    ('half_flip', 8.0),
+    ('redirect', 12.0),
+    ('pinch', 15.0),
+    ('shadow_defense', 4.0),
+    ('flip_cancel', 7.0),
+    ('turtle', 10.0),
+    ('stall', 8.0),
+    ('ceiling_shuffle', 6.0),
+    ('goal', 30.0),
+)
+TERM_INDEX = {name: i for i, (name, _) in enumerate(REWARD_TERMS)}
+
+class BatchedProReward(RewardFunction[AgentID, GameState, float]):
+    """Tout le stack de rewards pro évalué de façon vectorisée sur tous les agents"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None):
+        default = dict(REWARD_TERMS)
+        if weights is not None:
+            unknown = set(weights) - set(default)
+            assert not unknown, f"Unknown reward terms: {sorted(unknown)}"
+            default.update(weights)
+        self.weights = np.array([default[name] for name, _ in REWARD_TERMS])
+        self.terms = None
+
+    def reset(self, agents: List[AgentID], initial_state: GameState, shared_info: Dict[str, Any]) -> None:
+        n = len(agents)
+        self.agents = list(agents)
+        self.slots = {agent: i for i, agent in enumerate(self.agents)}
+
+        ball_vel = initial_state.ball.linear_velocity
+        ball_speed = np.linalg.norm(ball_vel)
+        self.last_ball_speed = ball_speed
+        self.last_ball_height = initial_state.ball.position[2]
+        self.last_ball_direction = ball_vel / (ball_speed + 1e-6)
+
+        # Chaque reward garde son propre compteur de touches, comme les classes d'origine
+        self.last_touches = {
+            name: np.zeros(n) for name in (
+                'passing', 'challenge_timing', 'grounded_play', 'powershot', 'backboard', 'advanced_dribbling',
+                'air_dribble', 'musty_aerial', 'ceiling_shot', 'double_tap', 'redirect', 'pinch', 'turtle'
+            )
+        }
+        self.last_toucher = None
+
+        self.last_boost = np.full((2, n), 33.0)  # boost management, small pads
+        self.wait_time = np.zeros(n)
+
+        self.ball_on_car = np.zeros(n, dtype=bool)
+        self.dribble_time = np.zeros(n)
+        self.last_car_pitch = np.zeros(n)
+        self.powerslide_dribble = np.zeros(n, dtype=bool)
+
+        self.bounce_count = np.zeros(n)
+        self.controlling = np.zeros(n, dtype=bool)
+
+        self.air_dribble_active = np.zeros(n, dtype=bool)
+        self.air_touches = np.zeros(n)
+        self.started_from_wall = np.zeros(n, dtype=bool)
+
+        self.jumped = np.zeros(n, dtype=bool)
+        self.jump_time = np.zeros(n)
+        self.had_flip = np.ones((2, n), dtype=bool)  # flip reset, heli reset
+        self.high_spin = np.zeros(n, dtype=bool)
+
+        self.was_on_ceiling = np.zeros(n, dtype=bool)
+        self.aerial_touches = np.zeros(n)
+
+        self.was_airborne = np.zeros(n, dtype=bool)
+        self.airborne_ticks = np.zeros(n)
+        self.consecutive_wavedashes = np.zeros(n)
+        self.last_wavedash_time = np.zeros(n)
+        self.frame_count = 0
+        self.backflip_started = np.zeros(n, dtype=bool)
+        self.initial_direction = np.zeros((2, n))  # cos(yaw), sin(yaw) au début du backflip
+        self.initial_direction[0] = 1.0
+
+        self.flipping = np.zeros(n, dtype=bool)
+        self.flip_start_pitch = np.zeros(n)
+        self.turtle_time = np.zeros(n)
+        self.airborne_time = np.zeros(n)
+        self.stalling = np.zeros(n, dtype=bool)
+        self.on_ceiling_time = np.zeros(n)
+
+        self.terms = None
+
+    def _touched(self, name: str, touches: np.ndarray) -> np.ndarray:
+        return touches > self.last_touches[name]
+
+    def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
+                    is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
+        features = get_step_features(self.agents, state, shared_info)
+        cars = features.cars
+        terms = np.zeros((len(REWARD_TERMS), len(self.agents)))
+        self.terms = terms
+
+        ball_pos = features.ball_pos
+        ball_vel = features.ball_vel
+        ball_speed = features.ball_speed
+        ball_height = features.ball_height
+
+        car_pos = features.car_pos
+        car_vel = features.car_vel
+        car_height = features.car_height
+        touches = features.touches
+        on_ground = features.on_ground
+        in_air = features.in_air
+        has_flip = features.has_flip
+        is_boosting = features.is_boosting
+        is_orange = features.is_orange
+        pitch = features.pitch
+        yaw = features.yaw
+
+        # Quantités partagées par plusieurs détecteurs
+        to_ball = features.to_ball
+        dist_to_ball = features.dist_to_ball
+        horizontal_speed = features.horizontal_speed
+        ang_vel_norm = features.ang_vel_norm
+        goal_sign = features.goal_sign
+        own_goal = features.own_goal
+        opp_goal = features.opp_goal
+        ball_vel_toward_opp = features.ball_vel_toward_opp
+        vel_increase = ball_speed - self.last_ball_speed
+
+        self._fundamentals(terms, cars, to_ball, dist_to_ball, goal_sign, ball_vel, ball_pos)
+        self._team_play(terms, cars, touches, dist_to_ball, is_orange, features.dist_to_own_goal,
+                        features.ball_to_opp_goal, ball_vel_toward_opp, ball_height)
+        self._smart_play(terms, cars, touches, dist_to_ball, features.car_speed, car_height, ball_speed,
+                         ball_height)
+        self._powershots(terms, cars, touches, features.car_side_wall_dist, features.car_back_wall_dist, car_height,
+                         ang_vel_norm, vel_increase, is_orange, ball_pos, ball_height, features.ball_back_wall_dist,
+                         ball_vel_toward_opp)
+        self._dribbling(terms, cars, touches, car_pos, features.car_side_wall_dist, features.car_back_wall_dist,
+                        car_height, pitch, ang_vel_norm, dist_to_ball, vel_increase, ball_pos, ball_vel, ball_height)
+        self._aerials(terms, cars, touches, car_height, in_air, has_flip, is_boosting, pitch, ang_vel_norm,
+                      dist_to_ball, ball_height)
+        self._ceiling_and_double_tap(terms, touches, car_height, features.car_ceiling_dist, on_ground, ball_pos,
+                                     ball_height, ball_vel_toward_opp)
+        self._recoveries(terms, car_height, on_ground, in_air, horizontal_speed, pitch, yaw)
+        self._technical(terms, cars, touches, car_pos, car_vel, car_height, on_ground, in_air, pitch, own_goal,
+                        opp_goal, ball_pos, ball_vel, ball_speed, ball_height, vel_increase, features)
+        self._special(terms, cars, touches, car_height, features.car_ceiling_dist, on_ground, in_air, is_boosting,
+                      horizontal_speed, ball_speed)
+
+        if state.goal_scored:
+            scored = np.where(is_orange, state.scoring_team == 1, state.scoring_team == 0)
+            terms[TERM_INDEX['goal']] = np.where(scored, 10.0, -10.0)
+
+        self.last_ball_speed = ball_speed
+        self.last_ball_height = ball_height
+
+        total = self.weights @ terms
+        return {agent: float(total[self.slots[agent]]) for agent in agents}
+
+    # ------------------------------------------------------------------------
+    # FONDAMENTAUX
+    # ------------------------------------------------------------------------
+
+    @staticmethod
+    def _fundamentals(terms, cars, to_ball, dist_to_ball, goal_sign, ball_vel, ball_pos):
+        valid = dist_to_ball >= 1e-6
+        safe_dist = np.where(valid, dist_to_ball, 1.0)[:, None]
+        dir_to_ball = to_ball / safe_dist
+
+        speed_toward_ball = _dot(cars[:, LIN_VEL], dir_to_ball)
+        terms[TERM_INDEX['velocity_player_to_ball']] = valid * np.clip(
+            speed_toward_ball / common_values.CAR_MAX_SPEED, -1.0, 1.0)
+
+        pitch = cars[:, PITCH]
+        yaw = cars[:, YAW]
+        cos_pitch = np.cos(pitch)
+        facing = (np.cos(yaw) * cos_pitch * dir_to_ball[:, 0]
+                  + np.sin(yaw) * cos_pitch * dir_to_ball[:, 1]
+                  + np.sin(pitch) * dir_to_ball[:, 2])
+        terms[TERM_INDEX['face_ball']] = valid * np.maximum(facing, 0.0)
+
+        # Une seule évaluation par but, indexée par équipe
+        goals = np.array([[0, common_values.BACK_NET_Y, GOAL_Z], [0, -common_values.BACK_NET_Y, GOAL_Z]])
+        to_goal = goals - ball_pos
+        goal_dist = _norm(to_goal)
+        vel_toward_goal = (to_goal / np.where(goal_dist < 1e-6, 1.0, goal_dist)[:, None]) @ ball_vel
+        per_team = np.where(goal_dist < 1e-6, 0.0,
+                            np.maximum(vel_toward_goal / common_values.BALL_MAX_SPEED, 0.0))
+        terms[TERM_INDEX['velocity_ball_to_goal']] = per_team[(goal_sign < 0).astype(int)]
+
+    # ------------------------------------------------------------------------
+    # JEU D'ÉQUIPE
+    # ------------------------------------------------------------------------
+
+    def _team_play(self, terms, cars, touches, dist_to_ball, is_orange, dist_to_own_goal, ball_to_opp_goal,
+                   ball_vel_toward_opp, ball_height):
+        # PASSING - séquentiel par nature (dernier toucheur), mais ne tourne que sur les touches
+        touched = self._touched('passing', touches)
+        passing = terms[TERM_INDEX['passing']]
+        for i in np.flatnonzero(touched):
+            last = self.last_toucher
+            if last is not None and last != i and is_orange[last] == is_orange[i]:
+                if np.linalg.norm(cars[i, POS] - cars[last, POS]) > 800:
+                    base_reward = 8.0
+                    if ball_vel_toward_opp[i] > 500:
+                        base_reward += 6.0
+                    if ball_height > 400:
+                        base_reward += 5.0
+                    passing[i] = base_reward
+                    passing[last] = base_reward * 0.8
+                else:
+                    passing[i] = 0.0
+            else:
+                passing[i] = 0.0
+            self.last_toucher = i
+            self.last_touches['passing'][i] = touches[i]
+
+        # ROTATION - le plus proche attaque, le plus loin couvre
+        rotation = terms[TERM_INDEX['rotation']]
+        for team in (False, True):
+            members = np.flatnonzero(is_orange == team)
+            if len(members) < 2:
+                continue
+            team_dist = dist_to_ball[members]
+            closest = members[np.argmin(team_dist)]
+            farthest = members[np.argmax(team_dist)]
+            if dist_to_ball[closest] < 1000:
+                rotation[closest] = 1.5
+            if farthest != closest and dist_to_own_goal[farthest] < 3000:
+                rotation[farthest] = 1.5
+
+        # SMART POSITIONING
+        terms[TERM_INDEX['smart_positioning']] = np.where(
+            ball_to_opp_goal < 3000,
+            1.0 * ((dist_to_ball > 800) & (dist_to_ball < 2500)),
+            0.8 * ((dist_to_own_goal < 4000) & (dist_to_ball > 1000))
+        )
+
+    # ------------------------------------------------------------------------
+    # BOOST MANAGEMENT & SMART PLAY
+    # ------------------------------------------------------------------------
+
+    def _smart_play(self, terms, cars, touches, dist_to_ball, car_speed, car_height, ball_speed, ball_height):
+        boost = cars[:, BOOST]
+        is_boosting = cars[:, IS_BOOSTING] > 0
+
+        terms[TERM_INDEX['boost_management']] = np.where(
+            is_boosting & (dist_to_ball > 2000), -0.3,
+            np.where(boost > 40, 0.5, 1.0 * (boost > self.last_boost[0] + 10)))
+        self.last_boost[0] = boost
+
+        boost_gained = boost - self.last_boost[1]
+        terms[TERM_INDEX['small_pad_collection']] = np.where(
+            (boost_gained >= 10) & (boost_gained <= 14), 1.5, 1.0 * (boost_gained > 80))
+        self.last_boost[1] = boost
+
+        waiting = (dist_to_ball > 1500) & (car_speed < 1500)
+        engaged = ~waiting & (dist_to_ball < 800)
+        self.wait_time = np.where(waiting, self.wait_time + 1,
+                                  np.where(engaged, 0, np.maximum(0, self.wait_time - 1)))
+        terms[TERM_INDEX['patience']] = np.where(waiting, np.minimum(self.wait_time * 0.05, 1.5), 0.0)
+
+        touched = self._touched('challenge_timing', touches)
+        terms[TERM_INDEX['challenge_timing']] = touched * (3.0 if ball_speed < 800 else
+                                                           -1.0 if ball_speed > 1800 else 0.0)
+        self.last_touches['challenge_timing'][touched] = touches[touched]
+
+        touched = self._touched('grounded_play', touches)
+        if ball_height < 200:
+            grounded = np.where(car_height < 50, 2.0, -0.5 * ((ball_height < 150) & (car_height > 300)))
+            terms[TERM_INDEX['grounded_play']] = touched * grounded
+        self.last_touches['grounded_play'][touched] = touches[touched]
+
+    # ------------------------------------------------------------------------
+    # POWERSHOTS & BACKBOARD
+    # ------------------------------------------------------------------------
+
+    def _powershots(self, terms, cars, touches, car_side_wall_dist, car_back_wall_dist, car_height, ang_vel_norm,
+                    vel_increase, is_orange, ball_pos, ball_height, ball_back_wall_dist, ball_vel_toward_opp):
+        touched = self._touched('powershot', touches)
+        if vel_increase > 800:
+            is_on_wall = (car_side_wall_dist < 596) | (car_back_wall_dist < 620)  # |x| > 3500 ou |y| > 4500
+            is_upside_down = cars[:, UP_Z] < -0.5
+            is_aerial = car_height > 300
+            is_air_rolling = ang_vel_norm > 3.0
+            base_reward = (5.0
+                           + 3.0 * is_on_wall
+                           + 4.0 * is_upside_down
+                           + 3.5 * is_air_rolling
+                           + 4.0 * (is_aerial & ~is_on_wall)
+                           + 2.0 * (~is_aerial & ~is_on_wall & (car_height < 50))
+                           + 5.0 * ((is_upside_down & is_air_rolling)
+                                    | (is_aerial & is_air_rolling & (vel_increase > 1200))))
+            terms[TERM_INDEX['powershot']] = touched * base_reward
+        self.last_touches['powershot'][touched] = touches[touched]
+
+        if ball_height > 500 and ball_back_wall_dist < 1120:
+            touched = self._touched('backboard', touches)
+            # Clear = balle plus proche de notre but que du leur
+            own_goal_y = np.where(is_orange, common_values.BACK_NET_Y, -common_values.BACK_NET_Y)
+            is_defensive = np.abs(ball_pos[1] - own_goal_y) < np.abs(ball_pos[1] + own_goal_y)
+            backboard = np.where(is_defensive,
+                                 np.where(ball_vel_toward_opp > 500, 8.0, 3.0),
+                                 np.where(ball_vel_toward_opp > 800, 10.0, 4.0))
+            terms[TERM_INDEX['backboard']] = touched * backboard
+            self.last_touches['backboard'][touched] = touches[touched]
+
+    # ------------------------------------------------------------------------
+    # DRIBBLING AVANCÉ
+    # ------------------------------------------------------------------------
+
+    def _dribbling(self, terms, cars, touches, car_pos, car_side_wall_dist, car_back_wall_dist, car_height, pitch,
+                   ang_vel_norm, dist_to_ball, vel_increase, ball_pos, ball_vel, ball_height):
+        # Flicks
+        above_car = ball_pos[2] - car_height
+        horizontal_dist = _norm(ball_pos[:2] - car_pos[:, :2])
+        on_roof = (above_car > 80) & (above_car < 250) & (horizontal_dist < 120)
+        handbrake = cars[:, HANDBRAKE] > 0
+        flick = ~on_roof & self.ball_on_car
+
+        self.dribble_time[on_roof] += 1
+        self.powerslide_dribble |= on_roof & handbrake
+
+        dribbling = on_roof * np.where(handbrake, 1.5, 0.8)
+        if vel_increase > 600 and flick.any():
+            # Type de flick selon l'angle et la vitesse, du plus au moins spécifique
+            pitch_change = np.abs(pitch - self.last_car_pitch)
+            flick_reward = np.where(self.powerslide_dribble, 9.0, 6.0)
+            flick_reward[self.dribble_time > 60] = 11.0
+            for min_pitch, min_vel, reward in ((0.2, 800, 8.0), (0.4, 1000, 10.0), (0.6, 1200, 12.0),
+                                               (0.8, 1500, 15.0)):
+                if vel_increase > min_vel:
+                    flick_reward[pitch_change > min_pitch] = reward
+            if vel_increase > 1100:
+                flick_reward[car_height < 30] = 13.0
+            if vel_increase > 1300:
+                flick_reward[ang_vel_norm > 4.0] = 16.0
+            dribbling += flick * flick_reward
+        terms[TERM_INDEX['advanced_dribbling']] = dribbling
+        self.ball_on_car = on_roof | (self.ball_on_car & ~flick)
+        self.dribble_time[flick] = 0
+        self.powerslide_dribble[flick] = False
+        self.last_car_pitch = pitch
+        self.last_touches['advanced_dribbling'] = touches
+
+        # Bounce dribble
+        near_ball = dist_to_ball < 400
+        if ball_height < 200 and ball_vel[2] > 0 and self.last_ball_height < ball_height:
+            self.bounce_count[near_ball] += 1
+            self.controlling |= near_ball
+        self.bounce_count[~near_ball] = 0
+        self.controlling &= near_ball
+        terms[TERM_INDEX['bounce_dribble']] = np.where(self.controlling, np.minimum(self.bounce_count * 0.5, 5.0),
+                                                       0.0)
+
+        # Air dribble (ground to air / wall to air)
+        touched = self._touched('air_dribble', touches)
+        is_near_wall = (car_side_wall_dist < 1096) | (car_back_wall_dist < 1120)  # |x| > 3000 ou |y| > 4000
+        dribbling = (ball_height > 200) & (car_height > 150) & (dist_to_ball < 300)
+        new_touch = dribbling & touched
+        self.air_touches[new_touch] += 1
+        self.air_dribble_active |= new_touch
+        self.started_from_wall |= new_touch & is_near_wall
+
+        ongoing = np.minimum(self.air_touches * 1.5, 10.0) * np.where(self.started_from_wall, 1.8, 1.0)
+        finished = np.where(self.started_from_wall, 5.0, 3.0) * (self.air_touches >= 2)
+        terms[TERM_INDEX['air_dribble']] = np.where(self.air_dribble_active,
+                                                    np.where(dribbling, ongoing, finished), 0.0)
+        ended = ~dribbling
+        self.air_dribble_active[ended] = False
+        self.air_touches[ended] = 0
+        self.started_from_wall[ended] = False
+        self.last_touches['air_dribble'] = touches
+
+    # ------------------------------------------------------------------------
+    # AERIALS PRO
+    # ------------------------------------------------------------------------
+
+    def _aerials(self, terms, cars, touches, car_height, in_air, has_flip, is_boosting, pitch, ang_vel_norm,
+                 dist_to_ball, ball_height):
+        airborne = in_air & (car_height > 100)
+        self.jump_time[airborne & ~self.jumped] = 0
+        self.jump_time[airborne] += 1
+        self.jumped = airborne
+        fast_aerial = airborne & (cars[:, LIN_VEL][:, 2] > 1000) & is_boosting & (self.jump_time < 30)
+        high_ball = (ball_height > 600) & (dist_to_ball < 500)
+        terms[TERM_INDEX['fast_aerial']] = fast_aerial * np.where(high_ball, 4.0, 2.0)
+
+        regained = ~self.had_flip[0] & has_flip
+        terms[TERM_INDEX['flip_reset']] = 20.0 * (regained & (car_height > 200) & (dist_to_ball < 250))
+        self.had_flip[0] = has_flip
+
+        touched = self._touched('musty_aerial', touches)
+        terms[TERM_INDEX['musty_aerial']] = 18.0 * (touched & (car_height > 200) & (pitch < -0.5))
+        self.last_touches['musty_aerial'][touched] = touches[touched]
+
+        self.high_spin |= (car_height > 200) & (ang_vel_norm > 5.0)
+        heli = ~self.had_flip[1] & has_flip & self.high_spin
+        terms[TERM_INDEX['heli_reset']] = 25.0 * heli
+        self.high_spin[heli] = False
+        self.had_flip[1] = has_flip
+
+    # ------------------------------------------------------------------------
+    # CEILING & DOUBLE TAP
+    # ------------------------------------------------------------------------
+
+    def _ceiling_and_double_tap(self, terms, touches, car_height, car_ceiling_dist, on_ground, ball_pos, ball_height,
+                                ball_vel_toward_opp):
+        self.was_on_ceiling |= car_ceiling_dist < 144
+        touched = self.was_on_ceiling & self._touched('ceiling_shot', touches)
+        shot = touched & (car_height > 500) & (ball_pos[2] > 400)
+        terms[TERM_INDEX['ceiling_shot']] = shot * np.where(ball_vel_toward_opp > 500, 15.0, 8.0)
+        self.was_on_ceiling[shot | on_ground] = False
+        self.last_touches['ceiling_shot'][touched] = touches[touched]
+
+        aerial_touch = self._touched('double_tap', touches) & (ball_height > 300) & (car_height > 200)
+        self.aerial_touches[aerial_touch] += 1
+        double_tap = aerial_touch & (self.aerial_touches == 2)
+        terms[TERM_INDEX['double_tap']] = 18.0 * double_tap
+        self.aerial_touches[double_tap | on_ground] = 0
+        self.last_touches['double_tap'][aerial_touch] = touches[aerial_touch]
+
+    # ------------------------------------------------------------------------
+    # RECOVERIES AVANCÉES
+    # ------------------------------------------------------------------------
+
+    def _recoveries(self, terms, car_height, on_ground, in_air, horizontal_speed, pitch, yaw):
+        airborne = (car_height > 20) & in_air
+        self.was_airborne |= airborne
+        self.airborne_ticks[airborne] += 1
+        landed = self.was_airborne & on_ground
+        terms[TERM_INDEX['wavedash']] = 5.0 * (landed & (self.airborne_ticks < 20) & (horizontal_speed > 1800))
+        self.was_airborne[landed] = False
+        self.airborne_ticks[landed] = 0
+
+        self.frame_count += 1
+        dashing = on_ground & (horizontal_speed > 1800)
+        chained = dashing & (self.frame_count - self.last_wavedash_time < 60)
+        self.consecutive_wavedashes = np.where(chained, self.consecutive_wavedashes + 1,
+                                               np.where(dashing, 1, self.consecutive_wavedashes))
+        terms[TERM_INDEX['chain_dash']] = chained * np.minimum(self.consecutive_wavedashes * 2.0, 12.0)
+        self.last_wavedash_time[dashing] = self.frame_count
+
+        cos_yaw = np.cos(yaw)
+        sin_yaw = np.sin(yaw)
+        started = in_air & (pitch < -0.8) & ~self.backflip_started
+        self.initial_direction[0, started] = cos_yaw[started]
+        self.initial_direction[1, started] = sin_yaw[started]
+        self.backflip_started |= started
+        finished = self.backflip_started & on_ground
+        dot = self.initial_direction[0] * cos_yaw + self.initial_direction[1] * sin_yaw
+        terms[TERM_INDEX['half_flip']] = 8.0 * (finished & (dot < -0.7))
+        self.backflip_started[finished] = False
+
+    # ------------------------------------------------------------------------
+    # MÉCANIQUES TECHNIQUES
+    # ------------------------------------------------------------------------
+
+    def _technical(self, terms, cars, touches, car_pos, car_vel, car_height, on_ground, in_air, pitch, own_goal,
+                   opp_goal, ball_pos, ball_vel, ball_speed, ball_height, vel_increase, features):
+        # Redirect
+        if ball_speed > 10:
+            current_ball_direction = ball_vel / ball_speed
+        else:
+            current_ball_direction = self.last_ball_direction
+        touched = self._touched('redirect', touches) & (ball_height > 300) & (car_height > 200)
+        if touched.any():
+            direction_change = 1.0 - np.dot(self.last_ball_direction, current_ball_direction)
+            if direction_change > 0.4:
+                to_goal = opp_goal - ball_pos
+                to_goal_dir = to_goal / (_norm(to_goal) + 1e-6)[:, None]
+                goal_alignment = np.maximum(0, to_goal_dir @ current_ball_direction)
+                terms[TERM_INDEX['redirect']] = touched * 10.0 * direction_change * (1 + goal_alignment)
+        self.last_touches['redirect'][touched] = touches[touched]
+        self.last_ball_direction = current_ball_direction
+
+        # Pinch
+        touched = self._touched('pinch', touches)
+        if vel_increase > 1500:
+            if features.ball_back_wall_dist < 320 and abs(ball_pos[0]) < 1000:
+                base_reward = 25.0
+            elif features.ball_ceiling_dist < 244:
+                base_reward = 18.0
+            elif features.ball_side_wall_dist < 296 or features.ball_back_wall_dist < 320:
+                base_reward = 15.0
+            elif ball_pos[2] < 200:
+                base_reward = 14.0
+            else:
+                base_reward = 12.0
+            terms[TERM_INDEX['pinch']] = touched * base_reward
+        self.last_touches['pinch'][touched] = touches[touched]
+
+        # Shadow defense
+        to_goal = own_goal - ball_pos
+        to_car = car_pos - ball_pos
+        car_to_goal = own_goal - car_pos
+        dist_ball_goal = _norm(to_goal)
+        dist_ball_car = _norm(to_car)
+        dist_car_goal = _norm(car_to_goal)
+        valid = (dist_ball_goal > 1e-6) & (dist_ball_car > 1e-6)
+        alignment = _dot(to_goal, to_car) / (np.where(valid, dist_ball_goal, 1.0) * np.where(valid, dist_ball_car, 1.0))
+        vel_toward_goal = _dot(car_vel, car_to_goal) / (dist_car_goal + 1e-6)
+        terms[TERM_INDEX['shadow_defense']] = 3.0 * (valid & (alignment > 0.85) & (vel_toward_goal > 500)
+                                                     & (dist_car_goal < 2000))
+
+        # Flip cancel
+        pitch_vel = np.abs(cars[:, ANG_VEL][:, 1])
+        started = (pitch_vel > 3.0) & in_air & ~self.flipping
+        self.flip_start_pitch[started] = pitch[started]
+        self.flipping |= started
+        stopped = self.flipping & (pitch_vel < 1.0)
+        pitch_change = np.abs(pitch - self.flip_start_pitch)
+        terms[TERM_INDEX['flip_cancel']] = 7.0 * (stopped & (pitch_change > 0.3) & (pitch_change < 1.3))
+        self.flipping[stopped | on_ground] = False
+
+    # ------------------------------------------------------------------------
+    # MÉCANIQUES SPÉCIALES
+    # ------------------------------------------------------------------------
+
+    def _special(self, terms, cars, touches, car_height, car_ceiling_dist, on_ground, in_air, is_boosting,
+                 horizontal_speed, ball_speed):
+        turtling = (cars[:, UP_Z] < -0.8) & on_ground
+        touched = self._touched('turtle', touches)
+        self.turtle_time = np.where(turtling, self.turtle_time + 1, 0)
+        turtle_shot = 15.0 if ball_speed > 1500 else 10.0
+        terms[TERM_INDEX['turtle']] = turtling * np.where(touched, turtle_shot, 0.5)
+        self.last_touches['turtle'] = touches
+
+        airborne = in_air & (car_height > 200)
+        self.airborne_time = np.where(airborne, self.airborne_time + 1, 0)
+        self.stalling = airborne & ~is_boosting & (np.abs(cars[:, LIN_VEL][:, 2]) < 100) & (car_height > 300)
+        terms[TERM_INDEX['stall']] = self.stalling * np.minimum(self.airborne_time * 0.1, 8.0)
+
+        on_ceiling = (car_ceiling_dist < 144) & on_ground
+        self.on_ceiling_time = np.where(on_ceiling, self.on_ceiling_time + 1, 0)
+        terms[TERM_INDEX['ceiling_shuffle']] = on_ceiling * np.where(horizontal_speed > 1200, 4.0, 1.0)
+
+
+# ============================================================================
+# TEST DE PARITÉ AVEC LES CLASSES INDIVIDUELLES
+# ============================================================================
+
+def _random_state(rng: np.random.Generator, agents: List[int], tick: int, prev: Optional[GameState]) -> GameState:
+    from rlgym.rocket_league.api import Car, PhysicsObject
+
+    def physics(position, velocity, ang_vel, euler):
+        p = PhysicsObject()
+        p.position = position.astype(np.float32)
+        p.linear_velocity = velocity.astype(np.float32)
+        p.angular_velocity = ang_vel.astype(np.float32)
+        p._quaternion = p._rotation_mtx = p._euler_angles = None
+        p.euler_angles = euler.astype(np.float32)
+        return p
+
+    state = GameState()
+    state.tick_count = tick
+    state.config = None
+    state.boost_pad_timers = np.zeros(34, dtype=np.float32)
+    state._inverted_ball = state._inverted_boost_pad_timers = None
+
+    ball_pos = rng.uniform([-4000, -5100, 93], [4000, 5100, 2000])
+    state.ball = physics(ball_pos, rng.normal(0, 1500, 3), rng.normal(0, 3, 3), np.zeros(3))
+    state.goal_scored = bool(rng.random() < 0.02)
+
+    state.cars = {}
+    for agent in agents:
+        car = Car()
+        car.team_num = agent % 2
+        car.hitbox_type = 0
+        car.ball_touches = int(rng.random() < 0.3) * int(rng.integers(1, 3))
+        car.bump_victim_id = None
+        car.demo_respawn_timer = 0.0
+        car.wheels_with_contact = (rng.random() < 0.5,) * 4
+        car.supersonic_time = 0.0
+        car.boost_amount = float(rng.choice([rng.uniform(0, 100), prev.cars[agent].boost_amount + 12
+                                             if prev is not None else 33.0]))
+        car.boost_active_time = float(rng.random() < 0.5) * 0.05
+        car.handbrake = float(rng.random() < 0.3)
+        car.is_jumping = car.has_jumped = car.is_holding_jump = False
+        car.jump_time = 0.0
+        car.has_flipped = bool(rng.random() < 0.5)
+        car.has_double_jumped = False
+        car.air_time_since_jump = 0.0
+        car.flip_time = 0.0
+        car.flip_torque = np.zeros(3)
+        car.is_autoflipping = False
+        car.autoflip_timer = 0.0
+        car.autoflip_direction = 1.0
+
+        if rng.random() < 0.4:  # Balle sur le toit / proche pour déclencher dribbles, flicks, resets
+            position = ball_pos - [rng.normal(0, 60), rng.normal(0, 60), rng.uniform(50, 300)]
+        else:
+            position = rng.uniform([-4096, -5120, 17], [4096, 5120, 2044])
+        euler = rng.uniform([-np.pi / 2, -np.pi, -np.pi], [np.pi / 2, np.pi, np.pi])
+        car.physics = physics(position, rng.normal(0, 1200, 3), rng.normal(0, 3, 3), euler)
+        car._inverted_physics = None
+        state.cars[agent] = car
+    return state
+
+
+if __name__ == '__main__':
+    from pro_training import build_combined_reward
+
+    rng = np.random.default_rng(0)
+    agents = [0, 1, 2, 3]
+    reference = build_combined_reward()
+    batched = BatchedProReward()
+    assert tuple(w for _, w in REWARD_TERMS) == reference.weights, "Weights out of sync with build_combined_reward"
+
+    n_episodes, n_steps = 20, 300
+    max_error = 0.0
+    for episode in range(n_episodes):
+        state = _random_state(rng, agents, 0, None)
+        shared_info = {}
+        reference.reset(agents, state, shared_info)
+        batched.reset(agents, state, shared_info)
+        for step in range(1, n_steps):
+            state = _random_state(rng, agents, step, state)
+            expected = {agent: 0.0 for agent in agents}
+            per_class = []
+            for reward_fn, weight in zip(reference.reward_fns, reference.weights):
+                rewards = reward_fn.get_rewards(agents, state, {}, {}, shared_info)
+                per_class.append([rewards[agent] for agent in agents])
+                for agent in agents:
+                    expected[agent] += rewards[agent] * weight
+            actual = batched.get_rewards(agents, state, {}, {}, shared_info)
+
+            for (name, _), ref_term, term in zip(REWARD_TERMS, per_class, batched.terms):
+                if not np.allclose(ref_term, term, rtol=1e-5, atol=1e-5):
+                    raise AssertionError(f"{name} mismatch at episode {episode} step {step}: {ref_term} vs {term}")
+            for agent in agents:
+                max_error = max(max_error, abs(expected[agent] - actual[agent]))
+
+    print(f"Parity OK over {n_episodes * n_steps} steps (max abs error {max_error:.2e})")
+
+    import timeit
+
+    # Un nouveau GameState par step, comme dans l'env : le cache de features est recalculé à chaque fois.
+    # Meilleur de 5 passes (les moyennes bougent beaucoup d'une machine chargée à l'autre)
+    for n_agents in (2, 4, 6):
+        bench_agents = list(range(n_agents))
+        states = [_random_state(rng, bench_agents, 0, None)]
+        for step in range(1, n_steps):
+            states.append(_random_state(rng, bench_agents, step, states[-1]))
+
+        def run(reward_fn):
+            shared_info = {}
+            reward_fn.reset(bench_agents, states[0], shared_info)
+            for s in states:
+                reward_fn.get_rewards(bench_agents, s, {}, {}, shared_info)
+
+        t_ref = min(timeit.repeat(lambda: run(reference), number=1, repeat=5)) / n_steps
+        t_batched = min(timeit.repeat(lambda: run(batched), number=1, repeat=5)) / n_steps
+        print(f"{n_agents} agents: CombinedReward {1e6 * t_ref:.1f} us/step, "
+              f"BatchedProReward {1e6 * t_batched:.1f} us/step ({t_ref / t_batched:.2f}x)")
@@ -6,18 +6,17 @@ from gym import Space
 from gym.spaces import Tuple, Box
 from numba import njit
 from rlgym.gym import Gym
-from rlgym.utils import ObsBuilder
-from rlgym.utils.action_parsers import DefaultAction
 from rlgym.utils.common_values import BOOST_LOCATIONS
-from rlgym.utils.gamestates import GameState, PlayerData
+from rlgym.utils.gamestates import GameState
 
 from rocket_learn.utils.batched_obs_builder import BatchedObsBuilder
-from rocket_learn.utils.gamestate_encoding import encode_gamestate
 from rocket_learn.utils.gamestate_encoding import StateConstants as SC
 
 # from training.scoreboard import Scoreboard
 from rocket_learn.utils.scoreboard import Scoreboard
 
+from zenitobot_timers import update_timers
+
 IS_SELF, IS_MATE, IS_OPP, IS_BALL, IS_BOOST = range(5)
 POS = slice(5, 8)
 LIN_VEL = slice(8, 11)
@@ -33,12 +32,38 @@ GOAL_DIFF, TIME_LEFT, IS_OVERTIME = range(33, 36)
 # ACTIONS = range(24, 32)
 
 
+@njit
+def _relative_rotation(fx, fy, fz, ux, uy, uz):
+    """
+    Rotations of add_relative_components for one observer: cosine and sine of the yaw, then the full rotation row
+    by row. The cosines and sines of the angles come from normalizing the pairs they are arctan2'd from.
+    """
+    horizontal = np.sqrt(fx * fx + fy * fy)
+    cy, sy = (fx / horizontal, fy / horizontal) if horizontal > 0 else (1., 0.)
+    hypot = np.sqrt(fz * fz + horizontal * horizontal)
+    cp, sp = (horizontal / hypot, fz / hypot) if hypot > 0 else (1., 0.)
+    lz = ux * fy - uy * fx  # Z of the left vector, up x forward
+    hypot = np.sqrt(lz * lz + uz * uz)
+    cr, sr = (uz / hypot, lz / hypot) if hypot > 0 else (1., 0.)
+    return (cy, sy,
+            cp * cy, sr * sp * cy - cr * sy, -(cr * sp * cy + sr * sy),
+            cp * sy, sr * sp * sy + cr * cy, -(cr * sp * sy - sr * cy),
+            sp, -cp * sr, cp * cr)
+
+
 class ZenitobotObsBuilder(BatchedObsBuilder):
     _boost_locations = np.array(BOOST_LOCATIONS)
     _invert = np.array([1] * 5 + [-1, -1, 1] * 5 + [1] * 5 + [1] * 30)
     _norm = np.array([1.] * 5 + [2300] * 6 + [1] * 6 + [5.5] * 3 + [1, 10, 1, 1, 1] + [1] * 30)
-
-    def __init__(self, scoreboard: Scoreboard, env: Gym = None, n_players=6, tick_skip=8):
+    # Encoded player columns read by the fused builder: pos, lin vel, quat, ang vel, boost, on ground, has flip/jump
+    _player_columns = np.r_[SC.CAR_POS_X.start:SC.CAR_POS_Z.start + 1,
+                            SC.CAR_LINEAR_VEL_X.start:SC.CAR_LINEAR_VEL_Z.start + 1,
+                            SC.CAR_QUAT_W.start:SC.CAR_QUAT_Z.start + 1,
+                            SC.CAR_ANGULAR_VEL_X.start:SC.CAR_ANGULAR_VEL_Z.start + 1,
+                            SC.BOOST_AMOUNT.start, SC.ON_GROUND.start, SC.HAS_FLIP.start, SC.HAS_JUMP.start]
+
+    def __init__(self, scoreboard: Scoreboard, env: Gym = None, n_players=6, tick_skip=8, fused=True,
+                 reuse_buffers=False, incremental=False, dtype=np.float32):
         super().__init__(scoreboard)
         self.env = env
         self.n_players = n_players
@@ -48,6 +73,18 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         self.current_qkv = None
         self.current_mask = None
         self.tick_skip = tick_skip
+        self.fused = fused  # False falls back to the numpy implementation below
+        # Of the obs arrays, the model runs in float32 anyway. The fused builder computes in float64 and only stores
+        # in dtype, the numpy one computes the relative components in dtype (float64 for the reference)
+        self.dtype = dtype
+        # Overwrite the same q/kv/m arrays on every call, only safe if the caller copies the obs it keeps
+        # Incremental (fused only) goes further and leaves the static columns (entity flags, boost pads, mask) of the
+        # previous obs in place, so it implies reuse_buffers
+        self.incremental = incremental
+        self.reuse_buffers = reuse_buffers or incremental
+        self._buffers = None
+        self._static = None  # kv buffer holding the static columns and the teams they were written for
+        self._pad_rows = self._normalized_pad_rows()
 
     def _reset(self, initial_state: GameState):
         self.demo_timers = np.zeros(self.n_players or len(initial_state.players))
@@ -132,77 +169,237 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         kv[..., POS.start + 1:ANG_VEL.stop:3] = ny  # y-components
 
     @staticmethod
-    def add_relative_components(q, kv):
+    def relative_frames(q):
+        """
+        Rotations applied by add_relative_components, (..., 6, 3) for q (..., n_features): the yaw-only rotation in
+        the first 3 rows and the full one in the last 3, same as _relative_rotation.
+        """
+        def cos_sin(y, x):  # Of arctan2(y, x), without the trig round trip
+            hypot = np.sqrt(x ** 2 + y ** 2)
+            zero = hypot == 0
+            hypot[zero] = 1
+            return np.where(zero, 1, x / hypot), np.where(zero, 0, y / hypot)
+
         forward = q[..., FW]
         up = q[..., UP]
-        left = np.cross(up, forward)
+        cy, sy = cos_sin(forward[..., 1], forward[..., 0])
+        cp, sp = cos_sin(forward[..., 2], np.sqrt(forward[..., 0] ** 2 + forward[..., 1] ** 2))
+        cr, sr = cos_sin(up[..., 0] * forward[..., 1] - up[..., 1] * forward[..., 0], up[..., 2])
+
+        frames = np.zeros(q.shape[:-1] + (6, 3), dtype=q.dtype)
+        frames[..., 0, 0] = frames[..., 1, 1] = cy
+        frames[..., 0, 1] = -sy
+        frames[..., 1, 0] = sy
+        frames[..., 2, 2] = 1
+        frames[..., 3, :] = np.stack((cp * cy, sr * sp * cy - cr * sy, -(cr * sp * cy + sr * sy)), axis=-1)
+        frames[..., 4, :] = np.stack((cp * sy, sr * sp * sy + cr * cy, -(cr * sp * sy - sr * cy)), axis=-1)
+        frames[..., 5, :] = np.stack((sp, -cp * sr, cp * cr), axis=-1)
+        return frames
 
-        pitch = np.arctan2(forward[..., 2], np.sqrt(forward[..., 0] ** 2 + forward[..., 1] ** 2))
-        yaw = np.arctan2(forward[..., 1], forward[..., 0])
-        roll = np.arctan2(left[..., 2], up[..., 2])
-
-        pitch = np.expand_dims(pitch, axis=-1)
-        yaw = np.expand_dims(yaw, axis=-1)
-        roll = np.expand_dims(roll, axis=-1)
-
-        cr = np.cos(roll)
-        sr = np.sin(roll)
-        cp = np.cos(pitch)
-        sp = np.sin(pitch)
-        cy = np.cos(yaw)
-        sy = np.sin(yaw)
-
-        # Each of these holds 5 values for each player for each tick
+    @staticmethod
+    def add_relative_components(q, kv):
+        # Each entity holds 5 vectors (pos, lin vel, fw, up, ang vel), all rotated with one matmul per observer
         vals = kv[..., POS.start:ANG_VEL.stop]
         vals[..., POS.start:LIN_VEL.stop] -= q[..., POS.start:LIN_VEL.stop]
-        xs = vals[..., 0::3]
-        ys = vals[..., 1::3]
-        zs = vals[..., 2::3]
-
-        # Rotation matrix with only yaw
-        flip_relative_xs = cy * xs - sy * ys
-        flip_relative_ys = sy * xs + cy * ys
-        flip_relative_zs = zs
+        vectors = vals.reshape(vals.shape[:-1] + (5, 3))
+        rotated = np.matmul(ZenitobotObsBuilder.relative_frames(q), vectors.swapaxes(-1, -2))
 
-        # Now full rotation matrix
-        car_relative_xs = cp * cy * xs + (sr * sp * cy - cr * sy) * ys - (cr * sp * cy + sr * sy) * zs
-        car_relative_ys = cp * sy * xs + (sr * sp * sy + cr * cy) * ys - (cr * sp * sy - sr * cy) * zs
-        car_relative_zs = sp * xs - cp * sr * ys + cp * cr * zs
+        # x, y and z of the 5 vectors with the yaw-only rotation, then with the full one
+        kv[..., ACTIONS.start:] = rotated.reshape(rotated.shape[:-2] + (30,))
 
-        all_rows = np.concatenate(
-            (flip_relative_xs, flip_relative_ys, flip_relative_zs,
-             car_relative_xs, car_relative_ys, car_relative_zs), axis=-1)
-        kv[..., ACTIONS.start:] = all_rows
+    @staticmethod
+    @njit
+    def add_relative_components_njit(q, kv):
+        """Loop version of add_relative_components for (n_players, n_states, n_entities, n_features) kv"""
+        n_players, n_states, n_entities, n_features = kv.shape
+        n_base = HAS_JUMP + 1
+        for p in range(n_players):
+            for t in range(n_states):
+                self_row = q[p, t, 0]
+                fx, fy, fz = self_row[FW.start], self_row[FW.start + 1], self_row[FW.start + 2]
+                ux, uy, uz = self_row[UP.start], self_row[UP.start + 1], self_row[UP.start + 2]
+                cy, sy, xx, xy, xz, yx, yy, yz, zx, zy, zz = _relative_rotation(fx, fy, fz, ux, uy, uz)
+                for e in range(n_entities):
+                    row = kv[p, t, e]
+                    for c in range(LIN_VEL.stop - POS.start):
+                        row[LIN_VEL.stop - 1 + c] -= self_row[POS.start + c]
+                    for k in range(5):
+                        xs = row[POS.start + 3 * k]
+                        ys = row[POS.start + 3 * k + 1]
+                        zs = row[POS.start + 3 * k + 2]
+                        row[n_base + k] = cy * xs - sy * ys
+                        row[n_base + 5 + k] = sy * xs + cy * ys
+                        row[n_base + 10 + k] = zs
+                        row[n_base + 15 + k] = xx * xs + xy * ys + xz * zs
+                        row[n_base + 20 + k] = yx * xs + yy * ys + yz * zs
+                        row[n_base + 25 + k] = zx * xs + zy * ys + zz * zs
+
+    def _normalized_pad_rows(self):
+        """Normalized boost pad rows for a blue and an orange observer, without the timers"""
+        n_base = HAS_JUMP + 1
+        rows = np.zeros((2, len(self._boost_locations), n_base))
+        rows[:, :, IS_BOOST] = 1
+        rows[:, :, POS] = self._boost_locations
+        rows[:, :, BOOST] = 1
+        rows[1] *= self._invert[:n_base]
+        rows[1, :, [IS_MATE, IS_OPP]] = rows[1, :, [IS_OPP, IS_MATE]]
+        rows /= self._norm[:n_base]
+        return rows
 
     @staticmethod
     @njit
-    def _update_timers(boost_timers, self_boost_locations, demo_timers, self_tick_skip,
-                       boost_states: np.ndarray, demo_states: np.ndarray):
-        for i in range(1, boost_timers.shape[0]):
-            for b in range(boost_states.shape[1]):
-                if boost_states[i - 1, b] == 0:  # Not available
-                    prev_timer = boost_timers[i - 1, b]
-                    if prev_timer > 0:
-                        boost_timers[i, b] = max(0, prev_timer - self_tick_skip / 120)
-                    elif self_boost_locations[b, 2] > 72:
-                        boost_timers[i, b] = 10
+    def _fused_build_obs(encoded_players, ball, player_columns, teams, pad_rows, boost_timers, demo_timers,
+                         goal_diff, time_left, is_overtime, invert, norm, write_static, q, kv, m):
+        """
+        Writes the final q, kv and m (normalized, team-inverted and with relative components) in a single pass,
+        with the exact same values as the numpy implementation in batched_build_obs.
+        If write_static is False, kv and m must already hold the columns that do not depend on the state (entity
+        flags, everything but the timers and relative components of the boost pads, the mask) and they are skipped.
+        """
+        n_players, n_states, n_entities, n_features = kv.shape
+        n_base = HAS_JUMP + 1
+        lim_players = n_entities - 1 - pad_rows.shape[1]
+        base = np.zeros((lim_players + 1, n_base))  # Raw player and ball values, shared by every observer
+        self_row = np.zeros(n_base)
+        row = np.zeros(n_base)
+
+        for t in range(n_states):
+            base[:] = 0
+
+            for j in range(n_players):
+                player = encoded_players[t, j]
+                b = base[j]
+                b[IS_MATE] = 1 - teams[j]  # Default team is blue
+                b[IS_OPP] = teams[j]
+                for k in range(3):
+                    b[POS.start + k] = player[player_columns[k]]
+                    b[LIN_VEL.start + k] = player[player_columns[3 + k]]
+                    b[ANG_VEL.start + k] = player[player_columns[10 + k]]
+
+                # Forward and up columns of rlgym's quat_to_rot_mtx
+                qw = player[player_columns[6]]
+                qx = player[player_columns[7]]
+                qy = player[player_columns[8]]
+                qz = player[player_columns[9]]
+                quat_norm = qw * qw + qx * qx + qy * qy + qz * qz
+                if quat_norm != 0:
+                    w, x, y, z = -qw, -qx, -qy, -qz
+                    s = 1.0 / quat_norm
+                    b[FW.start] = 1.0 - 2.0 * s * (y * y + z * z)
+                    b[FW.start + 1] = 2.0 * s * (x * y + z * w)
+                    b[FW.start + 2] = 2.0 * s * (x * z - y * w)
+                    b[UP.start] = 2.0 * s * (x * z + y * w)
+                    b[UP.start + 1] = 2.0 * s * (y * z - x * w)
+                    b[UP.start + 2] = 1.0 - 2.0 * s * (x * x + y * y)
+
+                b[BOOST] = min(max(player[player_columns[13]], 0.), 2.)
+                b[DEMO] = demo_timers[t, j]
+                b[ON_GROUND] = player[player_columns[14]]
+                b[HAS_FLIP] = player[player_columns[15]]
+                b[HAS_JUMP] = player[player_columns[16]]
+
+            b = base[lim_players]
+            b[IS_BALL] = 1
+            b[POS] = ball[t, 0:3]
+            b[LIN_VEL] = ball[t, 3:6]
+            b[ANG_VEL] = ball[t, 6:9]
+
+            for p in range(n_players):
+                orange = teams[p] == 1
+
+                for c in range(n_base):
+                    v = 1. if c == IS_SELF else base[p, c]
+                    if orange:
+                        v *= invert[c]
+                    self_row[c] = v / norm[c]
+                if orange:
+                    self_row[IS_MATE], self_row[IS_OPP] = self_row[IS_OPP], self_row[IS_MATE]
+
+                q_row = q[p, t, 0]
+                q_row[:n_base] = self_row
+                q_row[n_base:GOAL_DIFF] = 0
+                if teams[p] == 0:
+                    q_row[GOAL_DIFF] = goal_diff[t]
+                elif orange:
+                    q_row[GOAL_DIFF] = -goal_diff[t]
+                else:
+                    q_row[GOAL_DIFF] = 0
+                q_row[TIME_LEFT] = time_left[t]
+                q_row[IS_OVERTIME] = is_overtime[t]
+
+                # Same rotations as add_relative_components
+                fx, fy, fz = self_row[FW.start], self_row[FW.start + 1], self_row[FW.start + 2]
+                ux, uy, uz = self_row[UP.start], self_row[UP.start + 1], self_row[UP.start + 2]
+                cy, sy, xx, xy, xz, yx, yy, yz, zx, zy, zz = _relative_rotation(fx, fy, fz, ux, uy, uz)
+
+                for e in range(n_entities):
+                    is_pad = e > lim_players
+                    if is_pad:
+                        pad_row = pad_rows[1 if orange else 0, e - lim_players - 1]
+                        for c in range(n_base):
+                            row[c] = pad_row[c]
+                        v = boost_timers[t, e - lim_players - 1]
+                        if orange:
+                            v *= invert[DEMO]
+                        row[DEMO] = v / norm[DEMO]
                     else:
-                        boost_timers[i, b] = 4
-                else:  # Available
-                    boost_timers[i, b] = 0
-
-        for i in range(1, demo_timers.shape[0]):
-            for b in range(demo_states.shape[1]):
-                if demo_states[i - 1, b] == 1:  # Demoed
-                    prev_timer = demo_timers[i - 1, b]
-                    if prev_timer > 0:
-                        demo_timers[i, b] = max(0, prev_timer - self_tick_skip / 120)
+                        for c in range(n_base):
+                            v = 1. if c == IS_SELF and e == p else base[e, c]
+                            if orange:
+                                v *= invert[c]
+                            row[c] = v / norm[c]
+                        if orange:
+                            row[IS_MATE], row[IS_OPP] = row[IS_OPP], row[IS_MATE]
+
+                    # add_relative_components subtracts q[POS.start:LIN_VEL.stop] from the kv values window
+                    # starting at POS.start, i.e. from kv[LIN_VEL.stop - 1:UP.stop - 1]; kept for compatibility
+                    for c in range(LIN_VEL.stop - POS.start):
+                        row[LIN_VEL.stop - 1 + c] -= self_row[POS.start + c]
+
+                    out = kv[p, t, e]
+                    if write_static:
+                        for c in range(n_base):
+                            out[c] = row[c]
+                    elif is_pad:
+                        out[DEMO] = row[DEMO]
+                        for c in range(LIN_VEL.stop - 1, UP.stop - 1):
+                            out[c] = row[c]
                     else:
-                        demo_timers[i, b] = 3
-                else:  # Not demoed
-                    demo_timers[i, b] = 0
-
-    def batched_build_obs(self, encoded_states: np.ndarray):
+                        for c in range(POS.start, n_base):
+                            out[c] = row[c]
+                    # Pads have no angular velocity, its relative components are static too
+                    for k in range(5 if write_static or not is_pad else 4):
+                        xs = row[POS.start + 3 * k]
+                        ys = row[POS.start + 3 * k + 1]
+                        zs = row[POS.start + 3 * k + 2]
+                        out[n_base + k] = cy * xs - sy * ys
+                        out[n_base + 5 + k] = sy * xs + cy * ys
+                        out[n_base + 10 + k] = zs
+                        out[n_base + 15 + k] = xx * xs + xy * ys + xz * zs
+                        out[n_base + 20 + k] = yx * xs + yy * ys + yz * zs
+                        out[n_base + 25 + k] = zx * xs + zy * ys + zz * zs
+
+                    if write_static:
+                        m[p, t, e] = 1 if n_players <= e < lim_players else 0
+
+    def _get_buffers(self, n_players, n_states, n_entities):
+        shape = (n_players, n_states, n_entities)
+        if self.reuse_buffers and self._buffers is not None and self._buffers[2].shape == shape:
+            return self._buffers
+        buffers = (np.empty((n_players, n_states, 1, 25 + 8 + 3), dtype=self.dtype),
+                   np.empty((n_players, n_states, n_entities, 25 + 30), dtype=self.dtype),
+                   np.empty(shape, dtype=self.dtype))
+        if self.reuse_buffers:
+            self._buffers = buffers
+        return buffers
+
+    def _has_static(self, kv, teams):
+        """Whether kv already holds the static columns for these teams, from a previous incremental build"""
+        return (self.incremental and self._static is not None
+                and kv is self._static[0] and np.array_equal(self._static[1], teams))
+
+    def _decode_states(self, encoded_states: np.ndarray):
+        """Advances the timers over encoded_states and decodes what every obs layout needs from them"""
         if self.boost_timers is None or self.demo_timers is None:
             # if obs is being rebuilt, need to generate timers
             #
@@ -217,7 +414,6 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
 
         # need to give the same num of max players as workers
         lim_players = n_players if self.n_players is None else self.n_players
-        n_entities = lim_players + 1 + 34  # Includes player+ball+boosts
 
         teams = encoded_states[0, players_start_index + 1::player_length]
 
@@ -230,14 +426,46 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         demo_states = encoded_states[:, players_start_index + 33::player_length]
         demo_timers = np.zeros((demo_states.shape[0] + 1, self.demo_timers.shape[0]))
         demo_timers[0, :] = self.demo_timers
-        self._update_timers(boost_timers, self._boost_locations,
-                            demo_timers, self.tick_skip,
-                            boost_states, demo_states)
+        update_timers(boost_timers, self._boost_locations[:, 2] > 72,
+                      demo_timers, self.tick_skip / 120,
+                      boost_states, demo_states)
         boost_timers = boost_timers[1:]
         demo_timers = demo_timers[1:]
         self.boost_timers = boost_timers[-1, :]
         self.demo_timers = demo_timers[-1, :]
 
+        # SCOREBOARD
+        blue_score = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 9]
+        orange_score = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 10]
+        ticks_left = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 11]
+
+        is_overtime = (ticks_left > 0) & np.isinf(ticks_left)
+        goal_diff = np.clip(blue_score - orange_score, -5, 5) / 5
+        time_left = (~is_overtime) * np.clip(ticks_left, 0, 300) / (120 * 60 * 5)
+
+        return n_players, lim_players, teams, boost_timers, demo_timers, goal_diff, time_left, is_overtime
+
+    def batched_build_obs(self, encoded_states: np.ndarray):
+        n_players, lim_players, teams, boost_timers, demo_timers, goal_diff, time_left, is_overtime = \
+            self._decode_states(encoded_states)
+        ball_start_index = 3 + GameState.BOOST_PADS_LENGTH
+        players_start_index = ball_start_index + GameState.BALL_STATE_LENGTH
+        player_length = GameState.PLAYER_INFO_LENGTH
+        n_entities = lim_players + 1 + 34  # Includes player+ball+boosts
+
+        if self.fused:
+            q, kv, m = self._get_buffers(n_players, encoded_states.shape[0], n_entities)
+            encoded_players = encoded_states[:, players_start_index:].reshape(encoded_states.shape[0], n_players,
+                                                                              player_length)
+            write_static = not self._has_static(kv, teams)
+            self._fused_build_obs(encoded_players, encoded_states[:, ball_start_index: ball_start_index + 9],
+                                  self._player_columns, teams, self._pad_rows, boost_timers, demo_timers,
+                                  goal_diff, time_left, is_overtime.astype(np.float64), self._invert, self._norm,
+                                  write_static, q, kv, m)
+            if self.incremental:
+                self._static = (kv, teams.copy())
+            return [(q[i], kv[i], m[i]) for i in range(n_players)]
+
         # SELECTORS
         sel_players = slice(0, lim_players)
         sel_ball = sel_players.stop
@@ -248,14 +476,6 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         kv = np.zeros((n_players, encoded_states.shape[0], n_entities, 25 + 30))
         m = np.zeros((n_players, encoded_states.shape[0], n_entities))  # Mask is shared
 
-        # SCOREBOARD
-        blue_score = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 9]
-        orange_score = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 10]
-        ticks_left = encoded_states[:, SC.BALL_ANGULAR_VELOCITY.start + 11]
-
-        is_overtime = (ticks_left > 0) & np.isinf(ticks_left)
-        goal_diff = np.clip(blue_score - orange_score, -5, 5) / 5
-        time_left = (~is_overtime) * np.clip(ticks_left, 0, 300) / (120 * 60 * 5)
         q[teams == 0, :, 0, GOAL_DIFF] = goal_diff
         q[teams == 1, :, 0, GOAL_DIFF] = -goal_diff
         q[:, :, 0, TIME_LEFT] = time_left
@@ -302,6 +522,9 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
         for i in range(n_players):
             q[i, :, 0, :HAS_JUMP + 1] = kv[i, :, i, :HAS_JUMP + 1]
 
+        q = q.astype(self.dtype, copy=False)
+        kv = kv.astype(self.dtype, copy=False)
+        m = m.astype(self.dtype, copy=False)
         self.add_relative_components(q, kv)
 
         # MASK
@@ -309,6 +532,102 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
 
         return [(q[i], kv[i], m[i]) for i in range(n_players)]
 
+    def batched_build_compact_obs(self, encoded_states: np.ndarray):
+        """
+        Same obs as batched_build_obs without the n_players copies of kv: returns (q, kv, m, teams) with the final
+        q (n_players, n_states, 1, 36), kv (2, n_states, n_entities, 25) holding the absolute entities as seen by
+        blue and by orange (normalized, without IS_SELF and relative components), the shared m (n_states, n_entities)
+        and the team of each player. expand_compact_obs turns it into the per-player obs.
+
+        Not used by the rollout or learner path yet, rocket_learn still stores and sends the per-player obs (or the
+        encoded states with worker.py --compress), and kept out of the fused=False reference: the __main__ checks
+        the expansion against it.
+        """
+        n_players, lim_players, teams, boost_timers, demo_timers, goal_diff, time_left, is_overtime = \
+            self._decode_states(encoded_states)
+        ball_start_index = 3 + GameState.BOOST_PADS_LENGTH
+        players_start_index = ball_start_index + GameState.BALL_STATE_LENGTH
+        player_length = GameState.PLAYER_INFO_LENGTH
+        n_entities = lim_players + 1 + 34  # Includes player+ball+boosts
+
+        # SELECTORS
+        sel_players = slice(0, lim_players)
+        sel_ball = sel_players.stop
+        sel_boosts = slice(sel_ball + 1, None)
+
+        # MAIN ARRAYS
+        q = np.zeros((n_players, encoded_states.shape[0], 1, 25 + 8 + 3))
+        kv = np.zeros((encoded_states.shape[0], n_entities, HAS_JUMP + 1))
+        m = np.zeros((encoded_states.shape[0], n_entities))  # Mask is shared
+
+        q[teams == 0, :, 0, GOAL_DIFF] = goal_diff
+        q[teams == 1, :, 0, GOAL_DIFF] = -goal_diff
+        q[:, :, 0, TIME_LEFT] = time_left
+        q[:, :, 0, IS_OVERTIME] = is_overtime
+
+        # BALL
+        kv[:, sel_ball, 3] = 1
+        kv[:, sel_ball, np.r_[POS, LIN_VEL, ANG_VEL]] = encoded_states[:, ball_start_index: ball_start_index + 9]
+
+        # BOOSTS
+        # big_boost_mask = self._boost_locations[:, 2] > 72
+        kv[:, sel_boosts, IS_BOOST] = 1
+        kv[:, sel_boosts, POS] = self._boost_locations  # [big_boost_mask]
+        kv[:, sel_boosts, BOOST] = 1
+        kv[:, sel_boosts, DEMO] = boost_timers
+
+        # PLAYERS
+        kv[:, :n_players, IS_MATE] = 1 - teams  # Default team is blue
+        kv[:, :n_players, IS_OPP] = teams
+        for i in range(n_players):
+            encoded_player = encoded_states[:,
+                             players_start_index + i * player_length: players_start_index + (i + 1) * player_length]
+
+            kv[:, i, POS] = encoded_player[:, SC.CAR_POS_X.start: SC.CAR_POS_Z.start + 1]
+            kv[:, i, LIN_VEL] = encoded_player[:, SC.CAR_LINEAR_VEL_X.start: SC.CAR_LINEAR_VEL_Z.start + 1]
+            quats = encoded_player[:, SC.CAR_QUAT_W.start: SC.CAR_QUAT_Z.start + 1]
+            rot_mtx = self._quats_to_rot_mtx(quats)
+            kv[:, i, FW] = rot_mtx[:, :, 0]
+            kv[:, i, UP] = rot_mtx[:, :, 2]
+            kv[:, i, ANG_VEL] = encoded_player[:, SC.CAR_ANGULAR_VEL_X.start: SC.CAR_ANGULAR_VEL_Z.start + 1]
+            kv[:, i, BOOST] = np.clip(encoded_player[:, SC.BOOST_AMOUNT.start], 0, 2)
+            kv[:, i, DEMO] = demo_timers[:, i]
+            kv[:, i, ON_GROUND] = encoded_player[:, SC.ON_GROUND.start]
+            kv[:, i, HAS_FLIP] = encoded_player[:, SC.HAS_FLIP.start]
+            kv[:, i, HAS_JUMP] = encoded_player[:, SC.HAS_JUMP.start]
+
+        kv = np.stack((kv, kv * self._invert[:HAS_JUMP + 1]))
+        kv[1, ..., (IS_MATE, IS_OPP)] = kv[1, ..., (IS_OPP, IS_MATE)]  # Swap teams
+
+        kv /= self._norm[:HAS_JUMP + 1]
+
+        for i in range(n_players):
+            q[i, :, 0, :HAS_JUMP + 1] = kv[int(teams[i]), :, i]
+            q[i, :, 0, IS_SELF] = 1
+
+        # MASK
+        m[:, n_players: lim_players] = 1
+
+        return (q.astype(self.dtype, copy=False), kv.astype(self.dtype, copy=False), m.astype(self.dtype, copy=False),
+                teams)
+
+    @staticmethod
+    def expand_compact_obs(compact_obs, use_njit=False):
+        """Per-player (q, kv, m) of batched_build_obs from the output of batched_build_compact_obs, q is shared"""
+        q, kv_teams, m, teams = compact_obs
+        n_players, n_states = q.shape[:2]
+        kv = np.zeros((n_players, n_states, kv_teams.shape[2], 25 + 30), dtype=kv_teams.dtype)
+        kv[..., :HAS_JUMP + 1] = kv_teams[teams.astype(int)]
+        for i in range(n_players):
+            kv[i, :, i, IS_SELF] = 1
+
+        if use_njit:
+            ZenitobotObsBuilder.add_relative_components_njit(q, kv)
+        else:
+            ZenitobotObsBuilder.add_relative_components(q, kv)
+
+        return [(q[i], kv[i], m) for i in range(n_players)]
+
     def add_actions(self, obs: Any, previous_actions: np.ndarray, player_index=None):
         if player_index is None:
             for (q, kv, m), act in zip(obs, previous_actions):
@@ -319,64 +638,182 @@ class ZenitobotObsBuilder(BatchedObsBuilder):
 
 
 if __name__ == '__main__':
-    import rlgym
-
-
-    class CombinedObs(ObsBuilder):
-        def __init__(self, *obsbs):
-            super().__init__()
-            self.obsbs = obsbs
-
-        def reset(self, initial_state: GameState):
-            for obsb in self.obsbs:
-                obsb.reset(initial_state)
-
-        def build_obs(self, player: PlayerData, state: GameState, previous_action: np.ndarray) -> Any:
-            obss = []
-            for obsb in self.obsbs:
-                obss.append(obsb.build_obs(player, state, previous_action))
-            return obss
-
-
-    env = rlgym.make(use_injector=True, self_play=True, team_size=3,
-                     obs_builder=CombinedObs(ZenitobotObsBuilder(Scoreboard(), n_players=6), ZenitobotObsOLD()))
-
-    states = []
-    actions = [[np.zeros(8)] for _ in range(6)]
-    done = False
-    obs, info = env.reset(return_info=True)
-    obss = [[o] for o in obs]
-    states.append(info["state"])
-    while not done:
-        act = [env.action_space.sample() for _ in range(6)]
-        for a, arr in zip(act, actions):
-            arr.append(a)
-        obs, reward, done, info = env.step(act)
-        for os, o in zip(obss, obs):
-            os.append(o)
-        states.append(info["state"])
-
-    obs_b = ZenitobotObsBuilder(Scoreboard(), n_players=6)
-
-    enc_states = np.array([encode_gamestate(s) for s in states])
-    actions = np.array(actions)
-
-    # FIXME ensure obs corresponds to old obs
-    # FIXME ensure reconstructed obs is *exactly* the same as obs
-    # reconstructed_obs = obs_b.reset(GameState(enc_states[0].tolist()))
-    reconstructed_obs = obs_b.batched_build_obs(enc_states)
-    ap = DefaultAction()
-    obs_b.add_actions(reconstructed_obs, ap.parse_actions(actions.reshape(-1, 8), None).reshape(actions.shape))
-
-    formatted_obss = []
-    for player_obs in obss:
-        transposed = tuple(zip(*player_obs))
-        obs_tensor = tuple(np.vstack(t) for t in transposed)
-        formatted_obss.append(obs_tensor)
-
-    for o0, o1 in zip(formatted_obss, reconstructed_obs):
-        for arr0, arr1 in zip(o0, o1):
-            if not np.all(arr0 == arr1):
-                print("Error")
-
-    print("Hei")
+    # Offline regression suite and benchmark, no game or injector needed:
+    #   python -m training.obs [FIXTURE ...] [--states N]    (from the repository root)
+    # A fixture is an .npy of encoded states (np.save) or a directory recorded by worker.py --record, whose recorded
+    # actions are then used as previous actions (recordings of pro_training.py, another state layout, are refused).
+    # Without fixtures, seeded synthetic 1v1, 2v2 and 3v3 episodes are used.
+    import argparse
+    import os
+    import timeit
+
+    from training.recorder import load_recording, ENCODE_GAMESTATE
+
+    IMPLEMENTATIONS = {
+        "numpy": dict(fused=False),
+        "fused": dict(fused=True),
+        "incremental": dict(incremental=True),
+    }
+    BATCH_SIZES = (1, 16, 256, None)  # None is the whole fixture in one call
+
+
+    def synthetic_states(n_states, n_players, seed=0):
+        """Encoded states with random cars and ball, pads and demos that toggle over time, goals and overtime"""
+        rng = np.random.default_rng(seed)
+        ball_start_index = 3 + GameState.BOOST_PADS_LENGTH
+        players_start_index = ball_start_index + GameState.BALL_STATE_LENGTH
+        enc_states = np.zeros((n_states, players_start_index + n_players * GameState.PLAYER_INFO_LENGTH))
+
+        pads = np.ones(GameState.BOOST_PADS_LENGTH)
+        demoed = np.zeros(n_players)
+        scores = np.zeros(2)
+        for state, row in enumerate(enc_states):
+            pads[rng.random(len(pads)) < 0.05] = 0
+            pads[rng.random(len(pads)) < 0.05] = 1
+            demoed = np.where(rng.random(n_players) < 0.02, 1 - demoed, demoed)
+            if rng.random() < 0.01:
+                scores[rng.integers(2)] += 1
+            ticks_left = max(0., 300 - state / 15) if state < 3 * n_states // 4 else np.inf
+
+            row[1:3] = scores
+            row[3:ball_start_index] = pads
+            ball = np.concatenate([rng.uniform([-4000, -5000, 93], [4000, 5000, 1900]),
+                                   rng.normal(0, 1500, 3), rng.normal(0, 3, 3)])
+            row[ball_start_index:ball_start_index + 9] = ball
+            row[ball_start_index + 9:players_start_index] = ball * np.tile([-1, -1, 1], 3)
+            row[SC.BALL_ANGULAR_VELOCITY.start + 9:SC.BALL_ANGULAR_VELOCITY.start + 12] = *scores, ticks_left
+
+            players = row[players_start_index:].reshape(n_players, GameState.PLAYER_INFO_LENGTH)
+            for p, player in enumerate(players):
+                quat = rng.normal(size=4)
+                car = np.concatenate([rng.uniform([-4096, -5120, 17], [4096, 5120, 2044]), quat / np.linalg.norm(quat),
+                                      rng.normal(0, 1200, 3), rng.normal(0, 3, 3)])
+                # Orange sees the field rotated by 180 degrees around z
+                inverted = car * [-1, -1, 1, 1, 1, 1, 1, -1, -1, 1, -1, -1, 1]
+                inverted[3:7] = -car[6], -car[5], car[4], car[3]
+                player[:28] = p + 1, p % 2, *car, *inverted
+                player[33:39] = demoed[p], *(rng.random(4) < [0.5, 0.3, 0.5, 0.5]), rng.uniform(0, 1)
+        return enc_states
+
+
+    def load_fixtures(paths, n_states):
+        """(name, encoded states, previous actions or None) of every fixture, at most n_states steps each"""
+        fixtures = []
+        for path in paths:
+            if os.path.isdir(path):  # Memory-mapped, only the first n_states steps of every shard are read
+                for i, (states, actions) in enumerate(load_recording(path, ENCODE_GAMESTATE)):
+                    actions = np.array(actions[:n_states], dtype=np.float64).reshape(min(len(actions), n_states), -1, 8)
+                    previous_actions = np.concatenate([np.zeros_like(actions[:1]), actions[:-1]])
+                    fixtures.append((f"{path}[{i}]", np.array(states[:n_states], dtype=np.float64), previous_actions))
+            else:
+                fixtures.append((path, np.load(path)[:n_states], None))
+        if not paths:
+            for n_players in (2, 4, 6):
+                fixtures.append((f"synthetic {n_players // 2}v{n_players // 2}",
+                                 synthetic_states(n_states, n_players, seed=n_players), None))
+        return fixtures
+
+
+    def online_obs(obs_b, enc_states, previous_actions):
+        """Obs as rlgym builds them during a rollout, one state and one player at a time, stacked per player"""
+        states = [GameState(row.tolist()) for row in enc_states]
+        obs_b.reset(states[0])
+        steps = []
+        for state, actions in zip(states, previous_actions):
+            obs_b.pre_step(state)
+            # Copied since builders reusing their buffers overwrite them on the next step
+            steps.append([tuple(np.array(arr) for arr in obs_b.build_obs(player, state, action))
+                          for player, action in zip(state.players, actions)])
+        return [tuple(np.concatenate(arrs) for arrs in zip(*player_steps)) for player_steps in zip(*steps)]
+
+
+    def batched_obs(obs_b, enc_states, previous_actions):
+        """Obs as rocket_learn rebuilds them from a rollout, all states at once"""
+        obs = obs_b.batched_build_obs(enc_states)
+        obs_b.add_actions(obs, previous_actions.swapaxes(0, 1))
+        return obs
+
+
+    def compare(expected, actual, what, tolerance=0.):
+        """Largest absolute difference between two obs, raises if above tolerance"""
+        max_error = 0
+        for p, (player_obs0, player_obs1) in enumerate(zip(expected, actual)):
+            for name, arr0, arr1 in zip("qkm", player_obs0, player_obs1):
+                err_msg = f"{what}: player {p} {name}"
+                if tolerance == 0:
+                    np.testing.assert_array_equal(arr0, arr1, err_msg=err_msg)
+                else:
+                    np.testing.assert_allclose(arr0, arr1, rtol=tolerance, atol=tolerance, err_msg=err_msg)
+                    max_error = max(max_error, np.abs(arr0 - arr1).max())
+        return max_error
+
+
+    def regression(enc_states, previous_actions):
+        # Online and batched paths of the same builder are exactly the same
+        for name, kwargs in IMPLEMENTATIONS.items():
+            for dtype in (np.float32, np.float64):
+                online = online_obs(ZenitobotObsBuilder(None, dtype=dtype, **kwargs), enc_states, previous_actions)
+                batched = batched_obs(ZenitobotObsBuilder(None, dtype=dtype, **kwargs), enc_states, previous_actions)
+                compare(online, batched, f"{name} {np.dtype(dtype).name} online vs batched")
+                if name == "incremental":  # Leaving the static columns in place gives the fused obs
+                    fused = batched_obs(ZenitobotObsBuilder(None, dtype=dtype), enc_states, previous_actions)
+                    compare(online, fused, f"incremental {np.dtype(dtype).name} online vs fused batched")
+        print("  online == batched for " + ", ".join(IMPLEMENTATIONS) + " in float32 and float64")
+
+        # Fused against the numpy reference, and float32 against float64
+        reference = batched_obs(ZenitobotObsBuilder(None, fused=False, dtype=np.float64), enc_states, previous_actions)
+        fused = batched_obs(ZenitobotObsBuilder(None, dtype=np.float64), enc_states, previous_actions)
+        errors = [compare(reference, fused, "fused vs numpy", tolerance=1e-12)]
+        for fused_b in (False, True):
+            obs = batched_obs(ZenitobotObsBuilder(None, fused=fused_b), enc_states, previous_actions)
+            assert all(arr.dtype == np.float32 for player_obs in obs for arr in player_obs)
+            errors.append(compare(reference, obs, f"float32 fused={fused_b} vs numpy float64", tolerance=1e-5))
+        print("  fused vs numpy: max abs error {:.1e}, float32 vs float64: {:.1e} numpy, {:.1e} fused".format(*errors))
+
+        # Compact layout, expanded with numpy and njit, against the per-player numpy reference
+        compact = ZenitobotObsBuilder(None, dtype=np.float64).batched_build_compact_obs(enc_states)
+        reference = ZenitobotObsBuilder(None, fused=False, dtype=np.float64).batched_build_obs(enc_states)
+        compare(reference, ZenitobotObsBuilder.expand_compact_obs(compact), "expanded compact vs numpy")
+        compare(reference, ZenitobotObsBuilder.expand_compact_obs(compact, use_njit=True),
+                "expanded compact (njit) vs numpy", tolerance=1e-12)
+        full_size = sum(arr.nbytes for obs in batched_obs(ZenitobotObsBuilder(None), enc_states, previous_actions)
+                        for arr in obs)
+        compact_size = sum(arr.nbytes for arr in ZenitobotObsBuilder(None).batched_build_compact_obs(enc_states))
+        print(f"  compact obs: {compact_size / len(enc_states):.0f} bytes/state, {full_size / compact_size:.1f}x smaller")
+
+
+    def benchmark(enc_states, repeat=3):
+        """States/sec of every implementation, building the fixture in batches of every size"""
+        batch_sizes = [b for b in BATCH_SIZES if b is None or b < len(enc_states)]
+        print("  {:<12}".format("states/sec") + "".join(f"{b or len(enc_states):>10}" for b in batch_sizes))
+        for name, kwargs in IMPLEMENTATIONS.items():
+            rates = []
+            for batch_size in batch_sizes:
+                batch_size = batch_size or len(enc_states)
+                batches = [enc_states[i:i + batch_size] for i in range(0, len(enc_states), batch_size)]
+                obs_b = ZenitobotObsBuilder(None, **kwargs)
+                for batch in {len(batch): batch for batch in batches}.values():
+                    obs_b.batched_build_obs(batch)  # Compile every signature first
+                t = min(timeit.repeat(lambda: [obs_b.batched_build_obs(batch) for batch in batches],
+                                      number=1, repeat=repeat))
+                rates.append(len(enc_states) / t)
+            print(f"  {name:<12}" + "".join(f"{rate:>10.0f}" for rate in rates))
+
+
+    parser = argparse.ArgumentParser(description="Offline regression suite and benchmark of ZenitobotObsBuilder")
+    parser.add_argument("fixtures", nargs="*", help=".npy files of encoded states or recording directories")
+    parser.add_argument("--states", type=int, default=1000, help="Steps used from every fixture")
+    args = parser.parse_args()
+
+    try:
+        fixtures = load_fixtures(args.fixtures, args.states)
+    except ValueError as e:  # A recording of another state layout
+        parser.error(str(e))
+    for fixture, enc_states, previous_actions in fixtures:
+        n_players = (enc_states.shape[1] - 3 - GameState.BOOST_PADS_LENGTH - GameState.BALL_STATE_LENGTH) \
+                    // GameState.PLAYER_INFO_LENGTH
+        if previous_actions is None:
+            previous_actions = np.random.default_rng(0).uniform(-1, 1, (len(enc_states), n_players, 8))
+        print(f"{fixture}: {len(enc_states)} states, {n_players} players")
+        regression(enc_states, previous_actions)
+        benchmark(enc_states)
@@ -5,6 +5,7 @@ import numpy as np
 from gym.spaces import Discrete
 from rlgym.utils.action_parsers import ActionParser
 from rlgym.utils.gamestates import GameState
+from rocket_learn.utils.gamestate_encoding import encode_gamestate
 
 
 # from rlgym_tools.extra_action_parsers.kbm_act import KBMAction
@@ -13,9 +14,10 @@ from rlgym.utils.gamestates import GameState
 
 
 class ZenitobotAction(ActionParser):
-    def __init__(self):
+    def __init__(self, recorder=None):
         super().__init__()
         self._lookup_table = self.make_lookup_table()
+        self.recorder = recorder  # training.recorder.RolloutRecorder for the encoded states and parsed actions
 
     @staticmethod
     def make_lookup_table():
@@ -66,7 +68,10 @@ class ZenitobotAction(ActionParser):
             else:
                 parsed_actions.append(action)
 
-        return np.asarray(parsed_actions)
+        parsed_actions = np.asarray(parsed_actions)
+        if self.recorder is not None and state is not None:
+            self.recorder.append(encode_gamestate(state), parsed_actions)
+        return parsed_actions
 
 
 if __name__ == '__main__':
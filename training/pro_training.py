@@ -39,10 +39,12 @@ from pathlib import Path
 # Fix Windows encoding issues
 os.environ['PYTHONIOENCODING'] = 'utf-8'
 
-from rlgym.api import RewardFunction, AgentID, StateMutator
+from rlgym.api import RewardFunction, AgentID, StateMutator, ActionParser
 from rlgym.rocket_league.api import GameState
 from rlgym.rocket_league import common_values
 
+from reward_features import get_step_features, pack_cars
+
 
 # ============================================================================
 # SYSTÈME DE CHECKPOINTS AVANCÉ
@@ -92,10 +94,12 @@ class PowershotReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_vel = np.linalg.norm(state.ball.linear_velocity)
+        features = get_step_features(agents, state, shared_info)
+        ball_vel = features.ball_speed
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             current_touches = car.ball_touches
 
             if current_touches > self.last_touches[agent]:
@@ -104,10 +108,11 @@ class PowershotReward(RewardFunction[AgentID, GameState, float]):
                 car_height = car_pos[2]
 
                 # Détection du type de powershot
-                is_on_wall = abs(car_pos[0]) > 3500 or abs(car_pos[1]) > 4500
-                is_upside_down = car.physics.up[2] < -0.5  # Toit vers le bas
+                # |x| > 3500 ou |y| > 4500
+                is_on_wall = features.car_side_wall_dist[i] < 596 or features.car_back_wall_dist[i] < 620
+                is_upside_down = features.up_z[i] < -0.5  # Toit vers le bas
                 is_aerial = car_height > 300
-                is_air_rolling = np.linalg.norm(car.physics.angular_velocity) > 3.0
+                is_air_rolling = features.ang_vel_norm[i] > 3.0
 
                 # Powershot = contact puissant (augmentation vitesse significative)
                 if vel_increase > 800:  # Powershot détecté
@@ -150,6 +155,7 @@ class BackboardReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         ball_pos = state.ball.position
         ball_height = ball_pos[2]
 
@@ -158,7 +164,7 @@ class BackboardReward(RewardFunction[AgentID, GameState, float]):
             current_touches = car.ball_touches
 
             # Backboard = balle haute et proche du mur arrière
-            is_on_backboard = ball_height > 500 and (abs(ball_pos[1]) > 4000)
+            is_on_backboard = ball_height > 500 and features.ball_back_wall_dist < 1120  # |y| > 4000
 
             if current_touches > self.last_touches[agent] and is_on_backboard:
                 car_pos = car.physics.position
@@ -214,13 +220,15 @@ class AdvancedDribblingReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_vel = np.linalg.norm(state.ball.linear_velocity)
+        features = get_step_features(agents, state, shared_info)
+        ball_vel = features.ball_speed
         ball_pos = state.ball.position
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_pos = car.physics.position
-            car_pitch = car.physics.euler_angles[0]  # pitch
+            car_pitch = features.pitch[i]
             current_touches = car.ball_touches
 
             # Balle sur le toit de la voiture
@@ -272,7 +280,7 @@ class AdvancedDribblingReward(RewardFunction[AgentID, GameState, float]):
                         base_reward = 13.0  # Wavedash flick
 
                     # Breezy/Mawkzy flick (très complexe, détection par air roll + flick)
-                    if np.linalg.norm(car.physics.angular_velocity) > 4.0 and vel_increase > 1300:
+                    if features.ang_vel_norm[i] > 4.0 and vel_increase > 1300:
                         base_reward = 16.0  # Breezy/Mawkzy flick
 
                     rewards[agent] = base_reward
@@ -303,12 +311,12 @@ class BounceDribbleReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         ball_height = state.ball.position[2]
         ball_vel_z = state.ball.linear_velocity[2]
 
         for agent in agents:
-            car = state.cars[agent]
-            dist_to_ball = np.linalg.norm(state.ball.position - car.physics.position)
+            dist_to_ball = features.dist_to_ball[features.slots[agent]]
 
             # Proche de la balle = contrôle
             if dist_to_ball < 400:
@@ -344,17 +352,19 @@ class AirDribbleReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         ball_height = state.ball.position[2]
-        ball_pos = state.ball.position
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_height = car.physics.position[2]
             current_touches = car.ball_touches
-            dist_to_ball = np.linalg.norm(ball_pos - car.physics.position)
+            dist_to_ball = features.dist_to_ball[i]
 
             # Détection wall to air dribble
-            is_near_wall = abs(car.physics.position[0]) > 3000 or abs(car.physics.position[1]) > 4000
+            # |x| > 3000 ou |y| > 4000
+            is_near_wall = features.car_side_wall_dist[i] < 1096 or features.car_back_wall_dist[i] < 1120
 
             # Air dribble = balle en l'air, voiture en l'air, proche de la balle, plusieurs touches
             if ball_height > 200 and car_height > 150 and dist_to_ball < 300:
@@ -407,9 +417,11 @@ class FastAerialReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_height = car.physics.position[2]
             ball_height = state.ball.position[2]
 
@@ -430,7 +442,7 @@ class FastAerialReward(RewardFunction[AgentID, GameState, float]):
                     rewards[agent] = 2.0  # Bonus fast aerial
 
                     # Bonus supplémentaire si balle haute
-                    if ball_height > 600 and np.linalg.norm(state.ball.position - car.physics.position) < 500:
+                    if ball_height > 600 and features.dist_to_ball[i] < 500:
                         rewards[agent] = 4.0  # Fast aerial vers balle haute
                 else:
                     rewards[agent] = 0.0
@@ -450,12 +462,14 @@ class FlipResetReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_height = car.physics.position[2]
             has_flip = car.has_flip
-            dist_to_ball = np.linalg.norm(state.ball.position - car.physics.position)
+            dist_to_ball = features.dist_to_ball[i]
 
             # Flip reset = retrouve le flip en l'air en touchant la balle avec les 4 roues
             if not self.had_flip[agent] and has_flip and car_height > 200:
@@ -481,15 +495,17 @@ class MustyAerialReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_height = car.physics.position[2]
             current_touches = car.ball_touches
 
             if current_touches > self.last_touches[agent]:
                 # Musty = en l'air + pitch négatif important (backflip) + contact
-                car_pitch = car.physics.euler_angles[0]
+                car_pitch = features.pitch[i]
 
                 if car_height > 200 and car_pitch < -0.5:  # Backflip en l'air
                     rewards[agent] = 18.0  # Énorme reward pour musty aerial
@@ -513,12 +529,14 @@ class HeliResetReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             has_flip = car.has_flip
             car_height = car.physics.position[2]
-            ang_vel = np.linalg.norm(car.physics.angular_velocity)
+            ang_vel = features.ang_vel_norm[i]
 
             # Détection spin rapide en l'air
             if car_height > 200 and ang_vel > 5.0:
@@ -550,6 +568,7 @@ class CeilingShotReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         ball_pos = state.ball.position
 
         for agent in agents:
@@ -558,7 +577,7 @@ class CeilingShotReward(RewardFunction[AgentID, GameState, float]):
             current_touches = car.ball_touches
 
             # Sur le plafond
-            if car_height > 1900:
+            if features.car_ceiling_dist[features.slots[agent]] < 144:
                 self.was_on_ceiling[agent] = True
 
             # Ceiling shot = vient du plafond et touche la balle en l'air
@@ -651,11 +670,13 @@ class WavedashReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             car_height = car.physics.position[2]
-            horizontal_speed = np.linalg.norm(car.physics.linear_velocity[:2])
+            horizontal_speed = features.horizontal_speed[i]
 
             if car_height > 20 and not car.on_ground:
                 self.was_airborne[agent] = True
@@ -688,11 +709,13 @@ class ChainDashReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         self.frame_count += 1
 
         for agent in agents:
             car = state.cars[agent]
-            horizontal_speed = np.linalg.norm(car.physics.linear_velocity[:2])
+            i = features.slots[agent]
+            horizontal_speed = features.horizontal_speed[i]
 
             # Détection wavedash (vitesse élevée au sol)
             if car.on_ground and horizontal_speed > 1800:
@@ -722,22 +745,24 @@ class HalfFlipReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
-            car_pitch = car.physics.euler_angles[0]
+            i = features.slots[agent]
+            car_pitch = features.pitch[i]
 
             # Détection backflip (pitch négatif)
             if not car.on_ground and car_pitch < -0.8:
                 if not self.backflip_started[agent]:
                     self.backflip_started[agent] = True
                     # Sauvegarder direction initiale
-                    yaw = car.physics.euler_angles[1]
+                    yaw = features.yaw[i]
                     self.initial_direction[agent] = np.array([np.cos(yaw), np.sin(yaw), 0.0])
 
             # Half flip = atterrit orienté vers l'avant après backflip
             if self.backflip_started[agent] and car.on_ground:
-                yaw = car.physics.euler_angles[1]
+                yaw = features.yaw[i]
                 current_direction = np.array([np.cos(yaw), np.sin(yaw), 0.0])
 
                 # Calculer différence d'angle (devrait être ~180° pour half flip)
@@ -841,33 +866,29 @@ class RotationReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         # Grouper par équipe
         blue_agents = [a for a in agents if not state.cars[a].is_orange]
         orange_agents = [a for a in agents if state.cars[a].is_orange]
 
-        def evaluate_team_rotation(team_agents, own_goal_y):
+        def evaluate_team_rotation(team_agents):
             if len(team_agents) < 2:
                 return {agent: 0.0 for agent in team_agents}
 
             team_rewards = {}
-            ball_pos = state.ball.position
 
-            # Calculer distances à la balle pour chaque coéquipier
+            # Distances à la balle de chaque coéquipier (cache du step)
             distances = {}
             for agent in team_agents:
-                car = state.cars[agent]
-                dist = np.linalg.norm(ball_pos - car.physics.position)
-                distances[agent] = dist
+                distances[agent] = features.dist_to_ball[features.slots[agent]]
 
             # Le plus proche devrait attaquer, le plus loin défendre
             closest = min(distances, key=distances.get)
             farthest = max(distances, key=distances.get)
 
             for agent in team_agents:
-                car = state.cars[agent]
-                own_goal = np.array([0, own_goal_y, 100])
-                dist_to_goal = np.linalg.norm(car.physics.position - own_goal)
+                dist_to_goal = features.dist_to_own_goal[features.slots[agent]]
 
                 if agent == closest:
                     # Joueur le plus proche = devrait être agressif
@@ -887,8 +908,8 @@ class RotationReward(RewardFunction[AgentID, GameState, float]):
             return team_rewards
 
         # Évaluer chaque équipe
-        blue_rewards = evaluate_team_rotation(blue_agents, -common_values.BACK_NET_Y)
-        orange_rewards = evaluate_team_rotation(orange_agents, common_values.BACK_NET_Y)
+        blue_rewards = evaluate_team_rotation(blue_agents)
+        orange_rewards = evaluate_team_rotation(orange_agents)
 
         rewards.update(blue_rewards)
         rewards.update(orange_rewards)
@@ -905,27 +926,16 @@ class SmartPositioningReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_pos = state.ball.position
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
-            car = state.cars[agent]
-            car_pos = car.physics.position
-
-            if car.is_orange:
-                own_goal_y = common_values.BACK_NET_Y
-                opp_goal_y = -common_values.BACK_NET_Y
-            else:
-                own_goal_y = -common_values.BACK_NET_Y
-                opp_goal_y = common_values.BACK_NET_Y
-
-            own_goal = np.array([0, own_goal_y, 100])
-            opp_goal = np.array([0, opp_goal_y, 100])
+            i = features.slots[agent]
 
             # Distance à la balle
-            dist_to_ball = np.linalg.norm(ball_pos - car_pos)
+            dist_to_ball = features.dist_to_ball[i]
 
             # Si balle proche du but adverse = bon positionnement offensif
-            ball_to_opp_goal = np.linalg.norm(ball_pos - opp_goal)
+            ball_to_opp_goal = features.ball_to_opp_goal[i]
 
             if ball_to_opp_goal < 3000:  # Balle dans leur moitié
                 # Être proche mais pas trop = positioning offensif
@@ -935,7 +945,7 @@ class SmartPositioningReward(RewardFunction[AgentID, GameState, float]):
                     rewards[agent] = 0.0
             else:
                 # Balle dans notre moitié = ne pas tous rusher
-                car_to_own_goal = np.linalg.norm(car_pos - own_goal)
+                car_to_own_goal = features.dist_to_own_goal[i]
                 if car_to_own_goal < 4000 and dist_to_ball > 1000:
                     rewards[agent] = 0.8  # Bon positioning défensif
                 else:
@@ -982,11 +992,13 @@ class BoostManagementReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             current_boost = car.boost_amount
-            dist_to_ball = np.linalg.norm(state.ball.position - car.physics.position)
+            dist_to_ball = features.dist_to_ball[i]
 
             # Pénalité pour boost gaspillé loin de la balle
             if car.is_boosting and dist_to_ball > 2000:
@@ -1044,13 +1056,12 @@ class PatienceReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_pos = state.ball.position
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
-            car = state.cars[agent]
-            car_pos = car.physics.position
-            car_speed = np.linalg.norm(car.physics.linear_velocity)
-            dist_to_ball = np.linalg.norm(ball_pos - car_pos)
+            i = features.slots[agent]
+            car_speed = features.car_speed[i]
+            dist_to_ball = features.dist_to_ball[i]
 
             # Si loin de la balle et pas en train de rusher = patience
             if dist_to_ball > 1500 and car_speed < 1500:
@@ -1077,7 +1088,8 @@ class ChallengeTimingReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_vel = np.linalg.norm(state.ball.linear_velocity)
+        features = get_step_features(agents, state, shared_info)
+        ball_vel = features.ball_speed
 
         for agent in agents:
             car = state.cars[agent]
@@ -1149,8 +1161,9 @@ class RedirectReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         ball_vel = state.ball.linear_velocity
-        ball_speed = np.linalg.norm(ball_vel)
+        ball_speed = features.ball_speed
 
         if ball_speed > 10:
             current_ball_direction = ball_vel / ball_speed
@@ -1205,7 +1218,8 @@ class PinchReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
-        ball_vel = np.linalg.norm(state.ball.linear_velocity)
+        features = get_step_features(agents, state, shared_info)
+        ball_vel = features.ball_speed
         ball_pos = state.ball.position
 
         for agent in agents:
@@ -1218,10 +1232,11 @@ class PinchReward(RewardFunction[AgentID, GameState, float]):
                 # Pinch = augmentation MASSIVE de vitesse
                 if vel_increase > 1500:
                     # Détection du type de pinch
-                    is_near_wall = abs(ball_pos[0]) > 3800 or abs(ball_pos[1]) > 4800
-                    is_near_ceiling = ball_pos[2] > 1800
+                    # |x| > 3800 ou |y| > 4800
+                    is_near_wall = features.ball_side_wall_dist < 296 or features.ball_back_wall_dist < 320
+                    is_near_ceiling = features.ball_ceiling_dist < 244  # z > 1800
                     is_near_ground = ball_pos[2] < 200
-                    is_near_goal_post = (abs(ball_pos[1]) > 4800 and abs(ball_pos[0]) < 1000)
+                    is_near_goal_post = features.ball_back_wall_dist < 320 and abs(ball_pos[0]) < 1000
 
                     base_reward = 12.0
 
@@ -1304,10 +1319,12 @@ class FlipCancelReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
-            car_pitch = car.physics.euler_angles[0]
+            i = features.slots[agent]
+            car_pitch = features.pitch[i]
             pitch_vel = car.physics.angular_velocity[1]  # Pitch angular velocity
 
             # Détection flip (changement rapide de pitch)
@@ -1347,11 +1364,13 @@ class TurtleReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             current_touches = car.ball_touches
-            is_upside_down = car.physics.up[2] < -0.8  # Toit vers le sol
+            is_upside_down = features.up_z[i] < -0.8  # Toit vers le sol
 
             # Turtle = upside down au sol
             if is_upside_down and car.on_ground:
@@ -1363,7 +1382,7 @@ class TurtleReward(RewardFunction[AgentID, GameState, float]):
                     rewards[agent] = 10.0  # Turtle shot
 
                     # MEGA bonus si balle va vite (turtle powershot)
-                    ball_vel = np.linalg.norm(state.ball.linear_velocity)
+                    ball_vel = features.ball_speed
                     if ball_vel > 1500:
                         rewards[agent] = 15.0  # Turtle powershot
             else:
@@ -1419,14 +1438,15 @@ class CeilingShuffleReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
 
         for agent in agents:
             car = state.cars[agent]
-            car_height = car.physics.position[2]
-            horizontal_speed = np.linalg.norm(car.physics.linear_velocity[:2])
+            i = features.slots[agent]
+            horizontal_speed = features.horizontal_speed[i]
 
             # Ceiling shuffle = au plafond + vitesse horizontale élevée
-            if car_height > 1900 and car.on_ground:  # On ground = sur le plafond
+            if features.car_ceiling_dist[i] < 144 and car.on_ground:  # On ground = sur le plafond
                 self.on_ceiling_time[agent] += 1
 
                 if horizontal_speed > 1200:  # Vitesse élevée
@@ -1453,11 +1473,13 @@ class VelocityPlayerToBallReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             player_vel = car.physics.linear_velocity
             pos_diff = state.ball.position - car.physics.position
-            dist_to_ball = np.linalg.norm(pos_diff)
+            dist_to_ball = features.dist_to_ball[i]
 
             if dist_to_ball < 1e-6:
                 rewards[agent] = 0.0
@@ -1477,16 +1499,18 @@ class FaceBallReward(RewardFunction[AgentID, GameState, float]):
     def get_rewards(self, agents: List[AgentID], state: GameState, is_terminated: Dict[AgentID, bool],
                     is_truncated: Dict[AgentID, bool], shared_info: Dict[str, Any]) -> Dict[AgentID, float]:
         rewards = {}
+        features = get_step_features(agents, state, shared_info)
         for agent in agents:
             car = state.cars[agent]
+            i = features.slots[agent]
             pos_diff = state.ball.position - car.physics.position
-            dist = np.linalg.norm(pos_diff)
+            dist = features.dist_to_ball[i]
 
             if dist < 1e-6:
                 rewards[agent] = 0.0
             else:
-                pitch = car.physics.euler_angles[0]
-                yaw = car.physics.euler_angles[1]
+                pitch = features.pitch[i]
+                yaw = features.yaw[i]
 
                 forward = np.array([
                     np.cos(yaw) * np.cos(pitch),
@@ -1560,36 +1584,12 @@ class GoalReward(RewardFunction[AgentID, GameState, float]):
 # CONSTRUCTION DE L'ENVIRONNEMENT
 # ============================================================================
 
-def build_rlgym_v2_env():
-    """Build PRO RLGym environment with ALL advanced mechanics"""
-    from rlgym.api import RLGym
-    from rlgym.rocket_league.action_parsers import LookupTableAction, RepeatAction
-    from rlgym.rocket_league.done_conditions import GoalCondition, NoTouchTimeoutCondition, TimeoutCondition, AnyCondition
-    from rlgym.rocket_league.obs_builders import DefaultObs
+def build_combined_reward():
+    """Stack de rewards pro, une classe par mécanique (référence du moteur vectorisé batched_rewards.py)"""
     from rlgym.rocket_league.reward_functions import CombinedReward
-    from rlgym.rocket_league.sim import RocketSimEngine
-    from rlgym.rocket_league.state_mutators import MutatorSequence, FixedTeamSizeMutator, KickoffMutator
-    from rlgym_ppo.util import RLGymV2GymWrapper
-
-    # 2v2 configuration
-    spawn_opponents = True
-    team_size = 2
-    blue_team_size = team_size
-    orange_team_size = team_size if spawn_opponents else 0
-
-    action_repeat = 4
-    no_touch_timeout_seconds = 20
-    game_timeout_seconds = 180
-
-    action_parser = RepeatAction(LookupTableAction(), repeats=action_repeat)
-    termination_condition = GoalCondition()
-    truncation_condition = AnyCondition(
-        NoTouchTimeoutCondition(timeout_seconds=no_touch_timeout_seconds),
-        TimeoutCondition(timeout_seconds=game_timeout_seconds)
-    )
 
     # SYSTÈME DE REWARDS ULTRA-COMPLET POUR SSL+++ (STYLE PRO)
-    reward_fn = CombinedReward(
+    return CombinedReward(
         # BASES FONDAMENTALES
         (VelocityPlayerToBallReward(), 0.2),
         (FaceBallReward(), 0.3),
@@ -1647,6 +1647,92 @@ def build_rlgym_v2_env():
         (GoalReward(), 30.0),
     )
 
+
+def encode_state(agents: List[AgentID], state: GameState) -> np.ndarray:
+    """
+    Ligne float32 d'un GameState pour l'enregistreur (recorder.py) : tick_count, goal_scored, position, vitesse et
+    vitesse angulaire de la balle, boost_pad_timers, puis la physique empaquetée (pack_cars) de chaque agent
+    """
+    ball = state.ball
+    return np.concatenate((
+        [state.tick_count, state.goal_scored],
+        ball.position, ball.linear_velocity, ball.angular_velocity,
+        state.boost_pad_timers,
+        pack_cars(agents, state).ravel(),
+    )).astype(np.float32)
+
+
+class RecordingActionParser(ActionParser):
+    """Enregistre chaque step (encode_state + actions parsées de tous les agents) avant de le passer à l'env"""
+
+    def __init__(self, parser: ActionParser, recorder):
+        super().__init__()
+        self.parser = parser
+        self.recorder = recorder
+
+    def get_action_space(self, agent: AgentID):
+        return self.parser.get_action_space(agent)
+
+    def reset(self, agents: List[AgentID], initial_state: GameState, shared_info: Dict[str, Any]) -> None:
+        self.parser.reset(agents, initial_state, shared_info)
+
+    def parse_actions(self, actions: Dict[AgentID, np.ndarray], state: GameState,
+                      shared_info: Dict[str, Any]) -> Dict[AgentID, np.ndarray]:
+        parsed = self.parser.parse_actions(actions, state, shared_info)
+        agents = list(parsed)
+        self.recorder.append(encode_state(agents, state), [np.asarray(parsed[agent]).reshape(-1, 8)[0]
+                                                           for agent in agents])
+        return parsed
+
+
+def build_rlgym_v2_env(batched_rewards=False, record_dir=None):
+    """
+    Build PRO RLGym environment with ALL advanced mechanics
+
+    Avec record_dir (ou la variable d'environnement ZENITOBOT_RECORD_DIR), chaque env enregistre ses steps dans
+    record_dir/env-<pid> (voir recorder.py).
+    """
+    from rlgym.api import RLGym
+    from rlgym.rocket_league.action_parsers import LookupTableAction, RepeatAction
+    from rlgym.rocket_league.done_conditions import GoalCondition, NoTouchTimeoutCondition, TimeoutCondition, AnyCondition
+    from rlgym.rocket_league.obs_builders import DefaultObs
+    from rlgym.rocket_league.sim import RocketSimEngine
+    from rlgym.rocket_league.state_mutators import MutatorSequence, FixedTeamSizeMutator, KickoffMutator
+    from rlgym_ppo.util import RLGymV2GymWrapper
+
+    # 2v2 configuration
+    spawn_opponents = True
+    team_size = 2
+    blue_team_size = team_size
+    orange_team_size = team_size if spawn_opponents else 0
+
+    action_repeat = 4
+    no_touch_timeout_seconds = 20
+    game_timeout_seconds = 180
+
+    action_parser = LookupTableAction()
+    record_dir = record_dir or os.environ.get('ZENITOBOT_RECORD_DIR')
+    if record_dir:
+        import atexit
+        from recorder import RolloutRecorder, PRO_ENCODE_STATE
+        recorder = RolloutRecorder(os.path.join(record_dir, f"env-{os.getpid()}"), PRO_ENCODE_STATE)
+        atexit.register(recorder.close)
+        action_parser = RecordingActionParser(action_parser, recorder)  # Avant la répétition, une action par step
+    action_parser = RepeatAction(action_parser, repeats=action_repeat)
+    termination_condition = GoalCondition()
+    truncation_condition = AnyCondition(
+        NoTouchTimeoutCondition(timeout_seconds=no_touch_timeout_seconds),
+        TimeoutCondition(timeout_seconds=game_timeout_seconds)
+    )
+
+    # REWARDS - build_combined_reward() par défaut, le moteur vectorisé (batched_rewards=True) donne le même
+    # résultat, sans gain fiable à 2-6 voitures (voir le benchmark de batched_rewards.py)
+    if batched_rewards:
+        from batched_rewards import BatchedProReward
+        reward_fn = BatchedProReward()
+    else:
+        reward_fn = build_combined_reward()
+
     obs_builder = DefaultObs(
         zero_padding=None,
         pos_coef=np.asarray([1 / common_values.SIDE_WALL_X,
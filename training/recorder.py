@@ -0,0 +1,183 @@
+"""
+Streaming recorder for the game states and actions of rollout workers.
+
+Every step is one fixed-width float32 row: the encoded game state followed by the actions of all players. Rows are
+appended to memory-mapped .npy shards of shard_rows rows each, and index.json lists the shards with how many rows
+they hold and where the actions start, along with the layout of the encoded states. A new shard is started when one is full or when the row width changes (other
+number of players). The index is rewritten every flush_interval rows, so a recording stays readable if the worker is
+killed, minus the rows since the last flush.
+
+Offline, load_recording memory-maps the shards back without reading them into RAM.
+
+Only depends on numpy so both the rlgym v1 worker (training/worker.py) and the v2 env (pro_training.py) can use it,
+each with its own state encoding: the layout (ENCODE_GAMESTATE or PRO_ENCODE_STATE) tells them apart, since both are
+plain float rows.
+"""
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = "index.json"
+ENCODE_GAMESTATE = "encode_gamestate"  # rocket_learn's encode_gamestate, rlgym v1 (training/parser.py)
+PRO_ENCODE_STATE = "pro_encode_state"  # encode_state of pro_training.py, rlgym v2
+
+
+class RolloutRecorder:
+    def __init__(self, directory, layout, shard_rows=1 << 16, flush_interval=1024, dtype=np.float32):
+        self.directory = directory
+        self.layout = layout
+        self.shard_rows = shard_rows
+        self.flush_interval = flush_interval
+        self.dtype = np.dtype(dtype)
+        self.shards = []
+        self._shard = None
+        self._rows = 0
+        self._unflushed = 0
+        self.n_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):  # Continue an existing recording in new shards
+            with open(index_path) as f:
+                index = json.load(f)
+            if index["dtype"] != self.dtype.name:
+                raise ValueError(f"{directory} holds a {index['dtype']} recording, not {self.dtype.name}")
+            if index.get("layout") != layout:
+                raise ValueError(f"{directory} holds {index.get('layout')} states, not {layout}")
+            self.shards = index["shards"]
+            self.n_rows = sum(shard["rows"] for shard in self.shards)
+
+    def _new_shard(self, state_columns, columns):
+        self._close_shard()
+        name = f"shard_{len(self.shards):05d}.npy"
+        self._shard = np.lib.format.open_memmap(os.path.join(self.directory, name), mode="w+", dtype=self.dtype,
+                                                shape=(self.shard_rows, columns))
+        self._rows = 0
+        self.shards.append({"file": name, "rows": 0, "columns": columns, "state_columns": state_columns})
+
+    def _close_shard(self):
+        if self._shard is not None:
+            self.flush()
+            self._shard = None
+
+    def append(self, state, actions):
+        """Records one step, state being the encoded game state and actions those of every player"""
+        state = np.asarray(state).ravel()
+        actions = np.asarray(actions).ravel()
+        columns = len(state) + len(actions)
+        if self._shard is None or self._rows == self.shard_rows or self._shard.shape[1] != columns \
+                or self.shards[-1]["state_columns"] != len(state):
+            self._new_shard(len(state), columns)
+
+        row = self._shard[self._rows]
+        row[:len(state)] = state
+        row[len(state):] = actions
+        self._rows += 1
+        self.n_rows += 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._shard is None:
+            return
+        self._shard.flush()
+        self.shards[-1]["rows"] = self._rows
+        self._unflushed = 0
+
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        with open(index_path + ".tmp", "w") as f:
+            json.dump({"dtype": self.dtype.name, "layout": self.layout, "shards": self.shards}, f, indent=1)
+        os.replace(index_path + ".tmp", index_path)
+
+    def close(self):
+        self._close_shard()
+
+
+def recording_layout(directory):
+    """Layout of the encoded states of the recording in directory, None for recordings that predate it"""
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        return json.load(f).get("layout")
+
+
+def load_recording(directory, layout=None):
+    """
+    Returns a (states, actions) pair of read-only memory-mapped arrays per shard of the recording in directory.
+    With layout, raises a ValueError if the states were recorded with another encoding.
+    """
+    with open(os.path.join(directory, INDEX_FILE)) as f:
+        index = json.load(f)
+    if layout is not None and index.get("layout") != layout:
+        raise ValueError(f"{directory} holds {index.get('layout')} states, expected {layout}")
+    recording = []
+    for shard in index["shards"]:
+        if shard["rows"] == 0:
+            continue
+        rows = np.load(os.path.join(directory, shard["file"]), mmap_mode="r")[:shard["rows"]]
+        recording.append((rows[:, :shard["state_columns"]], rows[:, shard["state_columns"]:]))
+    return recording
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+    import time
+
+    if len(sys.argv) > 1:  # Summary of a recording
+        print(f"{recording_layout(sys.argv[1])} states")
+        recording = load_recording(sys.argv[1])
+        for states, actions in recording:
+            print(f"{len(states)} steps, {states.shape[1]} state columns, {actions.shape[1]} action columns")
+        print(f"{sum(len(states) for states, _ in recording)} steps in {len(recording)} shards")
+        sys.exit()
+
+    # Round trip with rotations on both full shards and a change of row width
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = RolloutRecorder(directory, ENCODE_GAMESTATE, shard_rows=1000, flush_interval=100)
+        expected = []
+        for n_players, n_steps in ((6, 2500), (4, 700)):
+            for _ in range(n_steps):
+                state, actions = rng.normal(size=9 + 34 + 39 * n_players), rng.normal(size=(n_players, 8))
+                recorder.append(state, actions)
+                expected.append((state, actions))
+        assert recorder.n_rows == len(expected)
+        reader = load_recording(directory)  # Only what has been flushed so far
+        assert sum(len(states) for states, _ in reader) == len(expected) // 100 * 100
+        recorder.close()
+
+        recording = load_recording(directory)
+        assert [len(states) for states, _ in recording] == [1000, 1000, 500, 700]
+        states = [row for shard, _ in recording for row in shard]
+        actions = [row for _, shard in recording for row in shard]
+        for (state, action), recorded_state, recorded_action in zip(expected, states, actions):
+            np.testing.assert_array_equal(recorded_state, state.astype(np.float32))
+            np.testing.assert_array_equal(recorded_action, action.ravel().astype(np.float32))
+        print(f"Recorded and memory-mapped back {len(expected)} steps in {len(recording)} shards")
+
+        # Appending to an existing recording
+        recorder = RolloutRecorder(directory, ENCODE_GAMESTATE, shard_rows=1000)
+        recorder.append(expected[0][0], expected[0][1])
+        recorder.close()
+        assert len(load_recording(directory, ENCODE_GAMESTATE)) == 5 and recorder.n_rows == len(expected) + 1
+
+        # The layout keeps v1 and v2 recordings apart
+        for check in (lambda: load_recording(directory, PRO_ENCODE_STATE),
+                      lambda: RolloutRecorder(directory, PRO_ENCODE_STATE)):
+            try:
+                check()
+            except ValueError as e:
+                print(f"Layout mismatch: {e}")
+            else:
+                raise AssertionError("A recording was read or continued with the wrong layout")
+
+        # Overhead per step for a 6 player state
+        recorder = RolloutRecorder(os.path.join(directory, "bench"), ENCODE_GAMESTATE)
+        state, actions = rng.normal(size=9 + 34 + 39 * 6), rng.normal(size=(6, 8))
+        n = 20_000
+        start = time.perf_counter()
+        for _ in range(n):
+            recorder.append(state, actions)
+        recorder.close()
+        print(f"append: {1e6 * (time.perf_counter() - start) / n:.1f} us/step")
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import njit
 from numpy import exp
 from numpy.linalg import norm
 from rlgym.utils import RewardFunction
@@ -7,7 +8,15 @@ from rlgym.utils.common_values import CEILING_Z, BALL_MAX_SPEED, CAR_MAX_SPEED,
 from rlgym.utils.gamestates import GameState, PlayerData
 from rlgym.utils.math import cosine_similarity
 
-from rocket_learn.utils.scoreboard import win_prob
+from training import arena
+from training.win_prob_table import WinProbTable, default_table
+
+# Packed player layout used by the compiled path
+POS = slice(0, 3)
+QUAT = slice(3, 7)
+ANG_VEL = slice(7, 10)
+BOOST, BALL_TOUCHED, HAS_FLIP, ON_GROUND, IS_DEMOED, MATCH_DEMOLISHES, IS_ORANGE = range(10, 17)
+PLAYER_LENGTH = 17
 
 
 class ZenitobotRewardFunction(RewardFunction):
@@ -32,7 +41,9 @@ class ZenitobotRewardFunction(RewardFunction):
             touch_height_w=3,
             touch_accel_w=0.5,
             flip_reset_w=10,
-            opponent_punish_w=1
+            opponent_punish_w=1,
+            use_numba=True,
+            win_prob_table: WinProbTable = None
     ):
         self.team_spirit = team_spirit
         self.current_state = None
@@ -54,34 +65,56 @@ class ZenitobotRewardFunction(RewardFunction):
         self.touch_accel_w = touch_accel_w
         self.flip_reset_w = flip_reset_w
         self.opponent_punish_w = opponent_punish_w
+        self.use_numba = use_numba  # False falls back to the pure Python loops below
+        self.win_prob_table = win_prob_table if win_prob_table is not None else default_table()
         self.state_quality = None
         self.player_qualities = None
         self.rewards = None
+        self.current_players = None
+        self.last_players = None
 
-    def _state_qualities(self, state: GameState):
+    @staticmethod
+    def _pack_players(state: GameState):
+        players = np.zeros((len(state.players), PLAYER_LENGTH))
+        for i, player in enumerate(state.players):
+            car_data = player.car_data
+            players[i, POS] = car_data.position
+            players[i, QUAT] = car_data.quaternion
+            players[i, ANG_VEL] = car_data.angular_velocity
+            players[i, BOOST] = player.boost_amount
+            players[i, BALL_TOUCHED] = player.ball_touched
+            players[i, HAS_FLIP] = player.has_flip
+            players[i, ON_GROUND] = player.on_ground
+            players[i, IS_DEMOED] = player.is_demoed
+            players[i, MATCH_DEMOLISHES] = player.match_demolishes
+            players[i, IS_ORANGE] = player.team_num == ORANGE_TEAM
+        return players
+
+    def _state_qualities(self, state: GameState, players: np.ndarray = None):
         ball_pos = state.ball.position
 
         state_quality = 0.5 * self.goal_dist_w * (exp(-norm(self.ORANGE_GOAL - ball_pos) / CAR_MAX_SPEED)
                                                   - exp(-norm(self.BLUE_GOAL - ball_pos) / CAR_MAX_SPEED))
-        player_qualities = np.zeros(len(state.players))
-        for i, player in enumerate(state.players):
-            pos = player.car_data.position
+        if players is not None:
+            player_qualities = _player_qualities(players, np.asarray(ball_pos, dtype=np.float64),
+                                                 self.dist_w, self.align_w)
+        else:
+            player_qualities = np.zeros(len(state.players))
+            for i, player in enumerate(state.players):
+                pos = player.car_data.position
 
-            # Align player->ball and player->net vectors
-            alignment = 0.5 * (cosine_similarity(ball_pos - pos, ORANGE_GOAL_BACK - pos)
-                               - cosine_similarity(ball_pos - pos, BLUE_GOAL_BACK - pos))
-            if player.team_num == ORANGE_TEAM:
-                alignment *= -1
-            liu_dist = exp(-norm(ball_pos - pos) / 1410)  # Max driving speed
-            player_qualities[i] = (self.dist_w * liu_dist + self.align_w * alignment)
+                # Align player->ball and player->net vectors
+                alignment = 0.5 * (cosine_similarity(ball_pos - pos, ORANGE_GOAL_BACK - pos)
+                                   - cosine_similarity(ball_pos - pos, BLUE_GOAL_BACK - pos))
+                if player.team_num == ORANGE_TEAM:
+                    alignment *= -1
+                liu_dist = exp(-norm(ball_pos - pos) / 1410)  # Max driving speed
+                player_qualities[i] = (self.dist_w * liu_dist + self.align_w * alignment)
 
-            # TODO use only dist of closest player for entire team?
+                # TODO use only dist of closest player for entire team?
 
         blue, orange, ticks_left = state.inverted_ball.angular_velocity
         diff = blue - orange
-        prob = win_prob(len(state.players) // 2,
-                        [ticks_left / 120],
-                        np.clip([diff], -5, 5))[0]
         if np.isinf(ticks_left):  # Goal scored at 0 seconds / in overtime
             if diff > 0:
                 prob = 1
@@ -89,6 +122,8 @@ class ZenitobotRewardFunction(RewardFunction):
                 prob = 0
             else:
                 prob = 0.5
+        else:
+            prob = self.win_prob_table(len(state.players) // 2, ticks_left / 120, diff)
         state_quality += self.win_prob_w * prob
 
         # Half state quality because it is applied to both teams, thus doubling it in the reward distributing
@@ -100,47 +135,12 @@ class ZenitobotRewardFunction(RewardFunction):
 
     @staticmethod
     def dist_to_closest_wall(x, y):
-        dist_side_wall = abs(4096 - abs(x))
-        dist_back_wall = abs(5120 - abs(y))
-
-        # From https://stackoverflow.com/questions/849211/shortest-distance-between-a-point-and-a-line-segment
-        x1, y1, x2, y2 = 4096 - 1152, 5120, 4096, 5120 - 1152  # Line segment for corner
-        A = abs(x) - x1
-        B = abs(y) - y1
-        C = x2 - x1
-        D = y2 - y1
-
-        dot = A * C + B * D
-        len_sq = C * C + D * D
-        param = -1
-        if len_sq != 0:  # in case of 0 length line
-            param = dot / len_sq
-
-        if param < 0:
-            xx = x1
-            yy = y1
-        elif param > 1:
-            xx = x2
-            yy = y2
-        else:
-            xx = x1 + param * C
-            yy = y1 + param * D
-
-        dx = abs(x) - xx
-        dy = abs(y) - yy
-        dist_corner_wall = np.sqrt(dx * dx + dy * dy)
-
-        return min(dist_side_wall, dist_back_wall, dist_corner_wall)
+        return float(arena.dist_to_closest_wall(np.array([x, y])))
 
-    def pre_step(self, state: GameState):
-        # Calculate rewards, positive for blue, negative for orange
-        if state != self.current_state:
-            self.last_state = self.current_state
-            self.current_state = state
-            self.n = 0
-        state_quality, player_qualities = self._state_qualities(state)
-        player_rewards = np.zeros_like(player_qualities)
+    def _player_rewards(self, state: GameState):
+        player_rewards = np.zeros(len(state.players))
         ball_height = state.ball.position[2]
+        wall_dists = arena.dist_to_closest_wall(np.stack([p.car_data.position for p in state.players]))
 
         for i, player in enumerate(state.players):
             last = self.last_state.players[i]
@@ -159,7 +159,7 @@ class ZenitobotRewardFunction(RewardFunction):
                 h1 = self._height_activation(CEILING_Z)
                 hx = self._height_activation(avg_height)
                 height_factor = ((hx - h0) / (h1 - h0)) ** 2
-                wall_dist_factor = 1 - np.exp(-self.dist_to_closest_wall(*player.car_data.position[:2]) / CAR_MAX_SPEED)
+                wall_dist_factor = 1 - np.exp(-wall_dists[i] / CAR_MAX_SPEED)
                 player_rewards[i] += self.touch_height_w * height_factor * (1 + wall_dist_factor)
                 if player.has_flip and not last.has_flip \
                         and player.car_data.position[2] > 3 * BALL_RADIUS \
@@ -194,6 +194,34 @@ class ZenitobotRewardFunction(RewardFunction):
             if player.match_demolishes > last.match_demolishes:
                 player_rewards[i] += self.demo_w / 2
 
+        return player_rewards
+
+    def pre_step(self, state: GameState):
+        # Calculate rewards, positive for blue, negative for orange
+        if state != self.current_state:
+            self.last_state = self.current_state
+            self.current_state = state
+            self.last_players = self.current_players
+            self.current_players = self._pack_players(state) if self.use_numba else None
+            self.n = 0
+        state_quality, player_qualities = self._state_qualities(state, self.current_players)
+        if self.use_numba:
+            players = self.current_players
+            if players[:, BALL_TOUCHED].any():
+                wall_dists = arena.dist_to_closest_wall(players[:, POS])
+            else:
+                wall_dists = np.zeros(len(players))
+            player_rewards = _player_rewards(
+                players, self.last_players, wall_dists,
+                np.asarray(state.ball.position, dtype=np.float64),
+                np.asarray(self.current_state.ball.linear_velocity - self.last_state.ball.linear_velocity,
+                           dtype=np.float64),
+                self.touch_height_w, self.flip_reset_w, self.touch_accel_w, self.boost_gain_w,
+                self.boost_lose_w, self.ang_vel_w, self.touch_grass_w, self.demo_w
+            )
+        else:
+            player_rewards = self._player_rewards(state)
+
         mid = len(player_rewards) // 2
 
         player_rewards += player_qualities - self.player_qualities
@@ -245,6 +273,7 @@ class ZenitobotRewardFunction(RewardFunction):
                                 - self.opponent_punish_w * bm)
 
         self.last_state = state
+        self.last_players = self.current_players
         self.rewards = player_rewards
 
     def reset(self, initial_state: GameState):
@@ -252,9 +281,168 @@ class ZenitobotRewardFunction(RewardFunction):
         self.last_state = None
         self.rewards = None
         self.current_state = initial_state
-        self.state_quality, self.player_qualities = self._state_qualities(initial_state)
+        self.last_players = None
+        self.current_players = self._pack_players(initial_state) if self.use_numba else None
+        self.state_quality, self.player_qualities = self._state_qualities(initial_state, self.current_players)
 
     def get_reward(self, player: PlayerData, state: GameState, previous_action: np.ndarray) -> float:
         rew = self.rewards[self.n]
         self.n += 1
         return float(rew)  # / 3.2  # Divide to get std of expected reward to ~1 at start, helps value net a little
+
+
+_height_activation = njit(ZenitobotRewardFunction._height_activation)
+
+_ORANGE_GOAL_BACK = np.array(ORANGE_GOAL_BACK, dtype=np.float64)
+_BLUE_GOAL_BACK = np.array(BLUE_GOAL_BACK, dtype=np.float64)
+
+
+# Explicit 3-vector math, numba's np.dot / np.linalg.norm would pull in scipy for BLAS
+@njit
+def _dot3(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+@njit
+def _norm3(v):
+    return np.sqrt(_dot3(v, v))
+
+
+@njit
+def _cosine_similarity(a, b):
+    return _dot3(a / _norm3(a), b / _norm3(b))
+
+
+@njit
+def _up(quat):
+    # Third column of rlgym's quat_to_rot_mtx
+    w, x, y, z = -quat[0], -quat[1], -quat[2], -quat[3]
+    up = np.zeros(3)
+    norm_sq = quat[0] * quat[0] + quat[1] * quat[1] + quat[2] * quat[2] + quat[3] * quat[3]
+    if norm_sq != 0:
+        s = 1.0 / norm_sq
+        up[0] = 2.0 * s * (x * z + y * w)
+        up[1] = 2.0 * s * (y * z - x * w)
+        up[2] = 1.0 - 2.0 * s * (x * x + y * y)
+    return up
+
+
+@njit
+def _player_qualities(players, ball_pos, dist_w, align_w):
+    player_qualities = np.zeros(players.shape[0])
+    for i in range(players.shape[0]):
+        pos = players[i, POS]
+        to_ball = ball_pos - pos
+
+        # Align player->ball and player->net vectors
+        alignment = 0.5 * (_cosine_similarity(to_ball, _ORANGE_GOAL_BACK - pos)
+                           - _cosine_similarity(to_ball, _BLUE_GOAL_BACK - pos))
+        if players[i, IS_ORANGE]:
+            alignment *= -1
+        liu_dist = np.exp(-_norm3(to_ball) / 1410)  # Max driving speed
+        player_qualities[i] = dist_w * liu_dist + align_w * alignment
+    return player_qualities
+
+
+@njit
+def _player_rewards(players, last_players, wall_dists, ball_pos, ball_vel_diff, touch_height_w, flip_reset_w,
+                    touch_accel_w, boost_gain_w, boost_lose_w, ang_vel_w, touch_grass_w, demo_w):
+    """Same per-player rewards as ZenitobotRewardFunction._player_rewards, on packed player arrays"""
+    player_rewards = np.zeros(players.shape[0])
+    ball_height = ball_pos[2]
+    h0 = _height_activation(0)
+    h1 = _height_activation(CEILING_Z)
+    ball_accel = _norm3(ball_vel_diff) / CAR_MAX_SPEED
+
+    for i in range(players.shape[0]):
+        player = players[i]
+        last = last_players[i]
+        car_height = player[2]
+
+        if player[BALL_TOUCHED]:
+            avg_height = 0.5 * (car_height + ball_height)
+            hx = _height_activation(avg_height)
+            height_factor = ((hx - h0) / (h1 - h0)) ** 2
+            wall_dist_factor = 1 - np.exp(-wall_dists[i] / CAR_MAX_SPEED)
+            player_rewards[i] += touch_height_w * height_factor * (1 + wall_dist_factor)
+            if player[HAS_FLIP] and not last[HAS_FLIP] and car_height > 3 * BALL_RADIUS:
+                to_ball = ball_pos - player[POS]
+                if _norm3(to_ball) < 2 * BALL_RADIUS \
+                        and _cosine_similarity(to_ball, -_up(player[QUAT])) > 0.9:
+                    player_rewards[i] += flip_reset_w
+
+            player_rewards[i] += touch_accel_w * (1 - height_factor) * ball_accel
+
+        boost_diff = (np.sqrt(min(max(player[BOOST], 0.), 1.))
+                      - np.sqrt(min(max(last[BOOST], 0.), 1.)))
+        if boost_diff >= 0:
+            player_rewards[i] += boost_gain_w * boost_diff
+        elif car_height < GOAL_HEIGHT:
+            player_rewards[i] += boost_lose_w * boost_diff * (1 - car_height / GOAL_HEIGHT)
+
+        player_rewards[i] += _norm3(player[ANG_VEL]) / CAR_MAX_ANG_VEL * ang_vel_w
+
+        if player[ON_GROUND] and car_height < BALL_RADIUS:
+            player_rewards[i] -= touch_grass_w
+
+        if player[IS_DEMOED] and not last[IS_DEMOED]:
+            player_rewards[i] -= demo_w / 2
+        if player[MATCH_DEMOLISHES] > last[MATCH_DEMOLISHES]:
+            player_rewards[i] += demo_w / 2
+
+    return player_rewards
+
+
+if __name__ == '__main__':
+    import timeit
+    from rlgym.utils.math import quat_to_rot_mtx
+
+    rng = np.random.default_rng(0)
+
+    def random_state(scores, ticks_left):
+        # Encoded like rlgym's GameState.decode: 3 header values, 34 pads, ball, inverted ball, 4 players
+        ball_pos = rng.uniform([-4000, -5000, 93], [4000, 5000, 1900])
+        ball = np.concatenate([ball_pos, rng.normal(0, 1500, 3), rng.normal(0, 3, 3)])
+        inverted_ball = np.concatenate([ball_pos * [-1, -1, 1], ball[3:6] * [-1, -1, 1], [*scores, ticks_left]])
+        floats = [0, *scores, *(rng.random(34) < 0.5), *ball, *inverted_ball]
+        for car_id in range(4):
+            quat = rng.normal(size=4)
+            quat /= np.linalg.norm(quat)
+            if rng.random() < 0.3:  # Sitting on the ball, roof first, to trigger flip resets
+                pos = ball_pos + 120 * quat_to_rot_mtx(quat)[:, 2]
+            else:
+                pos = rng.uniform([-4096, -5120, 17], [4096, 5120, 2044])
+            car = [*pos, *quat, *rng.normal(0, 1200, 3), *rng.normal(0, 3, 3)]
+            tertiary = [0, 0, 0, rng.integers(0, 2), 0, rng.random() < 0.05, rng.random() < 0.5,
+                        rng.random() < 0.4, 1, rng.random() < 0.5, rng.uniform(-0.1, 1.1)]
+            floats += [car_id + 1, car_id // 2, *car, *car, *tertiary]
+        return GameState([float(f) for f in floats])
+
+    def random_episode(n_steps):
+        scores = [0, 0]
+        states = []
+        for step in range(n_steps):
+            if rng.random() < 0.02:
+                scores[rng.integers(0, 2)] += 1
+            ticks_left = np.inf if rng.random() < 0.01 else rng.uniform(0, 300 * 120)
+            states.append(random_state(scores, ticks_left))
+        return states
+
+    compiled = ZenitobotRewardFunction()
+    python = ZenitobotRewardFunction(use_numba=False)
+    max_error = 0
+    for _ in range(20):
+        states = random_episode(300)
+        compiled.reset(states[0])
+        python.reset(states[0])
+        for state in states[1:]:
+            compiled.pre_step(state)
+            python.pre_step(state)
+            np.testing.assert_allclose(compiled.rewards, python.rewards, rtol=1e-9, atol=1e-9)
+            max_error = max(max_error, np.abs(compiled.rewards - python.rewards).max())
+    print(f"Compiled and Python paths agree (max abs error {max_error:.2e})")
+
+    for reward_fn in (python, compiled):
+        reward_fn.reset(states[0])
+        t = timeit.timeit(lambda: [reward_fn.pre_step(s) for s in states[1:]], number=5) / (5 * (len(states) - 1))
+        print(f"use_numba={reward_fn.use_numba}: {1e6 * t:.1f} us/step")
@@ -0,0 +1,133 @@
+"""
+ZENITOBOT - CACHE DE FEATURES PAR STEP
+=======================================
+Les rewards de pro_training.py recalculent toutes les mêmes quantités à
+chaque step (vitesse de la balle, distance voiture-balle, angles d'Euler,
+distance aux buts, aux murs et au plafond...). StepFeatures les calcule une
+seule fois par GameState pour tous les agents, et get_step_features() les met
+en cache dans shared_info : le premier reward du step paie le calcul, les
+suivants relisent le cache.
+"""
+
+from typing import List, Dict, Any
+
+import numpy as np
+
+from rlgym.api import AgentID
+from rlgym.rocket_league.api import GameState
+from rlgym.rocket_league import common_values
+
+import arena
+
+
+# Clé du cache dans shared_info
+STEP_FEATURES_KEY = 'step_features'
+
+# Colonnes du tableau de physique empaqueté
+POS = slice(0, 3)
+LIN_VEL = slice(3, 6)
+ANG_VEL = slice(6, 9)
+UP_Z, PITCH, YAW, BALL_TOUCHES, ON_GROUND, HAS_FLIP, IS_BOOSTING, HANDBRAKE, BOOST, IS_ORANGE = range(9, 19)
+N_CAR_FEATURES = 19
+
+GOAL_Z = 100
+
+
+def _norm(v: np.ndarray) -> np.ndarray:
+    # Plus rapide que np.linalg.norm(..., axis=-1) sur des petits tableaux
+    return np.sqrt((v * v).sum(axis=-1))
+
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return (a * b).sum(axis=-1)
+
+
+def pack_cars(agents: List[AgentID], state: GameState) -> np.ndarray:
+    """Empaquette la physique de toutes les voitures dans un tableau (n_agents, N_CAR_FEATURES)"""
+    cars = np.empty((len(agents), N_CAR_FEATURES), dtype=np.float32)
+    for i, agent in enumerate(agents):
+        car = state.cars[agent]
+        physics = car.physics
+        row = cars[i]
+        row[POS] = physics.position
+        row[LIN_VEL] = physics.linear_velocity
+        row[ANG_VEL] = physics.angular_velocity
+        row[UP_Z] = physics.up[2]
+        row[PITCH:YAW + 1] = physics.euler_angles[:2]
+        row[BALL_TOUCHES] = car.ball_touches
+        row[ON_GROUND] = car.on_ground
+        row[HAS_FLIP] = car.has_flip
+        row[IS_BOOSTING] = car.is_boosting
+        row[HANDBRAKE] = car.handbrake != 0
+        row[BOOST] = car.boost_amount
+        row[IS_ORANGE] = car.is_orange
+    return cars
+
+
+class StepFeatures:
+    """Quantités dérivées d'un GameState, calculées une fois pour tous les agents"""
+
+    def __init__(self, agents: List[AgentID], state: GameState):
+        self.state = state
+        self.tick_count = state.tick_count
+        self.agents = list(agents)
+        self.slots = {agent: i for i, agent in enumerate(self.agents)}
+
+        # Balle
+        self.ball_pos = state.ball.position
+        self.ball_vel = state.ball.linear_velocity
+        self.ball_speed = np.linalg.norm(self.ball_vel)
+        self.ball_height = self.ball_pos[2]
+
+        # Voitures
+        self.cars = cars = pack_cars(self.agents, state)
+        self.car_pos = cars[:, POS]
+        self.car_vel = cars[:, LIN_VEL]
+        self.car_height = self.car_pos[:, 2]
+        self.touches = cars[:, BALL_TOUCHES]
+        self.on_ground = cars[:, ON_GROUND] > 0
+        self.in_air = ~self.on_ground
+        self.has_flip = cars[:, HAS_FLIP] > 0
+        self.is_boosting = cars[:, IS_BOOSTING] > 0
+        self.is_orange = cars[:, IS_ORANGE] > 0
+        self.up_z = cars[:, UP_Z]
+        self.pitch = cars[:, PITCH]
+        self.yaw = cars[:, YAW]
+        self.boost = cars[:, BOOST]
+
+        self.to_ball = self.ball_pos - self.car_pos
+        self.dist_to_ball = _norm(self.to_ball)
+        self.car_speed = _norm(self.car_vel)
+        self.horizontal_speed = _norm(self.car_vel[:, :2])
+        self.ang_vel_norm = _norm(cars[:, ANG_VEL])
+
+        # Buts, du point de vue de chaque agent
+        self.goal_sign = np.where(self.is_orange, -1.0, 1.0)  # +1 si le but adverse est en +Y
+        self.own_goal = np.zeros((len(self.agents), 3))
+        self.own_goal[:, 1] = -self.goal_sign * common_values.BACK_NET_Y
+        self.own_goal[:, 2] = GOAL_Z
+        self.opp_goal = self.own_goal * [1, -1, 1]
+        self.dist_to_own_goal = _norm(self.car_pos - self.own_goal)
+        self.ball_to_opp_goal = _norm(self.ball_pos - self.opp_goal)
+        self.ball_vel_toward_opp = self.ball_vel[1] * self.goal_sign
+
+        # Géométrie de l'arène, voir arena.py. Murs latéraux et du fond séparés pour garder les marges par axe des
+        # tests (|x| > 3500, |y| > 4500...) : distances signées aux plans des murs, négatives au-delà (dans les buts)
+        self.car_side_wall_dist = arena.SIDE_WALL_X - np.abs(self.car_pos[:, 0])
+        self.car_back_wall_dist = arena.BACK_WALL_Y - np.abs(self.car_pos[:, 1])
+        self.car_ceiling_dist = arena.dist_to_ceiling(self.car_pos)
+        self.ball_side_wall_dist = arena.SIDE_WALL_X - abs(self.ball_pos[0])
+        self.ball_back_wall_dist = arena.BACK_WALL_Y - abs(self.ball_pos[1])
+        self.ball_ceiling_dist = arena.dist_to_ceiling(self.ball_pos)
+
+    def is_for(self, state: GameState) -> bool:
+        return self.state is state and self.tick_count == state.tick_count
+
+
+def get_step_features(agents: List[AgentID], state: GameState, shared_info: Dict[str, Any]) -> StepFeatures:
+    """Renvoie les features du step courant, calculées au premier appel puis relues depuis shared_info"""
+    features = shared_info.get(STEP_FEATURES_KEY)
+    if features is None or not features.is_for(state):
+        features = StepFeatures(agents, state)
+        shared_info[STEP_FEATURES_KEY] = features
+    return features
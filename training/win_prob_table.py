@@ -0,0 +1,81 @@
+"""
+Precomputed rocket_learn win probabilities.
+
+win_prob only ever sees a team size, the seconds left and a goal difference clipped to [-5, 5], so the whole domain
+fits in a small table. WinProbTable evaluates win_prob once on a regular seconds grid for every (team size, goal diff)
+and answers queries with linear interpolation over the seconds, which turns the per-step model evaluation into an
+array lookup. The table can be saved to and loaded from a .npz file.
+
+default_table() builds the table once per process on first use and shares it between every reward function, so new
+matches and workers' reward functions do not pay the build again.
+"""
+import numpy as np
+
+from rocket_learn.utils.scoreboard import win_prob
+
+MAX_GOAL_DIFF = 5
+
+_default_table = None
+
+
+class WinProbTable:
+    def __init__(self, team_sizes=(1, 2, 3), max_seconds=300., resolution=0.5, table=None):
+        self.team_sizes = tuple(team_sizes)
+        self.max_seconds = max_seconds
+        self.resolution = resolution
+        self.seconds = np.arange(0, max_seconds + resolution, resolution)
+        self.diffs = np.arange(-MAX_GOAL_DIFF, MAX_GOAL_DIFF + 1)
+        if table is None:
+            table = np.stack([self._evaluate(team_size) for team_size in self.team_sizes])
+        self.table = table  # (team size, goal diff, seconds)
+
+    def _evaluate(self, team_size):
+        seconds, diffs = np.meshgrid(self.seconds, self.diffs)
+        return np.asarray(win_prob(team_size, seconds.ravel(), diffs.ravel()), dtype=float).reshape(seconds.shape)
+
+    def __call__(self, team_size, seconds, diff):
+        """Same as win_prob(team_size, [seconds], np.clip([diff], -5, 5))[0]"""
+        if team_size not in self.team_sizes or not 0 <= seconds <= self.max_seconds:
+            return win_prob(team_size, [seconds], np.clip([diff], -MAX_GOAL_DIFF, MAX_GOAL_DIFF))[0]
+
+        diff = min(max(int(diff), -MAX_GOAL_DIFF), MAX_GOAL_DIFF)
+        row = self.table[self.team_sizes.index(team_size), diff + MAX_GOAL_DIFF]
+        x = seconds / self.resolution
+        i = min(int(x), len(row) - 2)
+        t = x - i
+        return (1 - t) * row[i] + t * row[i + 1]
+
+    def save(self, path):
+        np.savez(path, team_sizes=self.team_sizes, max_seconds=self.max_seconds, resolution=self.resolution,
+                 table=self.table)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(tuple(data["team_sizes"].tolist()), float(data["max_seconds"]), float(data["resolution"]),
+                   data["table"])
+
+
+def default_table():
+    """WinProbTable with the default grid, built on the first call and shared afterwards"""
+    global _default_table
+    if _default_table is None:
+        _default_table = WinProbTable()
+    return _default_table
+
+
+if __name__ == '__main__':
+    import timeit
+
+    start = timeit.default_timer()
+    table = default_table()
+    print(f"Table built in {1e3 * (timeit.default_timer() - start):.0f} ms, shared: {default_table() is table}")
+    rng = np.random.default_rng(0)
+    queries = [(int(rng.integers(1, 4)), float(rng.uniform(0, 300)), int(rng.integers(-7, 8))) for _ in range(10_000)]
+    error = max(abs(table(*q) - win_prob(q[0], [q[1]], np.clip([q[2]], -5, 5))[0]) for q in queries)
+    print(f"Max interpolation error: {error:.2e}")
+
+    n = len(queries)
+    t_model = timeit.timeit(lambda: [win_prob(s, [t], np.clip([d], -5, 5))[0] for s, t, d in queries], number=1) / n
+    t_table = timeit.timeit(lambda: [table(*q) for q in queries], number=1) / n
+    print(f"win_prob: {1e6 * t_model:.1f} us/call, table: {1e6 * t_table:.1f} us/call")
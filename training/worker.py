@@ -1,4 +1,5 @@
 import argparse
+import os
 import random
 import sys
 
@@ -21,12 +22,13 @@ except ImportError:
 
 from training.obs import ZenitobotObsBuilder
 from training.parser import ZenitobotAction
+from training.recorder import RolloutRecorder, ENCODE_GAMESTATE
 from training.reward import ZenitobotRewardFunction
 from training.state import ZenitobotStateSetter
 from training.terminal import ZenitobotTerminalCondition, ZenitobotHumanTerminalCondition
 
 
-def get_match(r, force_match_size, scoreboard, game_speed=100, human_match=False):
+def get_match(r, force_match_size, scoreboard, game_speed=100, human_match=False, recorder=None):
     if force_match_size is not None:
         team_size = force_match_size  # TODO
     else:
@@ -40,7 +42,7 @@ def get_match(r, force_match_size, scoreboard, game_speed=100, human_match=False
         reward_function=ZenitobotRewardFunction(),
         terminal_conditions=ZenitobotTerminalCondition(),
         obs_builder=ZenitobotObsBuilder(scoreboard, None, 6),
-        action_parser=ZenitobotAction(),  # ZenitobotActionTEST(),  # KBMAction()
+        action_parser=ZenitobotAction(recorder),  # ZenitobotActionTEST(),  # KBMAction()
         state_setter=AugmentSetter(ZenitobotStateSetter(r)),
         team_size=3,
         spawn_opponents=True,
@@ -50,7 +52,7 @@ def get_match(r, force_match_size, scoreboard, game_speed=100, human_match=False
 
 def make_worker(host, name, password, limit_threads=True, send_obs=True,
                 send_gamestates=True, force_match_size=None,
-                is_streamer=False, deterministic=False, human_match=False):
+                is_streamer=False, deterministic=False, human_match=False, record_dir=None):
     if limit_threads:
         torch.set_num_threads(1)
 
@@ -79,12 +81,17 @@ def make_worker(host, name, password, limit_threads=True, send_obs=True,
 
     scoreboard = Scoreboard()
 
+    # One recording per worker, see training/recorder.py
+    recorder = None if record_dir is None else RolloutRecorder(os.path.join(record_dir, f"{name}-{os.getpid()}"),
+                                                             ENCODE_GAMESTATE)
+
     # replay_arrays = _unserialize(r.get("replay-arrays"))
     worker = RedisRolloutWorker(r, name,
                                 match=get_match(r, force_match_size,
                                                 scoreboard=scoreboard,
                                                 game_speed=game_speed,
-                                                human_match=human_match),
+                                                human_match=human_match,
+                                                recorder=recorder),
                                 dynamic_gm=dynamic_gm,
                                 past_version_prob=past_prob,
                                 evaluation_prob=eval_prob,
@@ -95,6 +102,7 @@ def make_worker(host, name, password, limit_threads=True, send_obs=True,
                                 human_agent=human,
                                 scoreboard=scoreboard)
     worker.env._match._obs_builder.env = worker.env  # noqa hack for infinite boost
+    worker.recorder = recorder
     return worker
 
 
@@ -119,6 +127,8 @@ def main():
                         help='Force a 1s, 2s, or 3s game')
     parser.add_argument('--human_match', action='store_true',
                         help='Play a human match against Zenitobot')
+    parser.add_argument('--record', type=str, metavar='directory',
+                        help='Also record the game states and actions to memory-mapped files in directory')
 
     args = parser.parse_args()
 
@@ -130,6 +140,7 @@ def main():
     deterministic = args.deterministic
     force_match_size = args.force_match_size
     human_match = args.human_match
+    record_dir = args.record
 
     if force_match_size is not None and (force_match_size < 1 or force_match_size > 3):
         parser.error("Match size must be between 1 and 3")
@@ -143,13 +154,16 @@ def main():
                          force_match_size=force_match_size,
                          is_streamer=stream_state,
                          deterministic=deterministic,
-                         human_match=human_match)
+                         human_match=human_match,
+                         record_dir=record_dir)
 
     try:
         worker.run()
     finally:
         print("Problem Detected. Killing Worker...")
         worker.env.close()
+        if worker.recorder is not None:
+            worker.recorder.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,54 @@
+"""
+Boost pad and demolition timers, shared by the training obs builder (training/obs.py) and the bot's
+(Zenitobot/Zenitobot_obs.py) so both run the same kernel. It sits in the repository root so that neither package
+imports the other.
+
+An unavailable pad counts down from 10 s (big) or 4 s (small) and a demolished car from 3 s, in steps of the elapsed
+time between observations, and both are 0 otherwise. step_timers advances the timers by one observation in place, in
+O(pads + players); update_timers runs it over a batch of states. Both are compiled with numba when it is installed,
+which training requires and the bot does not.
+"""
+try:
+    from numba import njit
+except ImportError:
+    def njit(f):
+        return f
+
+BIG_BOOST_RESPAWN = 10
+SMALL_BOOST_RESPAWN = 4
+DEMO_RESPAWN = 3
+
+
+@njit
+def step_timers(boost_timers, boost_states, big_boosts, demo_timers, demo_states, elapsed):
+    for b in range(boost_states.shape[0]):
+        if boost_states[b] == 0:  # Not available
+            prev_timer = boost_timers[b]
+            if prev_timer > 0:
+                boost_timers[b] = max(0, prev_timer - elapsed)
+            elif big_boosts[b]:
+                boost_timers[b] = BIG_BOOST_RESPAWN
+            else:
+                boost_timers[b] = SMALL_BOOST_RESPAWN
+        else:  # Available
+            boost_timers[b] = 0
+
+    for p in range(demo_states.shape[0]):
+        if demo_states[p] == 1:  # Demoed
+            prev_timer = demo_timers[p]
+            if prev_timer > 0:
+                demo_timers[p] = max(0, prev_timer - elapsed)
+            else:
+                demo_timers[p] = DEMO_RESPAWN
+        else:  # Not demoed
+            demo_timers[p] = 0
+
+
+@njit
+def update_timers(boost_timers, big_boosts, demo_timers, elapsed, boost_states, demo_states):
+    """Row i + 1 of the (n_states + 1, ...) timer arrays is row i advanced by state i, row 0 is the previous state"""
+    for i in range(1, boost_timers.shape[0]):
+        boost_timers[i] = boost_timers[i - 1]
+        demo_timers[i] = demo_timers[i - 1]
+        step_timers(boost_timers[i], boost_states[i - 1], big_boosts,
+                    demo_timers[i], demo_states[i - 1], elapsed)